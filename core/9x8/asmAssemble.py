@@ -0,0 +1,441 @@
+################################################################################
+#
+# Copyright 2012-2015, Sinclair R.F., Inc.
+#
+# Importable assembler for the SSBCC 9x8 processor.
+#
+# This is used directly by ssbcc and through the "asm" command-line wrapper.
+#
+################################################################################
+
+import os
+import re
+
+import asmDef
+from asmDef_9x8 import asmDef_9x8
+from asmInline import asmInline
+from asmListing import asmListing
+from asmOptimize import asmOptimize
+from asmOutline import asmOutline
+from asmWCET import asmWCET
+import asmStack
+
+def OpenFiles(filenames):
+  """
+  Open the listed assembly source files.\n
+  filenames     list of file names and/or already opened file objects
+  """
+  fps = list();
+  for filename in filenames:
+    if hasattr(filename,'readline'):
+      fps.append(filename);
+      continue;
+    try:
+      fps.append(open(filename,'r'));
+    except:
+      raise asmDef.AsmException('Error opening "%s"' % filename);
+  return fps;
+
+################################################################################
+#
+# Terminating help messages
+#
+################################################################################
+
+def HelpMacro(ad,macroName):
+  """
+  Print the usage message for the specified macro.
+  """
+  if macroName[0] != '.':
+    macroName = '.%s' % macroName
+  if macroName not in ad.macros:
+    try:
+      ad.AddUserMacro(macroName[1:])
+    except:
+      pass
+  if macroName in ad.macros:
+    if ad.macros[macroName]['doc']:
+      print '\n%s usage message:' % macroName
+      print ad.macros[macroName]['doc']
+    else:
+      print '\nNo usage message for %s\n' % macroName
+  else:
+    print 'Macro "%s" not recognized or malformed' % macroName
+
+def ListMacros(ad):
+  """
+  Print the built-in macros and the user-defined macros in the macro search
+  paths.
+  """
+  print '\nBuilt-in macros\n'
+  tmp = [name for name in ad.builtInMacros]
+  tmp.sort()
+  for name in tmp:
+    print name
+  for testName in sorted(asmDef.ModuleIndex(ad.macroSearchPaths)):
+    try:
+      ad.AddUserMacro(testName)
+    except:
+      pass
+  print '\nUser-defined macros\n'
+  tmp = [name for name in ad.macros if name not in ad.builtInMacros]
+  tmp.sort()
+  for name in tmp:
+    print name
+  print
+
+################################################################################
+#
+# Assemble the program.
+#
+################################################################################
+
+def Assemble(filenames,
+             interruptsEnabled=False,
+             constants=None,
+             defines=None,
+             parameters=None,
+             inports=None,
+             outports=None,
+             outstrobes=None,
+             memoryLengths=None,
+             stackLengths=None,
+             libraryPaths=None,
+             macroPaths=None,
+             helpMacro=None,
+             listMacros=False,
+             inline=False,
+             inlineBudget=2**13,
+             inlineThreshold=8,
+             instructionLength=2**13,
+             memoryPacking=None,
+             optimize=False,
+             outline=False,
+             fpDebug=None,
+             fpListing=None,
+             fpMeta=None,
+             fpOptimize=None,
+             fpOutline=None,
+             fpStack=None,
+             fpWCET=None,
+             wcetPaths=None):
+  """
+  Assemble the listed source files and return the memory and program images.\n
+  filenames         list of assembly source file names or file objects
+  interruptsEnabled True if the .interrupt body is required
+  constants         list of (name,value) tuples for the constants
+  defines           list of the defined "D_" symbols
+  parameters        list of the parameter and localparam names
+  inports           list of (name,index) tuples for the input ports
+  outports          list of (name,index) tuples for the output ports
+  outstrobes        list of (name,index) tuples for the strobe-only output ports
+  memoryLengths     list of (name,length) tuples for the memories and I/O signals
+  stackLengths      list of (name,length) tuples for the stacks
+  libraryPaths      search paths for ".include" directives
+  macroPaths        search paths for ".macro" directives
+  helpMacro         if not None, print the usage for this macro and return None
+  listMacros        if True, print the available macros and return None
+  inline            if True, inline the small functions and the functions
+                    called from only one place
+  inlineBudget      maximum program length after inlining, normally the size
+                    of the instruction memory
+  inlineThreshold   maximum length of the functions inlined at all of their
+                    call sites
+  instructionLength size of the instruction memory for the listing and the
+                    debug information
+  memoryPacking     optional dictionary of the HDL packing of each memory for
+                    the listing and the debug information (see
+                    asmListing.WriteMemories)
+  optimize          if True, apply the peephole optimizer to the function
+                    bodies
+  outline           if True, replace repeated sequences of instructions with
+                    calls to generated functions
+  fpDebug           optional file object for the JSON debug information
+  fpListing         optional file object for the program listing and memory
+                    map
+  fpMeta            optional file object for the metacode file
+  fpOptimize        optional file object for the peephole optimizer report
+                    (requires optimize)
+  fpOutline         optional file object for the outlining report (requires
+                    outline)
+  fpStack           optional file object for the stack depth report
+  fpWCET            optional file object for the worst-case execution time
+                    report
+  wcetPaths         list of (function,fromLabel,toLabel) tuples for the
+                    worst-case execution times between labels in the report\n
+  The return is a dictionary with the following content:
+    memories        list of memories as per asmDef_9x8.MemoryImages
+    program         program as per asmDef_9x8.ProgramImage
+    sources         list of the assembly source files read, including the
+                    ".include"d files
+    macros          list of the macro Python scripts executed
+    stacks          stack depth analysis as per asmStack.StackRequirements
+    functions       dictionary of the address and length of each function,
+                    for example, for peripherals that monitor the program
+                    counter
+  """
+  fps = OpenFiles(filenames);
+
+  # Construct the keyword parser
+  ad = asmDef_9x8(interruptsEnabled);
+
+  # Record the constants in the program symbol table.
+  for (name,value) in constants or list():
+    if ad.IsSymbol(name):
+      raise asmDef.AsmException('Command line constant "%s" already defined' % name);
+    ad.AddSymbol(name, 'constant', body=[value]);
+
+  # Record the defines.
+  for name in defines or list():
+    if not re.match('D_',name):
+      raise asmDef.AsmException('Define "%s" should start with "D_"' % name);
+    ad.AddSymbol(name, 'define');
+
+  # Record the input names and values in the appropriate record type
+  for name in parameters or list():
+    if ad.IsSymbol(name):
+      raise asmDef.AsmException('Program Bug -- repeated symbol "%s"' % name);
+    ad.RegisterParameterName(name);
+  for (name,ix) in inports or list():
+    if ad.IsSymbol(name):
+      raise Exception('Program Bug -- repeated symbol "%s"' % name);
+    if not (0 <= ix < 256):
+      raise asmDef.AsmException('Out-of-range inport index:  "%s=%d"' % (name,ix,));
+    ad.RegisterInport(name,ix);
+  for (name,ix) in outports or list():
+    if ad.IsSymbol(name):
+      raise asmDef.AsmException('Program Bug -- repeated symbol "%s"' % name);
+    if not (0 <= ix < 256):
+      raise asmDef.AsmException('Out-of-range outport index:  "%s=%d"' % (name,ix,));
+    ad.RegisterOutport(name,ix);
+  for (name,ix) in outstrobes or list():
+    if ad.IsSymbol(name):
+      raise asmDef.AsmException('Program Bug -- repeated symbol "%s"' % name);
+    if not (0 <= ix < 256):
+      raise asmDef.AsmException('Out-of-range strobe-only outport index:  "%s=%d"' % (name,ix,));
+    ad.RegisterOutstrobe(name,ix);
+  for (name,length) in memoryLengths or list():
+    if not (0 < length <= 256):
+      raise asmDef.AsmException('Out-of-range memory length:  "%s=%d"' % (name,length,));
+    ad.RegisterMemoryLength(name,length);
+  for (name,length) in stackLengths or list():
+    ad.RegisterStackLength(name,length);
+
+  # Construct the iterator that loops through the code bodies.
+  fbi = asmDef.FileBodyIterator(fps,ad);
+
+  # Add paths for the ".include" directive.
+  for path in libraryPaths or list():
+    fbi.AddSearchPath(path);
+
+  # Add paths for the ".macro" directive.
+  for path in macroPaths or list():
+    ad.AddMacroSearchPath(path);
+
+  # If asked, print the usage for the specified macro or list the available
+  # macros instead of assembling the program.
+  if helpMacro:
+    HelpMacro(ad,helpMacro);
+    return None;
+  if listMacros:
+    ListMacros(ad);
+    return None;
+
+  ################################################################################
+  #
+  # Stage 1:  Parse the files.
+  #
+  # Read the entire file, doing the following while reading the file:
+  # - Store the raw content of each line or group of lines for output to the
+  #   assembled memory initialization.
+  #   Note: A group of lines consists the comment lines preceding a directive and
+  #         the body of the directive.
+  # - Convert group of lines into an array of the raw tokens.
+  # - Check the integrity of the bodies defined by the list of raw tokens.
+  # - For each array of raw tokens, incorporate already-defined symbols and update
+  #   the assembler dictionaries.
+  #   Note: At this point the space required for the function or main program
+  #     is fully computed.
+  #
+  ################################################################################
+
+  #
+  # Loop through the directive bodies in the input files (including ".include"d
+  # files).
+  #
+
+  ifstackStack = list();
+  ifstack = None;
+  loopBounds = dict();
+  for bl in fbi:
+    filename = bl[0];
+    startLine = bl[1];
+    body = bl[2:];
+    flc_loc = filename + ' at line ' + str(startLine+len(body)-1);
+    # Start-of-file processing.
+    if startLine == 0:
+      if ifstack != None:
+        ifstackStack.append(ifstack);
+      ifstack = list();
+    # End-of-file processing.
+    elif startLine == -1:
+      if len(ifstack) != 0:
+        raise asmDef.AsmException('%d unmatched .IFDEF/.IFNDEF(s) at the end of %s' % (len(ifstack),filename,));
+      if ifstackStack:
+        ifstack = ifstackStack.pop();
+      else:
+        ifstack = None;
+    # Handle conditional compilation directives.
+    elif re.match(r'\s*\.ELSE\b',body[-1]):
+      if not re.match(r'\s*\.ELSE\s*(;.*)?$',body[-1]):
+        raise asmDef.AsmException('Malformed ".ELSE" in %s' % flc_loc);
+      if not ifstack:
+        raise asmDef.AsmException('Unmatched ".ELSE" in %s' % flc_loc);
+      ifstack[-1] ^= True;
+    elif re.match(r'\s*\.ENDIF\b',body[-1]):
+      if not re.match(r'\s*\.ENDIF\s*(;.*)?$',body[-1]):
+        raise asmDef.AsmException('Malformed ".ENDIF" in %s' % flc_loc);
+      if not ifstack:
+        raise asmDef.AsmException('Unmatched ".ENDIF" in %s' % flc_loc);
+      ifstack.pop();
+    elif re.match(r'\s*\.IFN?DEF\b',body[-1]):
+      a = re.findall(r'\s*(\.IFN?DEF)\s*(\S+)\b\s*(;.*)?$',body[-1]);
+      if not a:
+        raise asmDef.AsmException('Malformed .IFDEF or .IFNDEF in %s' % flc_loc);
+      a = a[0];
+      ifstack.append(ad.IsSymbol(a[1]));
+      if a[0] == '.IFNDEF':
+        ifstack[-1] ^= True;
+    # Ignore bodies rejected by conditional compilation.
+    elif ifstack and not ifstack[-1]:
+      pass;
+    # ".include" directives don't have an associated body
+    elif re.match(r'\s*\.include\s',body[-1]):
+      a = re.findall(r'\s*\.include\s+(\S+)(\s*|\s*;.*)$',body[-1]);
+      if not a:
+        raise asmDef.AsmException('Malformed .include directive in %s' % flc_loc);
+      a = a[0];
+      fbi.Include(a[0]);
+    # Parse the body of all other directives and ensure that only one ".main"
+    # and one ".interrupt" are defined.
+    else:
+      bodyLoopBounds = list();
+      rawTokens = asmDef.RawTokens(ad,filename,startLine,body,loopBounds=bodyLoopBounds);
+      if not rawTokens:
+        if bodyLoopBounds:
+          raise asmDef.AsmException('"@loop" annotation not in a function body at %s' % bodyLoopBounds[0]['loc']);
+        continue;
+      ad.CheckRawTokens(rawTokens);
+      ad.FillRawTokens(rawTokens);
+      # Record the loop bound annotations for the worst-case execution time
+      # analysis.
+      if bodyLoopBounds:
+        if rawTokens[0]['value'] in ('.interrupt','.main',):
+          loopBounds[rawTokens[0]['value']] = bodyLoopBounds;
+        elif rawTokens[0]['value'] == '.function':
+          loopBounds[rawTokens[1]['value']] = bodyLoopBounds;
+        else:
+          raise asmDef.AsmException('"@loop" annotation not allowed in "%s" directive at %s' % (rawTokens[0]['value'],bodyLoopBounds[0]['loc'],));
+
+  #
+  # Ensure a ".main" body was declared.
+  #
+
+  if not ad.Main():
+    raise asmDef.AsmException('Required ".main" body not provided');
+
+  #
+  # Enforce consistency between the "interruptsEnabled" argument and whether or
+  # not an ".interrupt" body was declared.
+  #
+
+  if interruptsEnabled and not ad.Interrupt():
+    raise asmDef.AsmException('Required ".interrupt" body not provided');
+  if not interruptsEnabled and ad.Interrupt():
+    raise asmDef.AsmException('".interrupt" body not allowed near %s' % ad.Interrupt()['tokens'][0]['loc']);
+
+  ################################################################################
+  #
+  # Stage 2:  Optionally inline functions, outline repeated sequences, and
+  # apply the peephole optimizer to the function bodies, identify the required
+  # functions, compute their addresses, and set the addresses for all "jump"
+  # and "call" macros.
+  #
+  ################################################################################
+
+  if inline:
+    asmInline(ad,loopBounds,inlineBudget,inlineThreshold).Inline();
+
+  if outline:
+    outliner = asmOutline(ad,loopBounds);
+    outliner.Outline();
+  elif fpOutline:
+    raise Exception('Program Bug -- outlining report requested without outlining');
+
+  if optimize:
+    optimizer = asmOptimize(ad);
+    optimizer.Optimize();
+  elif fpOptimize:
+    raise Exception('Program Bug -- optimizer report requested without the optimizer');
+
+  ad.EvaluateMemoryTree();
+  ad.EvaluateFunctionTree();
+
+  ################################################################################
+  #
+  # Stage 3:  Emit the program
+  #
+  # Do the following:
+  # - If interrupts are enabled, then set the first 4 instructions to be a "dis"
+  #   and a ".jump" instruction to the ".interrupt" function.
+  # - Write the instructions for the ".main" body.
+  # - Loop through the ".function" list in the order in which they were defined
+  #   and write their instructions.
+  # - Optionally write the metacode file.
+  #
+  ################################################################################
+
+  if fpMeta:
+    ad.EmitMemories(fpMeta);
+    ad.EmitProgram(fpMeta);
+
+  program = ad.ProgramImage();
+
+  ################################################################################
+  #
+  # Stage 4:  Analyze the program.
+  #
+  # Do the following:
+  # - Compute the maximum data stack and return stack depths and optionally
+  #   write the stack depth report.
+  # - Optionally write the worst-case execution time report.
+  # - Optionally write the peephole optimizer report.
+  # - Optionally write the outlining report.
+  # - Optionally write the program listing and memory map and the debug
+  #   information.
+  #
+  ################################################################################
+
+  stacks = asmStack.StackRequirements(ad,loopBounds,program['body']);
+  if fpStack:
+    asmStack.Report(fpStack,stacks,stackLengths);
+
+  if fpWCET:
+    asmWCET(ad,loopBounds).Report(fpWCET,wcetPaths);
+
+  if fpOptimize:
+    optimizer.Report(fpOptimize,loopBounds);
+
+  if fpOutline:
+    outliner.Report(fpOutline);
+
+  if fpListing or fpDebug:
+    listing = asmListing(ad,loopBounds,program);
+    if fpListing:
+      listing.Report(fpListing,instructionLength,memoryPacking);
+    if fpDebug:
+      listing.WriteDebugInfo(fpDebug,instructionLength,memoryPacking);
+
+  functions = dict((name,dict(address=function['address'], length=function['length']),) for (name,function,) in ad.functionEvaluation.iteritems());
+
+  return dict(memories=ad.MemoryImages(), program=program, sources=fbi.sources, macros=ad.macroFiles, stacks=stacks, functions=functions);
@@ -6,6 +6,7 @@
 #
 ################################################################################
 
+import imp
 import os
 import re
 
@@ -21,6 +22,31 @@ class AsmException(Exception):
   def __str__(self):
     return self.msg;
 
+class LineCollector:
+  """
+  File-like object that records the lines written to it.\n
+  This is used in place of the metacode file so that the Emit* methods,
+  including those in user-defined macros, build the program and memory bodies
+  in memory.  The trailing newlines are not included in the recorded lines.
+  """
+
+  def __init__(self):
+    self.lines = list();
+    self.partial = '';
+
+  def write(self,s):
+    """
+    Append the string to the recorded lines.
+    """
+    lines = (self.partial + s).split('\n');
+    self.partial = lines.pop();
+    self.lines += lines;
+
+# Classification of the source lines by FileBodyIterator:  single-line
+# directives, empty and comment lines, and the first token of other lines.
+reBodyLine = re.compile(r'\s*(?:(?P<single>\.(IFDEF|IFNDEF|ELSE|ENDIF|include)\b)|(?P<comment>;|$)|(?P<first>\S+))');
+reIncludeLine = re.compile(r'\s*\.include\b');
+
 class FileBodyIterator:
   """
   Iterator for files that returns bodies of lines of the file.\n
@@ -55,6 +81,8 @@ class FileBodyIterator:
       if fp.name in self.included:
         raise AsmException('Input file %s listed more than once' % fp.name);
       self.included.append(fp.name);
+    # Record the names of the opened files, including their search paths.
+    self.sources = list(self.included);
     self.fpStack = list();
     self.fpStack.append(dict(fp=self.fpPending.pop(0), line=0));
     self.pendingInclude = None;
@@ -80,7 +108,7 @@ class FileBodyIterator:
     self.current = self.pending;
     self.pending = list();
     # If the current body is an include directive, then process it immediately.
-    if self.current and re.match(r'\s*\.include\b',self.current[-1]):
+    if self.current and reIncludeLine.match(self.current[-1]):
       return self.current;
     # Loop until all of the files have been processed
     while self.fpStack or self.fpPending or self.pendingInclude:
@@ -111,6 +139,7 @@ class FileBodyIterator:
           fullInclude = os.path.join(path,self.pendingInclude);
           if os.path.exists(fullInclude):
             fp_pending = open('%s/%s' % (path,self.pendingInclude),'rt');
+            self.sources.append(fp_pending.name);
             break;
         else:
           raise AsmException('%s not found' % self.pendingInclude);
@@ -128,8 +157,9 @@ class FileBodyIterator:
       fp = self.fpStack[-1];
       for line in fp['fp']:
         fp['line'] += 1;
+        a = reBodyLine.match(line);
         # Handle single-line directives.
-        if re.match(r'\s*\.(IFDEF|IFNDEF|ELSE|ENDIF|include)\b',line):
+        if a.group('single'):
           if not self.pending:
             self.pending.append(fp['fp'].name);
             self.pending.append(fp['line']);
@@ -139,15 +169,14 @@ class FileBodyIterator:
             self.pending = list();
           return self.current;
         # Append empty and comment lines to the pending block.
-        if re.match(r'\s*(;|$)', line):
+        if a.group('comment') != None:
           if not self.pending:
             self.pending.append(fp['fp'].name);
             self.pending.append(fp['line']);
           self.pending.append(line);
           continue;
         # See if the line starts with a directive.
-        tokens = re.findall(r'\s*(\S+)',line);
-        if self.ad.IsDirective(tokens[0]):
+        if self.ad.IsDirective(a.group('first')):
           if not self.pending:
             self.pending.append(fp['fp'].name);
             self.pending.append(fp['line']);
@@ -185,12 +214,68 @@ class FileBodyIterator:
   def Include(self,filename):
     self.pendingInclude = filename;
 
+################################################################################
+#
+# Load the Python scripts for the user-defined macros.
+#
+################################################################################
+
+# Modules loaded by LoadModule indexed by their absolute file names.
+loadedModules = dict();
+
+def LoadModule(fullname,namespace):
+  """
+  Load the Python source file, e.g., a user-defined macro, as a module and
+  return the module.  Each file is only executed once and the module is reused
+  for subsequent loads.\n
+  fullname      name of the Python source file
+  namespace     dictionary of the names available to the file in addition to
+                the ones it defines and imports, i.e., the globals of the module
+                that used to execfile it\n
+  Note:  The module is not added to sys.modules, so macros can have the same
+         names as standard modules.
+  """
+  fullname = os.path.abspath(fullname);
+  if fullname not in loadedModules:
+    name = os.path.splitext(os.path.basename(fullname))[0];
+    module = imp.new_module(name);
+    module.__dict__.update(namespace);
+    module.__name__ = name;
+    module.__file__ = fullname;
+    with open(fullname,'r') as fp:
+      code = compile(fp.read(),fullname,'exec');
+    exec code in module.__dict__;
+    loadedModules[fullname] = module;
+  return loadedModules[fullname];
+
+def ModuleIndex(paths):
+  """
+  Return a dictionary of the Python source files in the list of directories
+  indexed by their names without the ".py" extension.  The file in the first
+  directory is used when more than one directory has a file with the same name.
+  """
+  index = dict();
+  for path in paths:
+    if not os.path.isdir(path):
+      continue;
+    for name in os.listdir(path):
+      fullname = os.path.join(path,name);
+      if name.endswith('.py') and (name[:-3] not in index) and os.path.isfile(fullname):
+        index[name[:-3]] = fullname;
+  return index;
+
 ################################################################################
 #
 # Parse strings into the desired types.
 #
 ################################################################################
 
+# Numeric values recognized by ParseNumber.
+reBinary = re.compile(r'0b[01_]+$');
+reOctal = re.compile(r'0[0-7_]+$');
+reDecimal = re.compile(r'[+\-]?[1-9_]\d*$');
+reHex = re.compile(r'0x[0-9A-Fa-f_]+$');
+
 def ParseNumber(inString):
   """
   Test for recognized integer values and return the value if recognized,
@@ -200,20 +285,20 @@ def ParseNumber(inString):
   if inString == '0':
     return 0;
   # look for a binary value
-  a = re.match(r'0b[01_]+$',inString);
+  a = reBinary.match(inString);
   if a:
     b = re.sub(r'_','',a.group(0)[2:]);
     return int(b,2);
   # look for an octal value
-  a = re.match(r'0[0-7_]+$',inString);
+  a = reOctal.match(inString);
   if a:
     return int(a.group(0)[1:],8);
   # look for decimal value
-  a = re.match(r'[+\-]?[1-9_]\d*$',inString);
+  a = reDecimal.match(inString);
   if a:
     return int(a.group(0),10);
   # look for a hex value
-  a = re.match(r'0x[0-9A-Fa-f_]+$',inString);
+  a = reHex.match(inString);
   if a:
     return int(a.group(0)[2:],16);
   # Everything else is an error
@@ -224,7 +309,9 @@ def ParseChar(inchar):
   Parse single characters including escaped characters.  Return the character
   value and the number of characters in the input string matched.
   """
-  if re.match(r'\\[0-7]{3}',inchar):
+  if inchar[0] != '\\':         # unescaped character
+    return (ord(inchar[0]),1,);
+  elif re.match(r'\\[0-7]{3}',inchar):
     return (int(inchar[1:4],8),4,);
   elif re.match(r'\\[0-7]{2}',inchar):
     return (int(inchar[1:3],8),3,);
@@ -287,6 +374,18 @@ def ParseString(inString):
   # That's all.
   return outString;
 
+# Tokens recognized by ParseToken.
+reComputed = re.compile(r'\${\S+}$');
+reMultiValue = re.compile(r'(0|0b[01_]+|0[0-7]+|[+\-]?[1-9]\d*|0x[0-9A-Fa-f]{1,2})\*([1-9]\d*|C_\w+|\$\{\S+\})$');
+reSingleValue = re.compile(r'(0|0b[01_]+|0[0-7]+|[+\-]?[1-9]\d*|0x[0-9A-Fa-f]+)$');
+reString = re.compile(r'[CNc]?"');
+reMacroStart = re.compile(r'\.[A-Za-z]');
+reMacroName = re.compile(r'\.[^(]+');
+reMacroArg = re.compile(r'[^,(]*(\([^)]*\))?');
+reLabel = re.compile(r':[A-Za-z]\w*$');
+reRange = re.compile(r'([LG]_\w+)([[]\d+\+?:\d+])$');
+reSymbol = re.compile(r'[A-Za-z]\w*$');
+
 def ParseToken(ad,fl_loc,col,raw,allowed):
   """
   Examine the raw tokens and convert them into dictionary objects consisting of
@@ -312,7 +411,7 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
       raise AsmException('instruction "%s" not allowed at %s' % (raw,flc_loc));
     return dict(type='instruction', value=raw, loc=flc_loc);
   # look for computation
-  a = re.match(r'\${\S+}$',raw);
+  a = reComputed.match(raw);
   if a:
     if 'singlevalue' not in allowed:
       raise AsmException('Computed value not allowed at %s' % flc_loc);
@@ -324,15 +423,11 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
       raise AsmException('Malformed single-byte value at %s' % flc_loc);
     return dict(type='value', value=tParseNumber, loc=flc_loc);
   # look for a repeated single-byte numeric value (N*M where M is the repeat count)
-  matchString=r'(0|0b[01_]+|0[0-7]+|[+\-]?[1-9]\d*|0x[0-9A-Fa-f]{1,2})\*([1-9]\d*|C_\w+|\$\{\S+\})$';
-  a = re.match(matchString,raw);
+  a = reMultiValue.match(raw);
   if a:
     if 'multivalue' not in allowed:
       raise AsmException('Multi-byte value not allowed at %s' % flc_loc);
-    b = re.findall(matchString,a.group(0));
-    if not b:
-      raise Exception('Program Bug -- findall failed after match worked');
-    b = b[0];
+    b = a.groups();
     try:
       tParseNumber = ParseNumber(b[0]);
     except:
@@ -344,10 +439,10 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
     elif re.match(r'C_',b[1]):
       if not ad.IsConstant(b[1]):
         raise AsmException('Unrecognized symbol "%s" at %s' % (b[1],fl_loc2,));
-      ix = ad.symbols['list'].index(b[1]);
-      if len(ad.symbols['body'][ix]) != 1:
-        raise asmDef.AsmException('constant can only be one byte at %s' % fl_loc2);
-      repeatCount = ad.symbols['body'][ix][0];
+      body = ad.symbols[b[1]]['body'];
+      if len(body) != 1:
+        raise AsmException('constant can only be one byte at %s' % fl_loc2);
+      repeatCount = body[0];
     elif re.match(r'\$',b[1]):
       repeatCount = eval(b[1][2:-1],ad.SymbolDict());
     else:
@@ -358,7 +453,7 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
       tValue.append(tParseNumber);
     return dict(type='value', value=tValue, loc=flc_loc);
   # look for a single-byte numeric value
-  a = re.match(r'(0|0b[01_]+|0[0-7]+|[+\-]?[1-9]\d*|0x[0-9A-Fa-f]+)$',raw);
+  a = reSingleValue.match(raw);
   if a:
     if 'singlevalue' not in allowed:
       raise AsmException('Value not allowed at %s' % flc_loc);
@@ -368,7 +463,7 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
       raise AsmException('Malformed single-byte value at %s' % flc_loc);
     return dict(type='value', value=tParseNumber, loc=flc_loc);
   # capture double-quoted strings
-  if re.match(r'[CNc]?"',raw):
+  if reString.match(raw):
     if 'string' not in allowed:
       raise AsmException('String not allowed at %s' % flc_loc);
     parsedString = ParseString(raw);
@@ -390,9 +485,9 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
     return dict(type='directive', value=raw, loc=flc_loc);
   # look for macros
   # Note:  Macro arguments can contain a single layer of macros.
-  a = re.match(r'\.[A-Za-z]',raw);
+  a = reMacroStart.match(raw);
   if a:
-    b = re.match(r'\.[^(]+',raw);
+    b = reMacroName.match(raw);
     if not ad.IsMacro(b.group(0)):
       raise AsmException('Unrecognized directive or macro at %s:%d' % (fl_loc,col+1,));
     if ('macro' not in allowed) and not ('singlemacro' in allowed and ad.IsSingleMacro(b.group(0))):
@@ -405,7 +500,7 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
     else:
       tcol = len(b.group(0))+1;
       while tcol < len(raw):
-        c = re.match(r'[^,(]*(\([^)]*\))?',raw[tcol:-1]);
+        c = reMacroArg.match(raw,tcol,len(raw)-1);
         macroArgs.append(c.group(0));
         tcol += len(c.group(0))+1;
     nArgs = ad.MacroNumberArgs(b.group(0))
@@ -420,22 +515,21 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
       tcol += len(macroArgs[ixArg]) + 1;
     return dict(type='macro', value=b.group(0), loc=fl_loc + ':' + str(col+1), argument=outArgs);
   # look for a label definition
-  a = re.match(r':[A-Za-z]\w*$',raw);
+  a = reLabel.match(raw);
   if a:
     if 'label' not in allowed:
       raise AsmException('Label not allowed at %s' % flc_loc);
     return dict(type='label', value=raw[1:], loc=flc_loc);
   # look for parameters with range specification
-  a = re.match('[LG]_\w+[[]\d+\+?:\d+]$',raw);
+  a = reRange.match(raw);
   if a:
     if 'symbol' not in allowed:
       raise AsmException('Symbol not allowed at %s' % flc_loc);
-    a = re.findall('([LG]_\w+)([[].*)',raw)[0];
-    return dict(type='symbol', value=a[0], loc=flc_loc, range=a[1]);
+    return dict(type='symbol', value=a.group(1), loc=flc_loc, range=a.group(2));
   # look for symbols
   # Note:  This should be the last check performed as every other kind of
   #        token should be recognizable
-  a = re.match(r'[A-Za-z]\w*$',raw);
+  a = reSymbol.match(raw);
   if a:
     if 'symbol' not in allowed:
       raise AsmException('Symbol not allowed at %s' % flc_loc);
@@ -451,13 +545,34 @@ def ParseToken(ad,fl_loc,col,raw,allowed):
 #
 ################################################################################
 
-def RawTokens(ad,filename,startLineNumber,lines):
+# Scanner for RawTokens.  Each match is white space, the start of a comment, a
+# string including the N"" string, a single-quoted character, the malformed start
+# of a string or a character, or any other white-space delimited token.  The
+# kind of match is indicated by the name of the group.
+reRawToken = re.compile(r'''(?P<space>\s+)
+                           |(?P<comment>;)
+                           |(?P<string>N""|[CNc]?"(?:[^\\"]|\\.)+")
+                           |(?P<badString>[CNc]?")
+                           |(?P<char>'(?:.|\\.|\\[xX][0-9A-Fa-f]{1,2}|\\[0-7]{1,3})')
+                           |(?P<badChar>')
+                           |(?P<other>\S+)''',re.VERBOSE);
+reLoop = re.compile(r';\s*@loop\b');
+reLoopBound = re.compile(r';\s*@loop\s+(\w+)\s+([1-9]\d*)(\s+[1-9]\d*)?\s*$');
+reIfdef = re.compile(r'\.ifdef\((\w+)\)$');
+reIfndef = re.compile(r'\.ifndef\((\w+)\)$');
+
+def RawTokens(ad,filename,startLineNumber,lines,loopBounds=None):
   """
   Extract the list of tokens from the provided list of lines.
   Convert the directive body into a list of individual tokens.\n
   Tokens are directive names, symbol names, values, strings, labels, etc.\n
   The return is a list of the tokens in the sequence they are encountered.  Each
-  of these tokens is a dictionary object constructed by ParseToken.
+  of these tokens is a dictionary object constructed by ParseToken.\n
+  If loopBounds is a list, then the "; @loop <label> <max> [<min>]" comments
+  that are not excluded by conditional code inclusion are appended to it as
+  dictionaries with the label, the maximum and minimum (None if not stated)
+  numbers of iterations, and the location of the comment.  These are used by the worst-case execution
+  time and stack depth analyses.
   """
   allowed = [
               'instruction',
@@ -477,66 +592,62 @@ def RawTokens(ad,filename,startLineNumber,lines):
     col = 0;
     spaceFound = True;
     while col < len(line):
-      flc_loc = fl_loc + ':' + str(col+1);
+      a = reRawToken.match(line,col);
+      kind = a.lastgroup;
       # Identify and then ignore white-space characters.
-      if re.match(r'\s',line[col:]):
+      if kind == 'space':
         spaceFound = True;
-        col = col + 1;
+        col = a.end();
         continue;
+      flc_loc = fl_loc + ':' + str(col+1);
       # Ensure tokens start on new lines or are separated by spaces.
       if not spaceFound:
         raise AsmException('Missing space in %s:%d' % (fl_loc,col+1));
       spaceFound = False;
-      # Ignore comments.
-      if line[col] == ';':
+      # Ignore comments other than loop bound annotations.
+      if kind == 'comment':
+        if (loopBounds != None) and reLoop.match(line,col) and not (ifstack and not ifstack[-1]):
+          a = reLoopBound.match(line,col);
+          if not a:
+            raise AsmException('Malformed "@loop" annotation at %s' % flc_loc);
+          (label,maxCount,minCount,) = (a.group(1),int(a.group(2)),int(a.group(3)) if a.group(3) else None,);
+          if (minCount != None) and (minCount > maxCount):
+            raise AsmException('Minimum larger than maximum in "@loop" annotation at %s' % flc_loc);
+          loopBounds.append(dict(label=label, max=maxCount, min=minCount, loc=flc_loc));
         break;
-      # Catch N"" string.
-      if re.match(r'N""',line[col:]):
-        a = re.match(r'N""',line[col:]);
-      # Catch strings.
-      elif re.match(r'[CNc]?"',line[col:]):
-        a = re.match(r'[CNc]?"([^\\"]|\\.)+"',line[col:]);
-        if not a:
-          raise AsmException('Malformed string at %s' % flc_loc);
-      # Catch single-quoted characters
-      elif re.match(r'\'',line[col:]):
-        a = re.match(r'\'(.|\\.|\\[xX][0-9A-Fa-f]{1,2}|\\[0-7]{1,3})\'',line[col:]);
-        if not a:
-          raise AsmException('Malformed \'.\' at %s' % flc_loc);
-      else:
-        # Everything else is a white-space delimited token.
-        a = re.match(r'\S+',line[col:]);
-      # Get the candidate token.
+      # Catch malformed strings and single-quoted characters.
+      if kind == 'badString':
+        raise AsmException('Malformed string at %s' % flc_loc);
+      if kind == 'badChar':
+        raise AsmException('Malformed \'.\' at %s' % flc_loc);
+      # Get the candidate token, i.e., a string, a single-quoted character, or
+      # any other white-space delimited token.
       candToken = a.group(0);
+      col = a.end();
       # Catch conditional code inclusion constructs before parsing the token
       if candToken == '.else':
         if not ifstack:
           raise AsmException('Unmatched ".else" at %s' % flc_loc);
         ifstack[-1] = not ifstack[-1];
-        col += 5;
         continue;
       if candToken == '.endif':
         if not ifstack:
           raise AsmException('Unmatched ".endif" at %s' % flc_loc);
         ifstack.pop();
-        col += 6;
         continue;
-      elif re.match(r'\.ifdef\(',candToken):
-        a = re.findall(r'\.ifdef\((\w+)\)$',candToken);
+      elif candToken.startswith('.ifdef('):
+        a = reIfdef.match(candToken);
         if not a:
           raise AsmException('Malformed ".ifdef" at %s' % flc_loc);
-        ifstack.append(ad.IsSymbol(a[0]));
-        col += 8+len(a[0]);
+        ifstack.append(ad.IsSymbol(a.group(1)));
         continue;
-      elif re.match(r'\.ifndef\(',candToken):
-        a = re.findall(r'\.ifndef\((\w+)\)$',candToken);
+      elif candToken.startswith('.ifndef('):
+        a = reIfndef.match(candToken);
         if not a:
           raise AsmException('Malformed ".ifndef" at %s' % flc_loc);
-        ifstack.append(not ad.IsSymbol(a[0]));
-        col += 9+len(a[0]);
+        ifstack.append(not ad.IsSymbol(a.group(1)));
         continue;
       if ifstack and not ifstack[-1]:
-        col += len(candToken);
         continue;
       # Determine which kinds of tokens are allowed at this location in the
       # directive body.
@@ -545,8 +656,7 @@ def RawTokens(ad,filename,startLineNumber,lines):
       else:
         selAllowed = allowed;
       # Append the parsed token to the list of tokens.
-      tokens.append(ParseToken(ad,fl_loc,col,candToken,selAllowed));
-      col += len(candToken);
+      tokens.append(ParseToken(ad,fl_loc,a.start(),candToken,selAllowed));
   if ifstack:
     raise AsmException('%d unmatched conditionals at line %d' % (len(ifstack),lineNumber,));
   return tokens;
@@ -6,6 +6,7 @@
 #
 ################################################################################
 
+import collections
 import copy
 import os
 import re
@@ -30,7 +31,7 @@ class asmDef_9x8:
     """
     Indicate whether or not the string "name" is a directive.
     """
-    return name in self.directives['list'];
+    return name in self.directives;
 
   ################################################################################
   #
@@ -47,43 +48,37 @@ class asmDef_9x8:
     """
     if self.IsSymbol(name):
       raise Exception('Program Bug -- name "%s" already exists is symbols' % name);
-    self.symbols['list'].append(name);
-    self.symbols['type'].append(stype);
-    self.symbols['body'].append(body);
+    self.symbols[name] = dict(type=stype, body=body);
+    # Maintain the constants and variable locations and sizes used to evaluate
+    # "${...}" expressions.
+    if stype == 'constant':
+      self.symbolDict[name] = body[0];
+    elif stype == 'variable':
+      self.symbolDict[name] = body['start'];
+      self.AddSymbolSize(name,len(body['value']));
+
+  def AddSymbolSize(self,name,value):
+    """
+    Add the length of a memory, I/O signal, variable, or stack to the "size"
+    dictionary used to evaluate "${...}" expressions.
+    """
+    sizes = self.symbolDict['size'];
+    if name in sizes:
+      raise Exception('Program Bug:  Symbol "%s" multiply defined' % name);
+    sizes[name] = value;
 
   def IsSymbol(self,name):
-    return name in self.symbols['list'];
+    return name in self.symbols;
 
   def SymbolDict(self):
     """
     Return a dict object usable by the eval function with the currently defines
     symbols for constants, variables, memory and I/O signal lengths, variable
-    lengths, and stack lengths.
-    """
-    t = dict();
-    # Add constants and variable locations.
-    for ixSymbol in range(len(self.symbols['list'])):
-      name = self.symbols['list'][ixSymbol];
-      stype = self.symbols['type'][ixSymbol];
-      if stype == 'constant':
-        t[name] = self.symbols['body'][ixSymbol][0];
-      elif stype == 'variable':
-        t[name] = self.symbols['body'][ixSymbol]['start'];
-    # Construct and add dictionary of sizes.
-    sizes=dict();
-    def AddSize(name,value):
-      if name in sizes:
-        raise Exception('Program Bug:  Symbol "%s" multiply defined');
-      sizes[name] = value;
-    for name in self.memoryLength:
-      AddSize(name,self.memoryLength[name]);
-    for ix in [ix for ix in range(len(self.symbols['type'])) if self.symbols['type'][ix] == 'variable']:
-      AddSize(self.symbols['list'][ix],len(self.symbols['body'][ix]['value']));
-    for name in self.stackLength:
-      AddSize(name,self.stackLength[name]);
-    t['size'] = sizes;
-    # That's all.
-    return t;
+    lengths, and stack lengths.\n
+    Note:  This dict is maintained as the symbols and lengths are registered
+           rather than being reconstructed for each "${...}" expression.
+    """
+    return self.symbolDict;
 
   ################################################################################
   #
@@ -113,12 +108,8 @@ class asmDef_9x8:
 
     Also record the allowed number of allowed arguments to the macro.
     """
-    if name in self.macros['list']:
+    if name in self.macros:
       raise Exception('Program Bug -- name "%s" has already been listed as a macro' % name);
-    self.macros['list'].append(name);
-    self.macros['length'].append(macroLength);
-    self.macros['args'].append(args);
-    self.macros['doc'].append(doc)
     # Compute the range of the number of allowed arguments by first counting
     # the number of required arguments and then determining whether or not
     # there is at most one optional argument.
@@ -127,10 +118,11 @@ class asmDef_9x8:
       nRequired = nRequired + 1;
     if nRequired < len(args)-1:
       raise Exception('Program Bug -- Only the last macro argument can be optional');
-    self.macros['nArgs'].append(range(nRequired,len(args)+1));
+    self.macros[name] = dict(length=macroLength, args=args, nArgs=range(nRequired,len(args)+1), doc=doc);
 
   def AddMacroSearchPath(self,path):
     self.macroSearchPaths.append(path);
+    self.macroIndex = None;
 
   def AddUserMacro(self,macroName,macroSearchPaths=None):
     """
@@ -140,70 +132,81 @@ class asmDef_9x8:
                         <macroName>.py and must be in the project directory, an
                         included directory, or must be one of the macros
                         provided in "macros" subdirectory of this directory.
-    """
-    if not macroSearchPaths:
-      macroSearchPaths = self.macroSearchPaths;
-    for testPath in macroSearchPaths:
-      fullMacro = os.path.join(testPath,'%s.py' % macroName);
-      if os.path.isfile(fullMacro):
-        break;
+      macroSearchPaths  optional list of paths to search instead of the macro
+                        search paths, which are indexed the first time a
+                        user-defined macro is added\n
+    Note:  The script is only executed the first time it is used.  The function
+           defining the macro is then called for each assembly.
+    """
+    if macroSearchPaths:
+      for testPath in macroSearchPaths:
+        fullMacro = os.path.join(testPath,'%s.py' % macroName);
+        if os.path.isfile(fullMacro):
+          break;
+      else:
+        raise asmDef.AsmException('Definition for macro "%s" not found' % macroName);
     else:
-      raise asmDef.AsmException('Definition for macro "%s" not found' % macroName);
-    execfile(fullMacro);
-    exec('%s(self)' % macroName);
-    exec('docString = %s.__doc__' % macroName)
-    if docString and not self.macros['doc'][-1]:
-      self.macros['doc'][-1] = docString
+      if self.macroIndex == None:
+        self.macroIndex = asmDef.ModuleIndex(self.macroSearchPaths);
+      if macroName not in self.macroIndex:
+        raise asmDef.AsmException('Definition for macro "%s" not found' % macroName);
+      fullMacro = self.macroIndex[macroName];
+    module = asmDef.LoadModule(fullMacro,globals());
+    if not hasattr(module,macroName):
+      raise asmDef.AsmException('Macro "%s" not defined in %s' % (macroName,fullMacro,));
+    macroFunction = getattr(module,macroName);
+    self.macroFiles.append(fullMacro);
+    macroFunction(self);
+    docString = macroFunction.__doc__;
+    lastMacro = self.macros[next(reversed(self.macros))];
+    if docString and not lastMacro['doc']:
+      lastMacro['doc'] = docString
 
   def IsBuiltInMacro(self,name):
     """
     Indicate if the macro is built-in to the assembler or is taken from the
     ./macros directory.
     """
-    return name in self.macros['builtIn'];
+    return name in self.builtInMacros;
 
   def IsMacro(self,name):
     """
     Indicate whether or not the string "name" is a recognized macro.
     """
-    return name in self.macros['list'];
+    return name in self.macros;
 
   def IsSingleMacro(self,name):
     """
     Indicate whether or not the macro is only one instruction long.
     """
-    if name not in self.macros['list']:
+    if name not in self.macros:
       raise Exception('Program Bug -- name "%s" is not a macro' % name);
-    ix = self.macros['list'].index(name);
-    return (self.macros['length'][ix] == 1);
+    return (self.macros[name]['length'] == 1);
 
   def MacroArgTypes(self,name,ixArg):
     """
     Return the list of allowed types for the macro name for argument ixArg.
     """
-    if name not in self.macros['list']:
+    if name not in self.macros:
       raise Exception('Program Bug -- name "%s" is not a macro' % name);
-    ix = self.macros['list'].index(name);
-    return self.macros['args'][ix][ixArg][1:];
+    return self.macros[name]['args'][ixArg][1:];
 
   def MacroDefault(self,name,ixArg):
     """
     Return the default argument for the macro name for argument ixArg.
     """
-    if name not in self.macros['list']:
+    if name not in self.macros:
       raise Exception('Program Bug -- name "%s" is not a macro' % name);
-    ix = self.macros['list'].index(name);
-    return self.macros['args'][ix][ixArg][0];
+    return self.macros[name]['args'][ixArg][0];
 
   def MacroLength(self,token):
     """
     Return the length of fixed-length macros or compute and return the length
     of variable-length macros.
     """
-    if token['value'] not in self.macros['list']:
+    if token['value'] not in self.macros:
       raise Exception('Program Bug -- name "%s" is not a macro' % token['value']);
-    ix = self.macros['list'].index(token['value']);
-    length = self.macros['length'][ix];
+    length = self.macros[token['value']]['length'];
     if type(length) == int:
       return length;
     elif type(length) == types.FunctionType:
@@ -215,10 +218,9 @@ class asmDef_9x8:
     """
     Return the range of the number of allowed arguments to the named macro.
     """
-    if name not in self.macros['list']:
+    if name not in self.macros:
       raise Exception('Program bug -- name "%s" is not a macro' % name);
-    ix = self.macros['list'].index(name);
-    return self.macros['nArgs'][ix];
+    return self.macros[name]['nArgs'];
 
   ################################################################################
   #
@@ -230,14 +232,13 @@ class asmDef_9x8:
     """
     Add an instruction to the list of recognized instructions.
     """
-    self.instructions['list'].append(name);
-    self.instructions['opcode'].append(opcode);
+    self.instructions[name] = opcode;
 
   def IsInstruction(self,name):
     """
     Indicate whether or not the argument is an instruction.
     """
-    return name in self.instructions['list'];
+    return name in self.instructions;
 
   def InstructionOpcode(self,name):
     """
@@ -245,8 +246,7 @@ class asmDef_9x8:
     """
     if not self.IsInstruction(name):
       raise Exception('Program Bug:  "%s" not in instruction list' % name);
-    ix = self.instructions['list'].index(name);
-    return self.instructions['opcode'][ix];
+    return self.instructions[name];
 
   ################################################################################
   #
@@ -260,8 +260,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       return False;
-    ix = self.symbols['list'].index(name);
-    return self.symbols['type'][ix] == 'constant';
+    return self.symbols[name]['type'] == 'constant';
 
   def IsInport(self,name):
     """
@@ -269,8 +268,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       return False;
-    ix = self.symbols['list'].index(name);
-    return self.symbols['type'][ix] == 'inport';
+    return self.symbols[name]['type'] == 'inport';
 
   def IsOutport(self,name):
     """
@@ -278,8 +276,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       return False;
-    ix = self.symbols['list'].index(name);
-    return self.symbols['type'][ix] == 'outport';
+    return self.symbols[name]['type'] == 'outport';
 
   def IsOutstrobe(self,name):
     """
@@ -287,8 +284,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       return False;
-    ix = self.symbols['list'].index(name);
-    return self.symbols['type'][ix] == 'outstrobe';
+    return self.symbols[name]['type'] == 'outstrobe';
 
   def IsParameter(self,name):
     """
@@ -296,8 +292,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       return False;
-    ix = self.symbols['list'].index(name);
-    return self.symbols['type'][ix] == 'parameter';
+    return self.symbols[name]['type'] == 'parameter';
 
   def InportAddress(self,name):
     """
@@ -305,8 +300,7 @@ class asmDef_9x8:
     """
     if not self.IsInport(name):
       raise Exception('Program Bug -- "%s" is not an inport' % name);
-    ix = self.symbols['list'].index(name);
-    return self.symbols['body'][ix];
+    return self.symbols[name]['body'];
 
   def OutportAddress(self,name):
     """
@@ -314,8 +308,7 @@ class asmDef_9x8:
     """
     if not self.IsOutport(name) and not self.IsOutstrobe(name):
       raise Exception('Program Bug -- "%s" is not an outport' % name);
-    ix = self.symbols['list'].index(name);
-    return self.symbols['body'][ix];
+    return self.symbols[name]['body'];
 
   def RegisterInport(self,name,address):
     """
@@ -358,7 +351,7 @@ class asmDef_9x8:
     Record the length of the specified memory.\n
     Note:  This is used to evaluate "size[name]" in "${...}" expressions.
     """
-    self.memoryLength[name] = length;
+    self.AddSymbolSize(name,length);
 
   def RegisterStackLength(self,name,length):
     """
@@ -367,7 +360,7 @@ class asmDef_9x8:
     Note:  This differs from RegisterMemoryLength() in that the stack lengths
            can be larger than 256.
     """
-    self.stackLength[name] = length;
+    self.AddSymbolSize(name,length);
 
   ################################################################################
   #
@@ -382,8 +375,7 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       raise asmDef.AsmException('Undefined symbol "%s" at %s' % (name,loc));
-    ixName = self.symbols['list'].index(name);
-    if self.symbols['type'][ixName] not in allowableTypes:
+    if self.symbols[name]['type'] not in allowableTypes:
       raise asmDef.AsmException('Illegal symbol at %s' % loc);
 
   def CheckRawTokens(self,rawTokens):
@@ -487,11 +479,10 @@ class asmDef_9x8:
     values = list();
     for token in rawTokens:
       if token['type'] == 'symbol':
-        ix = self.symbols['list'].index(token['value']);
-        symbolType = self.symbols['type'][ix];
-        if symbolType != 'constant':
+        symbol = self.symbols[token['value']];
+        if symbol['type'] != 'constant':
           raise asmDef.AsmException('Illegal symbol "%s" at %s' % (token['value'],token['loc'],));
-        value = self.symbols['body'][ix];
+        value = symbol['body'];
       elif token['type'] == 'value':
         value = token['value'];
       else:
@@ -521,15 +512,14 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(token['value']):
       raise asmDef.AsmException('Symbol "%s" not in symbol list at %s' %(token['value'],token['loc'],));
-    ix = self.symbols['list'].index(token['value']);
-    symbolType = self.symbols['type'][ix];
+    symbolType = self.symbols[token['value']]['type'];
     if symbolType == 'RAM':
       return dict(type='RAM', value=token['value'], loc=token['loc']);
     elif symbolType == 'ROM':
       return dict(type='ROM', value=token['value'], loc=token['loc']);
     elif symbolType == 'constant':
       if singleValue:
-        thisBody = self.symbols['body'][ix];
+        thisBody = self.symbols[token['value']]['body'];
         if len(thisBody) != 1:
           raise asmDef.AsmException('Constant "%s" must evaluate to a single byte at %s' % (token['value'],token['loc'],))
         thisBody = thisBody[0];
@@ -593,8 +583,7 @@ class asmDef_9x8:
         newToken['loc'] = token['loc'];
         tokens.append(newToken);
         if token['type'] == 'constant':
-          ix = self.symbols['list'].index(newToken['value']);
-          offset = offset + len(self.symbols['body'][ix]);
+          offset = offset + len(self.symbols[newToken['value']]['body']);
         else:
           offset = offset + 1;
       # anything else is a program bug
@@ -649,7 +638,7 @@ class asmDef_9x8:
         raise asmDef.AsmException('Macro "%s" is an instruction at %s' % (fullMacroName,secondToken['loc'],));
       if self.IsBuiltInMacro(fullMacroName):
         raise asmDef.AsmException('Macro "%s" is a built-in macro at %s' % (fullMacroName,secondToken['loc'],));
-      if fullMacroName not in self.macros['list']:
+      if fullMacroName not in self.macros:
         self.AddUserMacro(macroName);
     # Process ".main" definition.
     elif firstToken['value'] == '.main':
@@ -666,8 +655,7 @@ class asmDef_9x8:
       if thirdToken['type'] != 'symbol':
         raise asmDef.AsmException('".memory" directive requires name for second argument at %s' % thirdToken['loc']);
       if self.IsSymbol(thirdToken['value']):
-        ix = self.symbols['list'].index(thirdToken['value']);
-        if self.symbols['type'] != secondToken['value']:
+        if self.symbols[thirdToken['value']]['type'] != secondToken['value']:
           raise asmDef.AsmException('Redefinition of ".memory %s %s" not allowed at %s' % (secondToken['value'],thirdToken['value'],firstToken['loc']));
       else:
         self.AddSymbol(thirdToken['value'],secondToken['value'],dict(length=0));
@@ -676,8 +664,7 @@ class asmDef_9x8:
     elif firstToken['value'] == '.variable':
       if not self.currentMemory:
         raise asmDef.AsmException('".memory" directive required before ".variable" directive at %s' % firstToken['line']);
-      ixMem = self.symbols['list'].index(self.currentMemory);
-      currentMemoryBody = self.symbols['body'][ixMem];
+      currentMemoryBody = self.symbols[self.currentMemory]['body'];
       byteList = self.ByteList(rawTokens[2:],limit=True);
       body = dict(memory=self.currentMemory, start=currentMemoryBody['length'], value=byteList);
       self.AddSymbol(secondToken['value'], 'variable', body=body);
@@ -720,15 +707,15 @@ class asmDef_9x8:
     self.memories = dict(list=list(), type=list(), length=list(), bank=list());
     ramBank = 0;
     romBank = 3;
-    for ix in range(len(self.symbols['list'])):
-      if self.symbols['type'][ix] in ('RAM','ROM',):
-        memBody = self.symbols['body'][ix];
+    for (name,symbol) in self.symbols.iteritems():
+      if symbol['type'] in ('RAM','ROM',):
+        memBody = symbol['body'];
         if memBody['length'] == 0:
-          raise asmDef.AsmException('Empty memory:  %s' % self.symbols['list'][ix]);
-        self.memories['list'].append(self.symbols['list'][ix]);
-        self.memories['type'].append(self.symbols['type'][ix]);
+          raise asmDef.AsmException('Empty memory:  %s' % name);
+        self.memories['list'].append(name);
+        self.memories['type'].append(symbol['type']);
         self.memories['length'].append(memBody['length']);
-        if self.symbols['type'][ix] == 'RAM':
+        if symbol['type'] == 'RAM':
           self.memories['bank'].append(ramBank);
           ramBank = ramBank + 1;
         else:
@@ -757,66 +744,59 @@ class asmDef_9x8:
     Create a list of the functions required by the program, starting with the
     required .main function and the optional .interrupt function.\n
     Record the length of each function, its body, and its start address and
-    calculate the addresses of the labels within each function body.\n
+    calculate the addresses of the labels within each function body.  A
+    ".jump" marked as a tail call by the optimizer (see asmOptimize.TailCall)
+    requires its function like a ".call".\n
     Finally, ensure the function address space does not exceed the absolute
     8192 address limit.
     """
-    self.functionEvaluation = dict(list=list(), length=list(), body=list(), address=list());
+    self.functionEvaluation = collections.OrderedDict();
     nextStart = 0;
     # ".interrupt" is optionally required (and is sure to exist by this
     # function call if it is required).  The interrupt handler always starts at
     # address 3 so that address 0 can be a jump to ".main".
     if self.interrupt:
       nextStart = 3;
-      self.functionEvaluation['list'].append('.interrupt');
-      self.functionEvaluation['length'].append(self.interrupt['length']);
-      self.functionEvaluation['body'].append(self.interrupt['tokens']);
-      self.functionEvaluation['address'].append(nextStart);
-      nextStart = nextStart + self.functionEvaluation['length'][-1];
+      self.functionEvaluation['.interrupt'] = dict(length=self.interrupt['length'], body=self.interrupt['tokens'], address=nextStart);
+      nextStart = nextStart + self.interrupt['length'];
     # ".main" is always required.
-    self.functionEvaluation['list'].append('.main');
-    self.functionEvaluation['length'].append(self.main['length']);
-    self.functionEvaluation['body'].append(self.main['tokens']);
-    self.functionEvaluation['address'].append(nextStart);
-    nextStart = nextStart + self.functionEvaluation['length'][-1];
+    self.functionEvaluation['.main'] = dict(length=self.main['length'], body=self.main['tokens'], address=nextStart);
+    nextStart = nextStart + self.main['length'];
     # Loop through the required function bodies as they are identified.
+    functionNames = self.functionEvaluation.keys();
     ix = 0;
-    while ix < len(self.functionEvaluation['body']):
-      for token in self.functionEvaluation['body'][ix]:
-        if (token['type'] == 'macro') and (token['value'] in ('.call','.callc',)):
+    while ix < len(functionNames):
+      for token in self.functionEvaluation[functionNames[ix]]['body']:
+        if (token['type'] == 'macro') and ((token['value'] in ('.call','.callc',)) or token.get('tailCall')):
           callName = token['argument'][0]['value'];
-          if callName not in self.functionEvaluation['list']:
+          if callName not in self.functionEvaluation:
             if not self.IsSymbol(callName):
-              raise asmDef.AsmException('Function "%s" not defined for function "%s"' % (callName,self.functionEvaluation['list'][ix],));
-            ixName = self.symbols['list'].index(callName);
-            if self.symbols['type'][ixName] != 'function':
-              raise asmDef.AsmException('Function "%s" called by "%s" is not a function' % (callName, self.functionEvaluation['list'][ix],));
-            self.functionEvaluation['list'].append(callName);
-            self.functionEvaluation['length'].append(self.symbols['body'][ixName]['length']);
-            self.functionEvaluation['body'].append(self.symbols['body'][ixName]['tokens']);
-            self.functionEvaluation['address'].append(nextStart);
-            nextStart = nextStart + self.functionEvaluation['length'][-1];
+              raise asmDef.AsmException('Function "%s" not defined for function "%s"' % (callName,functionNames[ix],));
+            symbol = self.symbols[callName];
+            if symbol['type'] != 'function':
+              raise asmDef.AsmException('Function "%s" called by "%s" is not a function' % (callName,functionNames[ix],));
+            functionNames.append(callName);
+            self.functionEvaluation[callName] = dict(length=symbol['body']['length'], body=symbol['body']['tokens'], address=nextStart);
+            nextStart = nextStart + symbol['body']['length'];
       ix = ix + 1;
     # Within each function, compute the list of label addresses and then fill in
     # the address for all jumps and calls.
-    for ix in range(len(self.functionEvaluation['list'])):
-      startAddress = self.functionEvaluation['address'][ix];
-      labelAddress = dict(list=list(), address=list());
-      for token in self.functionEvaluation['body'][ix]:
+    for function in self.functionEvaluation.itervalues():
+      labelAddress = dict();
+      for token in function['body']:
         if token['type'] == 'label':
-          labelAddress['list'].append(token['value']);
-          labelAddress['address'].append(startAddress + token['offset']);
-      for token in self.functionEvaluation['body'][ix]:
+          labelAddress[token['value']] = function['address'] + token['offset'];
+      for token in function['body']:
         if token['type'] != 'macro':
           continue;
-        if token['value'] in ('.jump','.jumpc',):
-          ix = labelAddress['list'].index(token['argument'][0]['value']);
-          token['address'] = labelAddress['address'][ix];
+        if token.get('tailCall'):
+          token['address'] = self.functionEvaluation[token['argument'][0]['value']]['address'];
+        elif token['value'] in ('.jump','.jumpc',):
+          token['address'] = labelAddress[token['argument'][0]['value']];
         elif token['value'] in ('.call','.callc',):
-          ix = self.functionEvaluation['list'].index(token['argument'][0]['value']);
-          token['address'] = self.functionEvaluation['address'][ix];
+          token['address'] = self.functionEvaluation[token['argument'][0]['value']]['address'];
     # Sanity checks for address range
-    if self.functionEvaluation['address'][-1] + self.functionEvaluation['length'][-1] >= 2**13:
+    if self.ProgramLength() >= 2**13:
       raise asmDef.AsmException('Max address for program requires more than 13 bits');
 
   ################################################################################
@@ -849,21 +829,44 @@ class asmDef_9x8:
     # Emit the individual memories.
     for ixMem in range(len(self.memories['list'])):
       fp.write(':memory %s %s %d %d\n' % (self.memories['type'][ixMem],self.memories['list'][ixMem],self.memories['bank'][ixMem],self.memories['length'][ixMem]));
-      memName = self.memories['list'][ixMem];
-      address = 0;
-      for ixSymbol in range(len(self.symbols['list'])):
-        if self.symbols['type'][ixSymbol] != 'variable':
-          continue;
-        vBody = self.symbols['body'][ixSymbol];
-        if vBody['memory'] != memName:
-          continue;
-        fp.write('- %s\n' % self.symbols['list'][ixSymbol]);
-        for v in vBody['value']:
-          if not (-128 <=v < 256):
-            raise Exception('Program Bug -- value not representable by a byte');
-          fp.write('%02X\n' % (v % 0x100,));
+      self.EmitMemoryBody(fp,ixMem);
       fp.write('\n');
 
+  def EmitMemoryBody(self,fp,ixMem):
+    """
+    Write the variable names and values for the specified memory.\n
+    Note:  This is used by EmitMemories and by MemoryImages.
+    """
+    memName = self.memories['list'][ixMem];
+    for (name,symbol) in self.symbols.iteritems():
+      if symbol['type'] != 'variable':
+        continue;
+      vBody = symbol['body'];
+      if vBody['memory'] != memName:
+        continue;
+      fp.write('- %s\n' % name);
+      for v in vBody['value']:
+        if not (-128 <=v < 256):
+          raise Exception('Program Bug -- value not representable by a byte');
+        fp.write('%02X\n' % (v % 0x100,));
+
+  def MemoryImages(self):
+    """
+    Return the memories as a list of dictionaries with the memory type, name,
+    bank, length, and body.  The body is the list of lines EmitMemoryBody would
+    write to the metacode file, without the trailing newlines.
+    """
+    images = list();
+    for ixMem in range(len(self.memories['list'])):
+      body = asmDef.LineCollector();
+      self.EmitMemoryBody(body,ixMem);
+      images.append(dict(type=self.memories['type'][ixMem],
+                         name=self.memories['list'][ixMem],
+                         bank=self.memories['bank'][ixMem],
+                         length=self.memories['length'][ixMem],
+                         body=body.lines));
+    return images;
+
   ################################################################################
   #
   # Emit the metacode for the program.
@@ -892,10 +895,10 @@ class asmDef_9x8:
       name = token['value'];
       if not self.IsSymbol(name):
         raise Exception('Program Bug');
-      ix = self.symbols['list'].index(name);
-      if len(self.symbols['body'][ix]) != 1:
+      body = self.symbols[name]['body'];
+      if len(body) != 1:
         raise asmDef.AsmException('Optional constant can only be one byte at %s' % token['loc']);
-      return self.symbols['body'][ix][0]
+      return body[0]
     elif token['type'] == 'value':
       return token['value']
     else:
@@ -912,10 +915,9 @@ class asmDef_9x8:
     name = token['value'];
     if not self.IsSymbol(name):
       raise asmDef.AsmException('"%s" is not a recognized symbol at %s' % (name,token['loc'],));
-    ixName = self.symbols['list'].index(name);
-    if self.symbols['type'][ixName] != 'variable':
+    if self.symbols[name]['type'] != 'variable':
       raise asmDef.AsmException('"%s" is not a variable at %s' % (name,token['loc'],));
-    body = self.symbols['body'][ixName];
+    body = self.symbols[name]['body'];
     bankName = body['memory'];
     ixMem = self.memories['list'].index(bankName);
     return (body['start'],self.memories['bank'][ixMem],bankName,);
@@ -950,8 +952,7 @@ class asmDef_9x8:
       name = token['value'];
       if not self.IsSymbol(name):
         raise asmDef.AsmException('Symbol "%s" not recognized at %s' % (token['value'],token['loc'],));
-      ix = self.symbols['list'].index(name);
-      v = self.symbols['body'][ix];
+      v = self.symbols[name]['body'];
       if len(v) != 1:
         raise asmDef.AsmException('Argument can only be one value at %s' % token['loc']);
       v = v[0];
@@ -1028,10 +1029,9 @@ class asmDef_9x8:
     """
     if not self.IsSymbol(name):
       raise asmDef.AsmException('Variable "%s" not recognized' % name);
-    ixName = self.symbols['list'].index(name);
-    if self.symbols['type'][ixName] != 'variable':
+    if self.symbols[name]['type'] != 'variable':
       raise asmDef.AsmException('"%s" is not a variable' % name);
-    self.EmitPush(fp,self.symbols['body'][ixName]['start'],name);
+    self.EmitPush(fp,self.symbols[name]['body']['start'],name);
 
   #
   # EmitOpcode, EmitMacro, and EmitProgram emit composite or more complicated
@@ -1053,16 +1053,15 @@ class asmDef_9x8:
       name = token['value'];
       if not self.IsSymbol(name):
         raise Exception('Program Bug');
-      ix = self.symbols['list'].index(name);
-      if len(self.symbols['body'][ix]) != 1:
+      body = self.symbols[name]['body'];
+      if len(body) != 1:
         raise asmDef.AsmException('Optional constant can only be one byte at %s' % token['loc']);
-      self.EmitPush(fp,self.symbols['body'][ix][0],self.Emit_String(name),tokenLoc=token['loc']);
+      self.EmitPush(fp,body[0],self.Emit_String(name),tokenLoc=token['loc']);
     elif token['type'] in ('inport','outport','outstrobe'):
       name = token['value'];
       if not self.IsSymbol(name):
         raise Exception('Program Bug -- unrecognized inport/outport name "%s"');
-      ix = self.symbols['list'].index(name);
-      self.EmitPush(fp,self.symbols['body'][ix],self.Emit_String(name));
+      self.EmitPush(fp,self.symbols[name]['body'],self.Emit_String(name));
     elif token['type'] == 'instruction':
       self.EmitOpcode(fp,self.InstructionOpcode(token['value']),token['value']);
     elif token['type'] == 'parameter':
@@ -1194,25 +1193,29 @@ class asmDef_9x8:
     # Write the program marker, address of .main, address or "[]" of .interrupt,
     # and the total program length.
     fp.write(':program');
+    fp.write(' %d' % self.functionEvaluation['.main']['address']);
     if self.interrupt:
-      fp.write(' %d' % self.functionEvaluation['address'][1]);  # .main
-      fp.write(' %d' % self.functionEvaluation['address'][0]);  # .interrupt
+      fp.write(' %d' % self.functionEvaluation['.interrupt']['address']);
     else:
-      fp.write(' %d' % self.functionEvaluation['address'][0]);  # .main
-      fp.write(' []');                                          # no .interrupt
-    fp.write(' %d' % (self.functionEvaluation['address'][-1] + self.functionEvaluation['length'][-1]));
+      fp.write(' []');
+    fp.write(' %d' % self.ProgramLength());
     fp.write('\n');
-    # Emit the bodies
+    self.EmitProgramBody(fp);
+
+  def EmitProgramBody(self,fp):
+    """
+    Write the function bodies for the program (see EmitProgram).
+    """
     if self.interrupt:
       self.emitLabelList = '';
-      mainAddress = self.functionEvaluation['address'][1];
+      mainAddress = self.functionEvaluation['.main']['address'];
       self.EmitPush(fp,mainAddress & 0xFF,name='');
       self.EmitOpcode(fp,self.specialInstructions['jump'] | (mainAddress >> 8),'jump .main');
       self.EmitOpcode(fp,self.InstructionOpcode('nop'),'nop');
-    for ix in range(len(self.functionEvaluation['list'])):
-      fp.write('- %s\n' % self.functionEvaluation['list'][ix]);
+    for (name,function) in self.functionEvaluation.iteritems():
+      fp.write('- %s\n' % name);
       self.emitLabelList = '';
-      for token in self.functionEvaluation['body'][ix]:
+      for token in function['body']:
         if token['type'] == 'value':
           self.EmitPush(fp,token['value'],tokenLoc=token['loc']);
         elif token['type'] == 'label':
@@ -1220,16 +1223,14 @@ class asmDef_9x8:
         elif token['type'] == 'constant':
           if not self.IsSymbol(token['value']):
             raise Exception('Program Bug');
-          ix = self.symbols['list'].index(token['value']);
-          body = self.symbols['body'][ix];
+          body = self.symbols[token['value']]['body'];
           self.EmitPush(fp,body[-1],token['value'],tokenLoc=token['loc']);
           for v in body[-2::-1]:
             self.EmitPush(fp,v,tokenLoc=token['loc']);
         elif token['type'] in ('inport','outport','outstrobe',):
           if not self.IsSymbol(token['value']):
             raise Exception('Program Bug');
-          ix = self.symbols['list'].index(token['value']);
-          self.EmitPush(fp,self.symbols['body'][ix],token['value'],tokenLoc=token['loc']);
+          self.EmitPush(fp,self.symbols[token['value']]['body'],token['value'],tokenLoc=token['loc']);
         elif token['type'] == 'instruction':
           self.EmitOpcode(fp,self.InstructionOpcode(token['value']),token['value']);
         elif token['type'] == 'macro':
@@ -1243,6 +1244,31 @@ class asmDef_9x8:
         else:
           raise Exception('Program Bug:  Unrecognized type "%s"' % token['type']);
 
+  def ProgramImage(self):
+    """
+    Return the program as a dictionary with the following content:
+      main              address of the .main function
+      interrupt         address of the .interrupt function or None
+      length            total program length
+      body              list of lines EmitProgramBody would write to the
+                        metacode file, without the trailing newlines
+    """
+    body = asmDef.LineCollector();
+    self.EmitProgramBody(body);
+    mainAddress = self.functionEvaluation['.main']['address'];
+    if self.interrupt:
+      interruptAddress = self.functionEvaluation['.interrupt']['address'];
+    else:
+      interruptAddress = None;
+    return dict(main=mainAddress, interrupt=interruptAddress, length=self.ProgramLength(), body=body.lines);
+
+  def ProgramLength(self):
+    """
+    Return the total number of instructions in the program.
+    """
+    lastFunction = self.functionEvaluation[next(reversed(self.functionEvaluation))];
+    return lastFunction['address'] + lastFunction['length'];
+
   ################################################################################
   #
   # Initialize the object.
@@ -1272,23 +1298,21 @@ class asmDef_9x8:
     # Note:  The ".include" directive is handled within asmDef.FileBodyIterator.
     #
 
-    self.directives = dict();
-
-    self.directives['list']= list();
-    self.directives['list'].append('.constant');
-    self.directives['list'].append('.define');
-    self.directives['list'].append('.function');
-    self.directives['list'].append('.interrupt');
-    self.directives['list'].append('.macro');
-    self.directives['list'].append('.main');
-    self.directives['list'].append('.memory');
-    self.directives['list'].append('.variable');
+    self.directives = set();
+    self.directives.add('.constant');
+    self.directives.add('.define');
+    self.directives.add('.function');
+    self.directives.add('.interrupt');
+    self.directives.add('.macro');
+    self.directives.add('.main');
+    self.directives.add('.memory');
+    self.directives.add('.variable');
 
     #
     # Configure the instructions.
     #
 
-    self.instructions = dict(list=list(), opcode=list());
+    self.instructions = dict();
     self.AddInstruction('&',            0x050);
     self.AddInstruction('+',            0x018);
     self.AddInstruction('+c',           0x00B);
@@ -1341,7 +1365,9 @@ class asmDef_9x8:
     #        expanded.
     #
 
-    self.macros = dict(list=list(), length=list(), args=list(), nArgs=list(), builtIn = list(), doc = list());
+    self.macros = collections.OrderedDict();
+    self.builtInMacros = set();
+    self.macroFiles = list();
     self.EmitFunction = dict();
 
     # Macros built in to the assembler (to access primitives).
@@ -1370,13 +1396,14 @@ class asmDef_9x8:
     self.AddMacro('.store-',            1, [ ['','symbol'] ]);
 
     # User-defined macros in ./macros that are "built in" to the assembler.
-    macroSearchPath = os.path.join(sys.path[0],'macros');
+    # Note:  Use the location of this file rather than sys.path[0] so that the
+    #        assembler can also be run from within ssbcc.
+    macroSearchPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'macros');
     for macroName in os.listdir(macroSearchPath):
       if not re.match(r'.*\.py$',macroName):
         continue;
       self.AddUserMacro(macroName[:-3],macroSearchPaths=[macroSearchPath]);
-    for macroName in self.macros['list']:
-      self.macros['builtIn'].append(macroName);
+    self.builtInMacros.update(self.macros);
 
     #
     # List the macros that have special symbols for their first argument.
@@ -1384,13 +1411,6 @@ class asmDef_9x8:
 
     self.MacrosWithSpecialFirstSymbol = ('.call','.callc','.jump','.jumpc',);
 
-    #
-    # Externally defined parameters.
-    #
-
-    self.memoryLength = dict();
-    self.stackLength = dict();
-
     #
     # Conditional implementation of interrupts.
     #
@@ -1414,4 +1434,12 @@ class asmDef_9x8:
     self.interrupt = None;
     self.main = None;
     self.macroSearchPaths = ['.','./macros'];
-    self.symbols = dict(list=list(), type=list(), body=list());
+    self.macroIndex = None;
+    self.symbols = collections.OrderedDict();
+
+    #
+    # Values and lengths for "${...}" expressions, including the externally
+    # defined memory, I/O signal, and stack lengths.
+    #
+
+    self.symbolDict = dict(size=dict());
@@ -0,0 +1,191 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Function inliner for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import collections
+import copy
+
+from asmOptimize import asmOptimize
+
+class asmInline(asmOptimize):
+  """
+  Replace the calls to small functions and to functions with only one call
+  site by the bodies of the functions.\n
+  The functions are considered from the leaves of the call graph toward ".main"
+  and ".interrupt" so that the functions called by a function have already
+  been inlined when the function is considered.  A function is inlined at all
+  of its ".call" sites if its length, including its ".return", is at most the
+  size threshold or if it is called from only one place.  The program length
+  after inlining the function must not exceed the budget, normally the size of
+  the instruction memory, so the inliner trades the unused instruction memory
+  for speed.  A function is removed from the program when all of its calls
+  have been inlined.\n
+  The labels in the inlined body are renamed to "<function>.<n>.<label>", which
+  cannot collide with the labels in the assembly source, and a ".return" within
+  the body becomes a ".jump" to the label "<function>.<n>" placed after the
+  body.  The ".return" at the end of the body is removed and its delay slot, if
+  it is not a "nop", is kept in its place.  The "@loop" annotations of the
+  function are copied for the renamed labels.\n
+  Recursive functions and functions that can read their return address (see
+  asmOptimize.ReadsReturnAddress) are not inlined.  Calls whose delay slot uses
+  the return stack and ".callc" calls are not inlined.
+  """
+
+  def __init__(self,ad,loopBounds,budget,threshold):
+    """
+    Initialize the inliner.\n
+    ad          asmDef_9x8 object after all of the directive bodies have been
+                processed by FillRawTokens
+    loopBounds  dictionary of the "@loop" annotations (see asmWCET), which is
+                extended for the loops in the inlined bodies
+    budget      maximum length of the program after inlining
+    threshold   maximum length of the functions inlined at all of their call
+                sites
+    """
+    asmOptimize.__init__(self,ad);
+    self.loopBounds = loopBounds;
+    self.budget = budget;
+    self.threshold = threshold;
+    self.inlined = collections.OrderedDict();
+
+  ################################################################################
+  #
+  # Identify the functions to inline.
+  #
+  ################################################################################
+
+  def IsInlinable(self,name,token):
+    """
+    Indicate whether or not the token is a call to the named function that can
+    be replaced by the function body.
+    """
+    return (self.CalledFunction(token) == name) and (token['value'] == '.call') and not self.UsesReturnStack(token['argument'][1]);
+
+  def Order(self,bodies):
+    """
+    Return the list of the functions in which each function follows the
+    functions it calls and the set of the recursive functions.
+    """
+    order = list();
+    recursive = set();
+    def Visit(name,stack):
+      if name in stack:
+        recursive.update(stack[stack.index(name):]);
+        return;
+      if name in order:
+        return;
+      stack.append(name);
+      for callName in self.Callees(bodies[name]):
+        if callName in bodies:
+          Visit(callName,stack);
+      stack.pop();
+      order.append(name);
+    for name in bodies:
+      Visit(name,list());
+    return (order,recursive,);
+
+  ################################################################################
+  #
+  # Inline the functions.
+  #
+  ################################################################################
+
+  def BodyToken(self,argument):
+    """
+    Return the body token for the instruction in a delay slot.
+    """
+    if argument['type'] == 'symbol':
+      return self.ad.ExpandSymbol(argument,singleValue=True);
+    return copy.copy(argument);
+
+  def InlineBody(self,name,call,instance):
+    """
+    Return the tokens that replace the call to the named function.
+    """
+    tokens = list();
+    slot = call['argument'][1];
+    if (slot['type'] != 'instruction') or (slot['value'] != 'nop'):
+      tokens.append(self.BodyToken(slot));
+    prefix = '%s.%d' % (name,instance,);
+    body = copy.deepcopy(self.ad.symbols[name]['body']['tokens']);
+    endLabel = False;
+    for (ixToken,token,) in enumerate(body):
+      if token['type'] == 'label':
+        token['value'] = '%s.%s' % (prefix,token['value'],);
+      elif (token['type'] == 'macro') and (token['value'] in ('.jump','.jumpc',)) and not token.get('tailCall'):
+        token['argument'][0]['value'] = '%s.%s' % (prefix,token['argument'][0]['value'],);
+      elif (token['type'] == 'macro') and (token['value'] == '.return'):
+        slot = token['argument'][0];
+        if ixToken == len(body)-1:
+          if (slot['type'] != 'instruction') or (slot['value'] != 'nop'):
+            tokens.append(self.BodyToken(slot));
+          continue;
+        token = dict(type='macro', value='.jump', argument=[dict(type='symbol', value=prefix, loc=token['loc']),slot], loc=token['loc']);
+        endLabel = True;
+      tokens.append(token);
+    if endLabel:
+      tokens.append(dict(type='label', value=prefix, loc=call['loc']));
+    return tokens;
+
+  def InlineFunction(self,name,bodies):
+    """
+    Inline the named function at its ".call" sites if it meets the criteria and
+    the budget.
+    """
+    if self.ReadsReturnAddress(name):
+      return;
+    nCalls = 0;
+    inlineCalls = 0;
+    for body in bodies.itervalues():
+      for token in body['tokens']:
+        if self.CalledFunction(token) == name:
+          nCalls += 1;
+          if self.IsInlinable(name,token):
+            inlineCalls += 1;
+    length = bodies[name]['length'];
+    if (inlineCalls == 0) or ((length > self.threshold) and (nCalls > 1)):
+      return;
+    # Construct the new bodies of the calling functions.
+    newTokens = dict();
+    growth = -length if inlineCalls == nCalls else 0;
+    instance = 0;
+    newBounds = list();
+    for (caller,body,) in bodies.iteritems():
+      if not any([self.IsInlinable(name,token) for token in body['tokens']]):
+        continue;
+      tokens = list();
+      for token in body['tokens']:
+        if not self.IsInlinable(name,token):
+          tokens.append(token);
+          continue;
+        instance += 1;
+        inlinedTokens = self.InlineBody(name,token,instance);
+        growth += sum([self.TokenLength(inlinedToken) for inlinedToken in inlinedTokens]) - self.TokenLength(token);
+        tokens += inlinedTokens;
+        for loopBound in self.loopBounds.get(name,list()):
+          newBounds.append((caller,dict(loopBound, label='%s.%d.%s' % (name,instance,loopBound['label'],)),));
+      newTokens[caller] = tokens;
+    if self.ProgramLength(bodies) + growth > self.budget:
+      return;
+    for (caller,tokens,) in newTokens.iteritems():
+      self.Relocate(bodies[caller],tokens);
+    for (caller,loopBound,) in newBounds:
+      self.loopBounds.setdefault(caller,list()).append(loopBound);
+    self.inlined[name] = dict(calls=inlineCalls, removed=(inlineCalls == nCalls), growth=growth);
+
+  def Inline(self):
+    """
+    Inline the functions required by ".main" and ".interrupt".\n
+    Note:  This must be done before the peephole optimizer so that it can
+           optimize the inlined bodies with the surrounding code and before
+           asmDef_9x8.EvaluateFunctionTree computes the function addresses.
+    """
+    (order,recursive,) = self.Order(self.Bodies());
+    for name in order:
+      if (name in ('.interrupt','.main',)) or (name in recursive):
+        continue;
+      self.InlineFunction(name,self.Bodies());
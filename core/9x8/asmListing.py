@@ -0,0 +1,302 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Program listing, memory map, and debug information for the SSBCC 9x8
+# processor.
+#
+################################################################################
+
+import collections
+import json
+
+import asmDef
+from asmWCET import asmWCET
+
+class asmListing:
+  """
+  Program listing, memory map, and memory utilization of an assembled
+  program.\n
+  The listing shows the start address, length, and worst-case execution time
+  of each function identified by asmDef_9x8.EvaluateFunctionTree followed by
+  the address, opcode, and metacode description of every instruction along
+  with the source location of the token that generated it.  The text of the
+  source line is shown when the source line changes.\n
+  The memory map shows the bank, the used and declared lengths, and the
+  address and length of every variable of each memory and, when it is
+  provided, where the memory is packed into the HDL memories (see
+  ssbccConfig.PackCombinedMemory).\n
+  The same information, along with the labels, constants, and I/O ports, is
+  also available as a JSON file for profilers, trace decoders, and simulators
+  (see DebugInfo).
+  """
+
+  def __init__(self,ad,loopBounds,program):
+    """
+    Initialize the listing.\n
+    ad          asmDef_9x8 object after EvaluateFunctionTree
+    loopBounds  dictionary of the "@loop" annotations (see asmWCET)
+    program     program as per asmDef_9x8.ProgramImage
+    """
+    self.ad = ad;
+    self.loopBounds = loopBounds;
+    self.program = program;
+    self.sourceLines = dict();
+
+  ################################################################################
+  #
+  # Map the instructions to the source lines.
+  #
+  ################################################################################
+
+  def SourceLine(self,loc):
+    """
+    Return the file name, the line number, and the text of the source line for
+    the "file:line:column" location of a token.\n
+    The text is empty if the source file cannot be read.
+    """
+    (filename,line,) = loc.rsplit(':',2)[0:2];
+    line = int(line);
+    if filename not in self.sourceLines:
+      try:
+        fp = open(filename,'rt');
+        self.sourceLines[filename] = fp.read().splitlines();
+        fp.close();
+      except IOError:
+        self.sourceLines[filename] = list();
+    lines = self.sourceLines[filename];
+    text = lines[line-1].strip() if 0 < line <= len(lines) else '';
+    return (filename,line,text,);
+
+  def Locations(self,function):
+    """
+    Return the list of the source locations for the instructions of the
+    function, i.e., the location of the last non-label token that starts at or
+    before each instruction.
+    """
+    locations = [None]*function['length'];
+    for token in function['body']:
+      if token['type'] != 'label':
+        locations[token['offset']] = token['loc'];
+    for offset in range(1,len(locations)):
+      if locations[offset] == None:
+        locations[offset] = locations[offset-1];
+    return locations;
+
+  def Instructions(self):
+    """
+    Return the list of the sections of the program, i.e., the reset vector
+    that jumps to ".main" when interrupts are enabled followed by the
+    functions, as tuples of the section name, its address, and the list of its
+    instructions.  Each instruction is a tuple of its opcode, i.e., 3 hex
+    digits or "p" for a parameter, its metacode description, and its source
+    location or None.
+    """
+    functions = self.ad.functionEvaluation;
+    sections = [['reset vector',list(),],] if self.program['interrupt'] != None else list();
+    for line in self.program['body']:
+      if line[0] == '-':
+        sections.append([line[2:],list(),]);
+      elif line[0] == 'p':
+        sections[-1][1].append(('p',line[2:].strip(),));
+      else:
+        sections[-1][1].append((line[0:3],line[4:].strip(),));
+    instructions = list();
+    address = 0;
+    for (name,lines,) in sections:
+      if name in functions:
+        function = functions[name];
+        if (function['address'] != address) or (function['length'] != len(lines)):
+          raise Exception('Program Bug -- listing of "%s" does not match its function' % name);
+        locations = self.Locations(function);
+      else:
+        locations = [None]*len(lines);
+      instructions.append((name,address,[line+(loc,) for (line,loc,) in zip(lines,locations)],));
+      address += len(lines);
+    return instructions;
+
+  ################################################################################
+  #
+  # Write the listing.
+  #
+  ################################################################################
+
+  def WriteFunctions(self,fp):
+    """
+    Write the table of functions followed by the instructions of each
+    function.
+    """
+    functions = self.ad.functionEvaluation;
+    wcet = asmWCET(self.ad,self.loopBounds);
+    fp.write('Functions\n');
+    width = max([len(name) for name in functions]+[len('function')]);
+    fp.write('  %-*s %7s %6s %8s\n' % (width,'function','address','length','cycles',));
+    for (name,function,) in functions.iteritems():
+      try:
+        cycles = '%d' % wcet.FunctionWCET(name);
+      except asmDef.AsmException:
+        cycles = '-';
+      fp.write('  %-*s  0x%04X %6d %8s\n' % (width,name,function['address'],function['length'],cycles,));
+    for (name,address,lines,) in self.Instructions():
+      fp.write('\n%s at 0x%04X, %d instructions\n' % (name,address,len(lines),));
+      lastLine = None;
+      for (opcode,description,loc,) in lines:
+        if loc:
+          (filename,lineNumber,text,) = self.SourceLine(loc);
+          source = '%s:%d' % (filename,lineNumber,);
+          if (filename,lineNumber,) != lastLine:
+            source += '  ' + text;
+            lastLine = (filename,lineNumber,);
+        else:
+          source = '';
+        fp.write(('  %04X  %-3s  %-32s %s' % (address,opcode,description,source,)).rstrip() + '\n');
+        address += 1;
+
+  def WriteMemories(self,fp,packing):
+    """
+    Write the memory map.\n
+    packing     optional dictionary of the HDL packing of each memory with the
+                HDL memory name, the offset and the ratio of its port within
+                the HDL memory, and its lane, ratio, and number of words as per
+                ssbccConfig.MemoryPacking\n
+    The HDL address of each memory address is the port offset plus the port
+    ratio times the memory address plus the lane.
+    """
+    memories = self.ad.memories;
+    fp.write('\nMemory map\n');
+    if not memories['list']:
+      fp.write('  no memories\n');
+    for ixMem in range(len(memories['list'])):
+      name = memories['list'][ixMem];
+      fp.write('\n%s %s, bank %d, %d of %s bytes\n' % (memories['type'][ixMem],name,memories['bank'][ixMem],memories['length'][ixMem],self.ad.symbolDict['size'].get(name,'-'),));
+      if packing and (name in packing):
+        thisPacking = packing[name];
+        fp.write('  packed in %s at 0x%X+%d*address+%d, ratio %d, %d words\n' % (thisPacking['memName'],thisPacking['offset'],thisPacking['portRatio'],thisPacking['lane'],thisPacking['ratio'],thisPacking['nWords'],));
+      variables = [(symbol['body']['start'],len(symbol['body']['value']),variableName,) for (variableName,symbol,) in self.ad.symbols.iteritems() if (symbol['type'] == 'variable') and (symbol['body']['memory'] == name)];
+      for (start,length,variableName,) in sorted(variables):
+        fp.write('  0x%02X %4d  %s\n' % (start,length,variableName,));
+
+  def WriteSummary(self,fp,instructionLength):
+    """
+    Write the instruction and memory utilization.
+    """
+    memories = self.ad.memories;
+    fp.write('\nUtilization\n');
+    fp.write('  %-16s %5d of %5d (%.1f%%)\n' % ('instructions',self.program['length'],instructionLength,100.0*self.program['length']/instructionLength,));
+    for ixMem in range(len(memories['list'])):
+      name = memories['list'][ixMem];
+      maxLength = self.ad.symbolDict['size'].get(name);
+      if maxLength:
+        fp.write('  %-16s %5d of %5d (%.1f%%)\n' % ('%s %s' % (memories['type'][ixMem],name,),memories['length'][ixMem],maxLength,100.0*memories['length'][ixMem]/maxLength,));
+      else:
+        fp.write('  %-16s %5d\n' % ('%s %s' % (memories['type'][ixMem],name,),memories['length'][ixMem],));
+
+  def Report(self,fp,instructionLength=2**13,packing=None):
+    """
+    Write the listing, the memory map, and the utilization.\n
+    fp                  file object for the listing
+    instructionLength   size of the instruction memory
+    packing             optional HDL packing of the memories (see
+                        WriteMemories)
+    """
+    self.WriteFunctions(fp);
+    self.WriteMemories(fp,packing);
+    self.WriteSummary(fp,instructionLength);
+
+  ################################################################################
+  #
+  # Write the debug information.
+  #
+  ################################################################################
+
+  def DebugInfo(self,instructionLength=2**13,packing=None):
+    """
+    Return the debug information as a dictionary with the following content:
+      program       length of the program, size of the instruction memory,
+                    the reset and interrupt vectors, i.e., the addresses where
+                    execution starts after a reset and when an interrupt is
+                    taken (the address of ".interrupt" or None), and the
+                    address of ".main"
+      functions     address and length of each function
+      labels        address of each label within each function
+      instructions  list of the instructions in address order with the
+                    function, opcode, metacode description, and source file
+                    and line of each instruction
+                    Note:  The function and the source are None for the
+                           reset vector at the start of the program.
+      memories      list of the memories with their type, bank, used and
+                    declared lengths, and optional HDL packing (see
+                    WriteMemories)
+      variables     memory, bank, offset, and length of each variable
+      constants     list of the values of each constant
+      inports       index of each input port
+      outports      index of each output port
+      outstrobes    index of each strobe-only output port
+    """
+    functions = self.ad.functionEvaluation;
+    memories = self.ad.memories;
+    info = collections.OrderedDict();
+    info['program'] = collections.OrderedDict([
+      ('length',self.program['length'],),
+      ('instructionLength',instructionLength,),
+      ('resetVector',0,),
+      ('interruptVector',self.program['interrupt'],),
+      ('main',self.program['main'],),
+    ]);
+    info['functions'] = collections.OrderedDict();
+    info['labels'] = collections.OrderedDict();
+    for (name,function,) in functions.iteritems():
+      info['functions'][name] = collections.OrderedDict([('address',function['address'],),('length',function['length'],),]);
+      info['labels'][name] = collections.OrderedDict();
+      for token in function['body']:
+        if token['type'] == 'label':
+          info['labels'][name][token['value']] = function['address'] + token['offset'];
+    info['instructions'] = list();
+    for (name,address,lines,) in self.Instructions():
+      for (opcode,description,loc,) in lines:
+        (filename,lineNumber,) = self.SourceLine(loc)[0:2] if loc else (None,None,);
+        info['instructions'].append(collections.OrderedDict([
+          ('address',address,),
+          ('function',name if name in functions else None,),
+          ('opcode',opcode,),
+          ('description',description,),
+          ('file',filename,),
+          ('line',lineNumber,),
+        ]));
+        address += 1;
+    info['memories'] = list();
+    for ixMem in range(len(memories['list'])):
+      name = memories['list'][ixMem];
+      info['memories'].append(collections.OrderedDict([
+        ('name',name,),
+        ('type',memories['type'][ixMem],),
+        ('bank',memories['bank'][ixMem],),
+        ('length',memories['length'][ixMem],),
+        ('maxLength',self.ad.symbolDict['size'].get(name),),
+        ('packing',packing.get(name) if packing else None,),
+      ]));
+    info['variables'] = collections.OrderedDict();
+    info['constants'] = collections.OrderedDict();
+    for portType in ('inports','outports','outstrobes',):
+      info[portType] = collections.OrderedDict();
+    for (name,symbol,) in self.ad.symbols.iteritems():
+      if symbol['type'] == 'variable':
+        body = symbol['body'];
+        info['variables'][name] = collections.OrderedDict([
+          ('memory',body['memory'],),
+          ('bank',memories['bank'][memories['list'].index(body['memory'])],),
+          ('offset',body['start'],),
+          ('length',len(body['value']),),
+        ]);
+      elif symbol['type'] == 'constant':
+        info['constants'][name] = list(symbol['body']);
+      elif symbol['type'] in ('inport','outport','outstrobe',):
+        info[symbol['type']+'s'][name] = symbol['body'];
+    return info;
+
+  def WriteDebugInfo(self,fp,instructionLength=2**13,packing=None):
+    """
+    Write the debug information as per DebugInfo as a JSON file.
+    """
+    json.dump(self.DebugInfo(instructionLength,packing),fp,indent=1);
+    fp.write('\n');
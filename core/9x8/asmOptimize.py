@@ -0,0 +1,548 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Peephole optimizer for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import collections
+import copy
+
+import asmDef
+from asmWCET import asmWCET
+
+class asmOptimize:
+  """
+  Peephole optimizer for the function bodies recorded by
+  asmDef_9x8.FillRawTokens.\n
+  Each rule replaces a short sequence of tokens with a shorter sequence that
+  has the same effect on the data stack, the return stack, the memories, and
+  the I/O ports.  A sequence never includes a label, so code reached by a jump
+  is not changed, and the macros that jump, call, or return are never part of a
+  sequence.  The rules are applied repeatedly until none of them match so that,
+  for example, "over over drop drop" is removed in two steps.\n
+  A ".call" immediately followed by a ".return" with an empty delay slot is a
+  tail call and is replaced by a ".jump" to the function so that the function
+  returns directly to the caller's caller (see TailCall).\n
+  After the rules have been applied, the "nop" delay slots of the ".call",
+  ".jump", and ".return" macros are filled with the single-instruction token
+  immediately preceding the macro (see FillDelaySlots).\n
+  The bodies before optimization are retained so that the report can compare
+  the worst-case execution times with and without the optimizations.
+  """
+
+  # Macros whose optional argument is the last instruction executed by the
+  # macro and has no other role in the macro.
+  trailingArgumentMacros = ('.outport','.storeindexed','.storeoffset','.storevalue',);
+
+  # Control transfer macros whose delay slot can be filled by the preceding
+  # instruction and whether or not that instruction can use the return stack.
+  # The ".jumpc" and ".callc" macros are not listed because their condition is
+  # the top of the data stack when the jumpc or callc executes, so moving any
+  # instruction that changes the data stack past them changes the condition.
+  delaySlotMacros = { '.call' : False, '.jump' : True, '.return' : False, };
+
+  def __init__(self,ad):
+    """
+    Initialize the optimizer.\n
+    ad          asmDef_9x8 object after all of the directive bodies have been
+                processed by FillRawTokens
+    """
+    self.ad = ad;
+    self.binaryOperations = {
+      '&'       : lambda a,b : a & b,
+      '+'       : lambda a,b : a + b,
+      '-'       : lambda a,b : a - b,
+      '^'       : lambda a,b : a ^ b,
+      'or'      : lambda a,b : a | b,
+    };
+    self.unaryOperations = {
+      '-1<>'    : lambda a : 0xFF if a != 0xFF else 0x00,
+      '-1='     : lambda a : 0xFF if a == 0xFF else 0x00,
+      '0<>'     : lambda a : 0xFF if a != 0x00 else 0x00,
+      '0='      : lambda a : 0xFF if a == 0x00 else 0x00,
+      '0>>'     : lambda a : a >> 1,
+      '1+'      : lambda a : a + 1,
+      '1-'      : lambda a : a - 1,
+      '1>>'     : lambda a : 0x80 | (a >> 1),
+      '<<0'     : lambda a : a << 1,
+      '<<1'     : lambda a : (a << 1) | 0x01,
+      '<<msb'   : lambda a : (a << 1) | (a >> 7),
+    };
+    # Each rule is a name for the report, the list of token patterns to match,
+    # and the method that returns the replacement tokens or None if the matched
+    # tokens cannot be replaced.  The token patterns are as per Match.
+    self.rules = list();
+    for (pattern,replacement,) in (
+        (('swap','swap',),      (),),
+        (('>r','r>',),          (),),
+        (('r>','>r',),          (),),
+        (('dup','drop',),       (),),
+        (('over','drop',),      (),),
+        (('r@','drop',),        (),),
+        (('dup','nip',),        (),),
+        (('dup','swap',),       ('dup',),),
+        (('swap','drop',),      ('nip',),),
+        (('swap','nip',),       ('drop',),),
+        (('0<>','0<>',),        ('0<>',),),
+        (('0=','0<>',),         ('0=',),),
+        (('0<>','0=',),         ('0=',),),
+      ):
+      self.rules.append((' '.join(pattern),pattern,lambda tokens,replacement=replacement : self.Instructions(tokens,replacement),));
+    self.rules.append(('push drop',('push','drop',),lambda tokens : list(),));
+    for op in sorted(self.binaryOperations):
+      self.rules.append(('fold N T %s' % op,('literal','literal',op,),self.FoldBinary,));
+    for op in sorted(self.binaryOperations):
+      self.rules.append(('simplify T %s' % op,('literal',op,),self.Simplify,));
+    for op in sorted(self.unaryOperations):
+      self.rules.append(('fold T %s' % op,('literal',op,),self.FoldUnary,));
+    # The rules for the macros are applied after the other rules so that, for
+    # example, "swap swap" is removed instead of moving the first "swap" into
+    # the optional argument of a preceding macro.
+    self.macroRules = list();
+    self.macroRules.append(('fill macro argument',('trailing','instruction',),self.FillArgument,));
+    self.macroRules.append(('.storevalue .fetchvalue',('.storevalue','.fetchvalue',),self.StoreFetch,));
+    self.macroRules.append(('tail call',('.call','.return',),self.TailCall,));
+    # Savings and the bodies before optimization.
+    self.original = dict();
+    self.applied = dict();
+    self.delaySlots = dict();
+
+  ################################################################################
+  #
+  # Match the token patterns.
+  #
+  ################################################################################
+
+  def Literal(self,token):
+    """
+    Return the byte pushed onto the data stack by the token or None if the token
+    is not a single numeric value.
+    """
+    if token['type'] == 'value':
+      return token['value'] & 0xFF;
+    if token['type'] == 'constant':
+      body = self.ad.symbols[token['value']]['body'];
+      if len(body) == 1:
+        return body[0] & 0xFF;
+    return None;
+
+  def Match(self,pattern,token):
+    """
+    Indicate whether or not the token matches the pattern, where the pattern is
+    one of the following:
+      'instruction'     any instruction
+      'literal'         push of a single numeric value
+      'push'            push of a single value, i.e., a number, a constant, a
+                        port address, a parameter, or a variable address
+      'trailing'        a macro listed in trailingArgumentMacros
+      '.name'           the named macro
+      name              the named instruction
+    """
+    if pattern == 'instruction':
+      return token['type'] == 'instruction';
+    if pattern == 'literal':
+      return self.Literal(token) != None;
+    if pattern == 'push':
+      if token['type'] in ('inport','outport','outstrobe','parameter','value','variable',):
+        return True;
+      return self.Literal(token) != None;
+    if pattern == 'trailing':
+      return (token['type'] == 'macro') and (token['value'] in self.trailingArgumentMacros);
+    if pattern[0] == '.':
+      return (token['type'] == 'macro') and (token['value'] == pattern);
+    return (token['type'] == 'instruction') and (token['value'] == pattern);
+
+  ################################################################################
+  #
+  # Construct the replacement tokens.
+  #
+  ################################################################################
+
+  def Instructions(self,tokens,names):
+    """
+    Return the listed instructions located at the first matched token.
+    """
+    return [dict(type='instruction', value=name, loc=tokens[0]['loc']) for name in names];
+
+  def Value(self,tokens,value):
+    """
+    Return the push of the value located at the first matched token.
+    """
+    return [dict(type='value', value=value & 0xFF, loc=tokens[0]['loc'])];
+
+  def FoldBinary(self,tokens):
+    """
+    Replace the push of two numbers and an arithmetic or logical instruction by
+    the push of the result.
+    """
+    return self.Value(tokens,self.binaryOperations[tokens[2]['value']](self.Literal(tokens[0]),self.Literal(tokens[1])));
+
+  def FoldUnary(self,tokens):
+    """
+    Replace the push of a number and an instruction that only changes the top
+    of the data stack by the push of the result.
+    """
+    return self.Value(tokens,self.unaryOperations[tokens[1]['value']](self.Literal(tokens[0])));
+
+  def Simplify(self,tokens):
+    """
+    Remove the addition, subtraction, or logical operation with a number that
+    does not change the top of the data stack and replace adding or subtracting
+    1 by the equivalent single instruction.
+    """
+    value = self.Literal(tokens[0]);
+    op = tokens[1]['value'];
+    if (value == 0x00 and op in ('+','-','^','or',)) or (value == 0xFF and op == '&'):
+      return list();
+    if (value == 0x01 and op == '+') or (value == 0xFF and op == '-'):
+      return self.Instructions(tokens,('1+',));
+    if (value == 0x01 and op == '-') or (value == 0xFF and op == '+'):
+      return self.Instructions(tokens,('1-',));
+    return None;
+
+  def FillArgument(self,tokens):
+    """
+    Move the instruction following a macro into the macro's optional trailing
+    argument when that argument is a "nop".
+    """
+    argument = tokens[0]['argument'][-1];
+    if (argument['type'] != 'instruction') or (argument['value'] != 'nop'):
+      return None;
+    macro = copy.copy(tokens[0]);
+    macro['argument'] = tokens[0]['argument'][:-1] + [dict(type='instruction', value=tokens[1]['value'], loc=tokens[1]['loc'])];
+    return [macro];
+
+  def StoreFetch(self,tokens):
+    """
+    Keep the stored value on the data stack instead of dropping it and fetching
+    it from the same variable.\n
+    Note:  This is not done if there is an interrupt handler since the handler
+           could change the variable between the store and the fetch.
+    """
+    if self.ad.interrupt:
+      return None;
+    (store,fetch,) = tokens;
+    argument = store['argument'][1];
+    if (store['argument'][0]['value'] != fetch['argument'][0]['value']) or (argument['type'] != 'instruction') or (argument['value'] != 'drop'):
+      return None;
+    macro = copy.copy(store);
+    macro['argument'] = [store['argument'][0],dict(type='instruction', value='nop', loc=argument['loc'])];
+    return [macro];
+
+  def UsesReturnStack(self,token):
+    """
+    Indicate whether or not the token, which is a macro argument, can access the
+    return stack.
+    """
+    if token['type'] == 'instruction':
+      return token['value'] in ('>r','r>','r@',);
+    if token['type'] == 'macro':
+      return not self.ad.IsBuiltInMacro(token['value']);
+    return False;
+
+  def ReadsReturnAddress(self,name):
+    """
+    Indicate whether or not the named function can access its return address or
+    the return stack below it.\n
+    The instructions are scanned in the order they appear in the function body
+    and the number of values the function has pushed onto the return stack must
+    be positive whenever "r>" or "r@" is executed.  The call and return macros
+    change the return stack for their delay slots.  This is conservative
+    since the paths through the function are not followed and since
+    user-defined macros could use the return stack.
+    """
+    depth = 0;
+    for token in self.ad.symbols[name]['body']['tokens']:
+      if token['type'] == 'instruction':
+        executed = [token];
+        delta = 0;
+      elif token['type'] == 'macro':
+        executed = [token] + [arg for arg in token['argument'] if arg['type'] in ('instruction','macro',)];
+        delta = { '.call' : 1, '.callc' : 1, '.return' : -1, '.returni' : -1, }.get(token['value'],0);
+      else:
+        continue;
+      depth += delta;
+      for instruction in executed:
+        if instruction['type'] == 'macro':
+          if not self.ad.IsBuiltInMacro(instruction['value']):
+            return True;
+        elif instruction['value'] == '>r':
+          depth += 1;
+        elif instruction['value'] in ('r>','r@',):
+          if depth <= 0:
+            return True;
+          if instruction['value'] == 'r>':
+            depth -= 1;
+      depth -= delta;
+    return False;
+
+  def TailCall(self,tokens):
+    """
+    Replace a ".call" followed by a ".return" with an empty delay slot by a
+    ".jump" to the function with the same delay slot.\n
+    The function then returns directly to the caller's caller, which saves the
+    return, its delay slot, and one level of the return stack.  The ".jump" is
+    marked as a tail call so that the function address is used for its target
+    and so that the analyses include the function.\n
+    Note:  This is not done if the delay slot of the ".return" is not empty
+           since it has to be executed after the function returns, if the delay
+           slot of the ".call" uses the return stack since the call's return
+           address is no longer on the return stack, or if the function can
+           read its return address.
+    """
+    (call,ret,) = tokens;
+    slot = ret['argument'][0];
+    if (slot['type'] != 'instruction') or (slot['value'] != 'nop'):
+      return None;
+    if self.UsesReturnStack(call['argument'][1]):
+      return None;
+    if self.ReadsReturnAddress(call['argument'][0]['value']):
+      return None;
+    macro = copy.copy(call);
+    macro['value'] = '.jump';
+    macro['tailCall'] = True;
+    return [macro];
+
+  ################################################################################
+  #
+  # Identify the required functions and their calls.
+  #
+  ################################################################################
+
+  def CalledFunction(self,token):
+    """
+    Return the name of the function called by the token or None if the token
+    is not a call.
+    """
+    if (token['type'] == 'macro') and ((token['value'] in ('.call','.callc',)) or token.get('tailCall')):
+      return token['argument'][0]['value'];
+    return None;
+
+  def Callees(self,body):
+    """
+    Return the list of the functions called by the body, one entry per call.
+    """
+    return [self.CalledFunction(token) for token in body['tokens'] if self.CalledFunction(token)];
+
+  def Bodies(self):
+    """
+    Return the bodies of ".interrupt", ".main", and the functions they require
+    in the order in which asmDef_9x8.EvaluateFunctionTree places them.\n
+    Note:  Calls to undefined functions are left for EvaluateFunctionTree to
+           report.
+    """
+    bodies = collections.OrderedDict();
+    if self.ad.interrupt:
+      bodies['.interrupt'] = self.ad.interrupt;
+    bodies['.main'] = self.ad.main;
+    names = bodies.keys();
+    ix = 0;
+    while ix < len(names):
+      for callName in self.Callees(bodies[names[ix]]):
+        if (callName in bodies) or not self.ad.IsSymbol(callName) or (self.ad.symbols[callName]['type'] != 'function'):
+          continue;
+        bodies[callName] = self.ad.symbols[callName]['body'];
+        names.append(callName);
+      ix += 1;
+    return bodies;
+
+  def ProgramLength(self,bodies):
+    """
+    Return the length of the program consisting of the bodies, including the
+    jump to ".main" that precedes the interrupt handler.
+    """
+    return (3 if self.ad.interrupt else 0) + sum([body['length'] for body in bodies.itervalues()]);
+
+  ################################################################################
+  #
+  # Optimize the function bodies.
+  #
+  ################################################################################
+
+  def TokenLength(self,token):
+    """
+    Return the number of instructions generated by the token (as per
+    asmDef_9x8.ExpandTokens).
+    """
+    if token['type'] == 'label':
+      return 0;
+    if token['type'] == 'macro':
+      return self.ad.MacroLength(token);
+    if token['type'] == 'constant':
+      return len(self.ad.symbols[token['value']]['body']);
+    return 1;
+
+  def Rewrite(self,tokens,rules,applied):
+    """
+    Apply the rules to the list of tokens until none of them match and
+    accumulate the number of times each rule was applied and the number of
+    instructions it saved in the applied dictionary.
+    """
+    maxPattern = max([len(rule[1]) for rule in rules]);
+    ix = 0;
+    while ix < len(tokens):
+      for (ruleName,pattern,replace,) in rules:
+        matched = tokens[ix:ix+len(pattern)];
+        if len(matched) != len(pattern):
+          continue;
+        if not all([self.Match(p,token) for (p,token,) in zip(pattern,matched)]):
+          continue;
+        replacement = replace(matched);
+        if replacement == None:
+          continue;
+        saved = sum([self.TokenLength(token) for token in matched]) - sum([self.TokenLength(token) for token in replacement]);
+        if saved <= 0:
+          raise Exception('Program Bug -- rule "%s" does not shorten the program' % ruleName);
+        tokens[ix:ix+len(pattern)] = replacement;
+        (count,total,) = applied.get(ruleName,(0,0,));
+        applied[ruleName] = (count+1,total+saved,);
+        # Back up so that the replacement can be part of a new match.
+        ix = max(ix-maxPattern+1,0);
+        break;
+      else:
+        ix += 1;
+
+  def FillDelaySlots(self,name,tokens,applied):
+    """
+    Move the single-instruction token preceding a ".call", ".jump", or ".return"
+    macro into the macro's delay slot when the delay slot is a "nop".\n
+    The push of the target address and the jump or call cancel on the data
+    stack and the return does not change the data stack, so the moved
+    instruction sees the same T, N, and data stack.  The call and return change
+    the return stack before the delay slot, so instructions that use the return
+    stack are not moved into their delay slots.  The token cannot be preceded
+    by the macro's own label without also moving the label, which is allowed,
+    but it cannot be separated from the macro by a label.  Explicit "nop"
+    instructions are not moved since they are usually there for timing.
+    """
+    nFilled = 0;
+    nEmpty = 0;
+    for ix in range(len(tokens)):
+      token = tokens[ix];
+      if (token['type'] != 'macro') or (token['value'] not in self.delaySlotMacros):
+        continue;
+      slot = token['argument'][-1];
+      if (slot['type'] != 'instruction') or (slot['value'] != 'nop'):
+        continue;
+      nEmpty += 1;
+      if ix == 0:
+        continue;
+      previous = tokens[ix-1];
+      if previous['type'] == 'instruction':
+        if previous['value'] == 'nop':
+          continue;
+        if (previous['value'] in ('>r','r>','r@',)) and not self.delaySlotMacros[token['value']]:
+          continue;
+      elif previous['type'] == 'macro':
+        if (self.ad.MacroLength(previous) != 1) or not self.ad.IsSingleMacro(previous['value']):
+          continue;
+      elif not self.Match('push',previous):
+        continue;
+      macro = copy.copy(token);
+      macro['argument'] = token['argument'][:-1] + [previous];
+      tokens[ix-1:ix+1] = [None,macro];
+      nFilled += 1;
+    tokens[:] = [token for token in tokens if token != None];
+    if nFilled:
+      ruleName = 'fill delay slot';
+      (count,total,) = applied.get(ruleName,(0,0,));
+      applied[ruleName] = (count+nFilled,total+nFilled,);
+    self.delaySlots[name] = (nFilled,nEmpty-nFilled,);
+
+  def OptimizeBody(self,name,body):
+    """
+    Apply the rules to the body (as per asmDef_9x8.ExpandTokens) of the named
+    function and update its token list, offsets, and length.
+    """
+    tokens = list(body['tokens']);
+    applied = collections.OrderedDict();
+    self.Rewrite(tokens,self.rules,applied);
+    self.Rewrite(tokens,self.rules+self.macroRules,applied);
+    self.FillDelaySlots(name,tokens,applied);
+    if not applied:
+      return;
+    self.original[name] = dict(tokens=body['tokens'], length=body['length']);
+    self.applied[name] = applied;
+    self.Relocate(body,tokens);
+
+  def Relocate(self,body,tokens):
+    """
+    Replace the tokens of the body (as per asmDef_9x8.ExpandTokens) and
+    recompute their offsets and the length of the body.
+    """
+    offset = 0;
+    for (ixToken,token,) in enumerate(tokens):
+      token = copy.copy(token);
+      token['offset'] = offset;
+      tokens[ixToken] = token;
+      offset += self.TokenLength(token);
+    body['tokens'] = tokens;
+    body['length'] = offset;
+
+  def Optimize(self):
+    """
+    Optimize the bodies of ".main", the optional ".interrupt", and the
+    functions.\n
+    Note:  This must be done before asmDef_9x8.EvaluateFunctionTree computes
+           the function addresses.
+    """
+    self.OptimizeBody('.main',self.ad.main);
+    if self.ad.interrupt:
+      self.OptimizeBody('.interrupt',self.ad.interrupt);
+    for name in sorted(self.ad.symbols):
+      if self.ad.symbols[name]['type'] == 'function':
+        self.OptimizeBody(name,self.ad.symbols[name]['body']);
+
+  ################################################################################
+  #
+  # Write the report.
+  #
+  ################################################################################
+
+  def Report(self,fp,loopBounds):
+    """
+    Write the number of instructions and the worst-case number of clock cycles
+    saved by the optimizations and the number of delay slots filled for each
+    function in the program followed by the number of times each rule was
+    applied.\n
+    fp          file object for the report
+    loopBounds  dictionary of the "@loop" annotations (see asmWCET)\n
+    The number of clock cycles saved is listed as "-" when the worst-case
+    execution time of the function cannot be bounded.
+    """
+    functions = self.ad.functionEvaluation;
+    before = collections.OrderedDict();
+    for name in functions:
+      if name in self.original:
+        before[name] = dict(body=self.original[name]['tokens'], length=self.original[name]['length'], address=None);
+      else:
+        before[name] = functions[name];
+    wcetBefore = asmWCET(self.ad,loopBounds,functions=before);
+    wcetAfter = asmWCET(self.ad,loopBounds);
+    fp.write('Instructions and worst-case clock cycles saved by the peephole optimizer\n');
+    width = max([len(name) for name in functions]+[len('function')]);
+    fp.write('  %-*s %12s %8s %12s\n' % (width,'function','instructions','cycles','delay slots',));
+    totals = collections.OrderedDict();
+    slots = [0,0];
+    for name in functions:
+      saved = sum([total for (count,total,) in self.applied.get(name,dict()).itervalues()]);
+      try:
+        cycles = '%d' % (wcetBefore.FunctionWCET(name) - wcetAfter.FunctionWCET(name));
+      except asmDef.AsmException:
+        cycles = '-';
+      (nFilled,nEmpty,) = self.delaySlots[name];
+      slots = [slots[0]+nFilled,slots[1]+nEmpty];
+      fp.write('  %-*s %12d %8s %12s\n' % (width,name,saved,cycles,'%d of %d' % (nFilled,nFilled+nEmpty,),));
+      for (ruleName,(count,total,),) in self.applied.get(name,dict()).iteritems():
+        (allCount,allTotal,) = totals.get(ruleName,(0,0,));
+        totals[ruleName] = (allCount+count,allTotal+total,);
+    fp.write('  %-*s %12d %8s %12s\n' % (width,'total',sum([total for (count,total,) in totals.itervalues()]),'','%d of %d' % (slots[0],slots[0]+slots[1],),));
+    if not totals:
+      return;
+    fp.write('\nRules applied\n');
+    width = max([len(name) for name in totals]+[len('rule')]);
+    fp.write('  %-*s %6s %12s\n' % (width,'rule','count','instructions',));
+    for ruleName in sorted(totals):
+      fp.write('  %-*s %6d %12d\n' % (width,ruleName,totals[ruleName][0],totals[ruleName][1],));
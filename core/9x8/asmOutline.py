@@ -0,0 +1,247 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Procedural abstraction for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import collections
+import copy
+
+import asmDef
+from asmOptimize import asmOptimize
+from asmWCET import asmWCET
+
+class asmOutline(asmOptimize):
+  """
+  Reduce the program length by replacing repeated sequences of tokens with
+  calls to generated functions.\n
+  The sequences are found within the bodies of ".main", ".interrupt", and the
+  functions they require.  A sequence cannot include a label, so code reached
+  by a jump is never moved into a generated function, and cannot include the
+  macros that jump, call, or return, the instructions that use the return
+  stack, or user-defined macros.  The repeated sequences are found by grouping
+  the sequences of each length by their first tokens, starting with single
+  tokens and extending only the groups with at least two members, so that the
+  search takes one pass through the tokens for each length of the longest
+  repeated sequence.  The sequence with the largest reduction in the program
+  length is replaced first and the search is repeated until no sequence
+  reduces the program length.\n
+  The generated functions are named "outline.<n>".  The first and last tokens
+  of the sequence are placed in the delay slots of the ".call" and the
+  ".return" when they are single instructions, so each call of the sequence
+  adds at most 5 clock cycles and one level of the return stack.
+  """
+
+  # Macros that cannot be part of a sequence.
+  controlMacros = ('.call','.callc','.jump','.jumpc','.return','.returni',);
+
+  def __init__(self,ad,loopBounds):
+    """
+    Initialize the outliner.\n
+    ad          asmDef_9x8 object after all of the directive bodies have been
+                processed by FillRawTokens
+    loopBounds  dictionary of the "@loop" annotations (see asmWCET)
+    """
+    asmOptimize.__init__(self,ad);
+    self.loopBounds = loopBounds;
+    self.outlined = collections.OrderedDict();
+    self.before = None;
+    self.after = None;
+
+  ################################################################################
+  #
+  # Find the repeated sequences.
+  #
+  ################################################################################
+
+  def Key(self,token):
+    """
+    Return a hashable key for the token that excludes its location and offset.
+    """
+    return (token['type'],token['value'],token.get('range'),tuple([self.Key(arg) for arg in token.get('argument',list())]),);
+
+  def IsOutlinable(self,token):
+    """
+    Indicate whether or not the token can be part of an outlined sequence.
+    """
+    if token['type'] == 'label':
+      return False;
+    if token['type'] == 'instruction':
+      return token['value'] not in ('>r','r>','r@',);
+    if token['type'] == 'macro':
+      if token['value'] in self.controlMacros:
+        return False;
+      return self.ad.IsBuiltInMacro(token['value']) and not any([self.UsesReturnStack(arg) for arg in token['argument']]);
+    return True;
+
+  def IsSlot(self,token):
+    """
+    Indicate whether or not the token can be the delay slot of a ".call" or a
+    ".return".
+    """
+    return (self.TokenLength(token) == 1) and ((token['type'] != 'macro') or self.ad.IsSingleMacro(token['value']));
+
+  def Savings(self,tokens,nCalls):
+    """
+    Return the reduction in the program length from replacing nCalls copies of
+    the sequence of tokens by calls to a generated function.
+    """
+    length = sum([self.TokenLength(token) for token in tokens]);
+    functionLength = length + 2;
+    if self.IsSlot(tokens[0]):
+      functionLength -= 1;
+    if self.IsSlot(tokens[-1]):
+      functionLength -= 1;
+    return nCalls*(length-3) - functionLength;
+
+  def Best(self,bodies):
+    """
+    Return the repeated sequence with the largest reduction in the program
+    length as a tuple of the reduction, the number of tokens in the sequence,
+    and the list of (name,index) locations of its non-overlapping copies, or
+    None if no sequence reduces the program length.
+    """
+    # Assign a number to each distinct token and list the positions where a
+    # sequence can start along with the end of the run of outlinable tokens.
+    tokenIds = dict();
+    ids = dict();
+    groups = collections.OrderedDict();
+    for (name,body,) in bodies.iteritems():
+      if name in self.outlined:
+        continue;
+      tokens = body['tokens'];
+      ids[name] = [tokenIds.setdefault(self.Key(token),len(tokenIds)) if self.IsOutlinable(token) else None for token in tokens];
+      for ix in range(len(tokens)):
+        if ids[name][ix] != None:
+          groups.setdefault(ids[name][ix],list()).append((name,ix,));
+    best = None;
+    length = 1;
+    while groups:
+      # Extend the groups with more than one member by the next token.
+      extended = collections.OrderedDict();
+      for (key,positions,) in groups.iteritems():
+        if len(positions) < 2:
+          continue;
+        for (name,ix,) in positions:
+          if ix+length >= len(ids[name]) or ids[name][ix+length] == None:
+            continue;
+          extended.setdefault((key,ids[name][ix+length],),list()).append((name,ix,));
+      length += 1;
+      groups = collections.OrderedDict();
+      for (key,positions,) in extended.iteritems():
+        if len(positions) < 2:
+          continue;
+        groups[len(groups)] = positions;
+        # Keep the copies that do not overlap.
+        copies = list();
+        for (name,ix,) in positions:
+          if copies and (copies[-1][0] == name) and (ix < copies[-1][1]+length):
+            continue;
+          copies.append((name,ix,));
+        (name,ix,) = copies[0];
+        savings = self.Savings(bodies[name]['tokens'][ix:ix+length],len(copies));
+        if (savings > 0) and ((best == None) or (savings > best[0])):
+          best = (savings,length,copies,);
+    return best;
+
+  ################################################################################
+  #
+  # Replace the sequences with calls.
+  #
+  ################################################################################
+
+  def Outline(self):
+    """
+    Replace the repeated sequences with calls to generated functions.\n
+    Note:  This must be done before asmDef_9x8.EvaluateFunctionTree computes
+           the function addresses.
+    """
+    self.before = self.Snapshot(self.Bodies());
+    while True:
+      bodies = self.Bodies();
+      best = self.Best(bodies);
+      if not best:
+        break;
+      (savings,length,copies,) = best;
+      (name,ix,) = copies[0];
+      sequence = bodies[name]['tokens'][ix:ix+length];
+      functionName = 'outline.%d' % (len(self.outlined)+1);
+      loc = sequence[0]['loc'];
+      callSlot = dict(type='instruction', value='nop', loc=loc);
+      tokens = list(sequence);
+      if self.IsSlot(tokens[0]):
+        callSlot = tokens.pop(0);
+      returnSlot = dict(type='instruction', value='nop', loc=loc);
+      if tokens and self.IsSlot(tokens[-1]):
+        returnSlot = tokens.pop();
+      tokens.append(dict(type='macro', value='.return', argument=[returnSlot], loc=loc));
+      body = dict();
+      self.Relocate(body,tokens);
+      self.ad.AddSymbol(functionName,'function',body=body);
+      # Replace the copies starting with the last one in each body so that the
+      # indices of the other copies in the body do not change.
+      for (name,ix,) in reversed(copies):
+        call = dict(type='macro', value='.call', argument=[dict(type='symbol', value=functionName, loc=loc),callSlot], loc=bodies[name]['tokens'][ix]['loc']);
+        tokens = list(bodies[name]['tokens']);
+        tokens[ix:ix+length] = [call];
+        self.Relocate(bodies[name],tokens);
+      self.outlined[functionName] = dict(sequence=sequence, calls=len(copies), savings=savings);
+    self.after = self.Snapshot(self.Bodies());
+
+  ################################################################################
+  #
+  # Write the report.
+  #
+  ################################################################################
+
+  def Snapshot(self,bodies):
+    """
+    Return the function bodies and lengths in the form used by asmWCET.
+    """
+    return collections.OrderedDict((name,dict(body=body['tokens'], length=body['length'], address=None),) for (name,body,) in bodies.iteritems());
+
+  def TokenText(self,token):
+    """
+    Return the assembly text for the token.
+    """
+    if token['type'] == 'value':
+      return '0x%02X' % token['value'];
+    if token['type'] == 'parameter':
+      return token['value'] + token['range'];
+    if token['type'] == 'macro':
+      return '%s(%s)' % (token['value'],','.join([self.TokenText(arg) for arg in token['argument']]),);
+    return str(token['value']);
+
+  def Report(self,fp):
+    """
+    Write the number of instructions saved and the worst-case number of clock
+    cycles added in each function followed by the generated functions and the
+    outlined sequences.\n
+    fp          file object for the report\n
+    The number of clock cycles added is listed as "-" when the worst-case
+    execution time of the function cannot be bounded.  The total is the number
+    of instructions saved less the lengths of the generated functions.
+    """
+    wcetBefore = asmWCET(self.ad,self.loopBounds,functions=self.before);
+    wcetAfter = asmWCET(self.ad,self.loopBounds,functions=self.after);
+    fp.write('Instructions saved and worst-case clock cycles added by outlining\n');
+    width = max([len(name) for name in self.after]+[len('function')]);
+    fp.write('  %-*s %12s %8s\n' % (width,'function','instructions','cycles',));
+    for name in self.after:
+      if name in self.outlined:
+        continue;
+      saved = self.before[name]['length'] - self.after[name]['length'];
+      try:
+        cycles = '%d' % (wcetAfter.FunctionWCET(name) - wcetBefore.FunctionWCET(name));
+      except asmDef.AsmException:
+        cycles = '-';
+      fp.write('  %-*s %12d %8s\n' % (width,name,saved,cycles,));
+    fp.write('  %-*s %12d\n' % (width,'total',sum([outlined['savings'] for outlined in self.outlined.itervalues()]),));
+    if not self.outlined:
+      return;
+    fp.write('\nOutlined sequences\n');
+    fp.write('  %-*s %6s %6s %6s  %s\n' % (width,'function','length','calls','saved','sequence',));
+    for (name,outlined,) in self.outlined.iteritems():
+      fp.write('  %-*s %6d %6d %6d  %s\n' % (width,name,self.after[name]['length'],outlined['calls'],outlined['savings'],' '.join([self.TokenText(token) for token in outlined['sequence']]),));
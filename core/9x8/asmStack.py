@@ -0,0 +1,232 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Static data stack and return stack depth analysis for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import asmDef
+from asmWCET import asmWCET
+
+class asmStack(asmWCET):
+  """
+  Maximum data stack or return stack depth of the functions identified by
+  asmDef_9x8.EvaluateFunctionTree.\n
+  The stack effects are computed from the opcodes in the program image so that
+  the instructions generated by user-defined macros are included.  The depths
+  are relative to the depth when the function is entered and the depth of a
+  called function is added to the depth at its call.  This uses the same
+  control flow graph and loop analysis as asmWCET except that loops that do not
+  increase the stack depth do not need a bound and loops without an exit must
+  not increase the stack depth.\n
+  A loop that decreases the stack depth, such as a loop outputting a string from
+  the data stack, is assumed to be executed once unless its "@loop" annotation
+  states the minimum number of passes.  These loops are recorded in
+  unboundedLoops since the depths after them can be overestimated.
+  """
+
+  peakRequired = True;
+  # Decrease of the stack depth by a loop in the optimistic analysis, which is
+  # deeper than any stack.
+  unboundedDepth = 2**16;
+
+  def __init__(self,ad,loopBounds,program,stack,optimistic=False):
+    """
+    Initialize the analysis.\n
+    ad          asmDef_9x8 object after EvaluateFunctionTree
+    loopBounds  dictionary of the "@loop" annotations (see asmWCET)
+    program     program body as per asmDef_9x8.ProgramImage
+    stack       'data' or 'return'
+    optimistic  if True, the loops that decrease the stack depth without a
+                minimum number of passes are assumed to empty the stack so that
+                the depths that do not depend on them can be identified
+    """
+    asmWCET.__init__(self,ad,loopBounds);
+    if stack not in ('data','return',):
+      raise Exception('Program Bug -- unrecognized stack "%s"' % stack);
+    self.stack = stack;
+    self.optimistic = optimistic;
+    self.unboundedLoops = list();
+    self.metricName = 'The %s stack depth' % stack;
+    self.opcodes = list();
+    for line in program:
+      if line[0] == '-':
+        continue;
+      elif line[0] == 'p':
+        self.opcodes.append(0x100);
+      else:
+        self.opcodes.append(int(line[0:3],16));
+
+  def Effect(self,opcode):
+    """
+    Return the change in the stack depth for the opcode.\n
+    Note:  The conditional call is treated as a call, see BlockCost.
+    """
+    if opcode & 0x100:                          # push
+      return 1 if self.stack == 'data' else 0;
+    if opcode & 0x080:                          # jump, jumpc, call, callc
+      if self.stack == 'data':
+        return -1;
+      return 1 if opcode & 0x040 else 0;
+    group = (opcode >> 3) & 0xF;
+    if self.stack == 'data':
+      return (0,1,0,-1,0,0,0,-1,-1,1,-1,0,-1,0,-1,1,)[group];
+    else:
+      return (0,0,0,0,0,-1,0,0,1,-1,0,0,0,0,0,0,)[group];
+
+  def BlockCost(self,name,node):
+    """
+    Return the net change and the peak of the stack depth over the block as an
+    ordered tuple.\n
+    A called function starts after the delay slot of the call.  The stack depth
+    after a conditional call is the larger of the depths with and without the
+    call.  A jump reached while a function listed for the block has not been
+    called is a tail call made by the optimizer and the function starts after
+    the delay slot of the jump.
+    """
+    graph = self.Graph(name);
+    address = self.functions[name]['address'] + node;
+    calls = list(graph['calls'][node]);
+    depth = 0;
+    peak = 0;
+    pendingCall = None;
+    for opcode in self.opcodes[address:address+graph['cost'][node]]:
+      depth += self.Effect(opcode);
+      peak = max(peak,depth);
+      if pendingCall:
+        (callName,conditional,) = pendingCall;
+        (calleeNet,calleePeak,) = self.FunctionCost(callName);
+        if calleeNet == None:
+          raise asmDef.AsmException('"%s" does not return' % callName);
+        peak = max(peak,depth+calleePeak);
+        if conditional:
+          depth = max(depth+calleeNet,depth-(1 if self.stack == 'return' else 0));
+        else:
+          depth += calleeNet;
+        pendingCall = None;
+      if (opcode & 0x1C0) == 0x0C0:
+        if not calls:
+          raise Exception('Program Bug -- call not in the function body for "%s"' % name);
+        pendingCall = (calls.pop(0),opcode & 0x020,);
+      elif ((opcode & 0x1E0) == 0x080) and calls:
+        pendingCall = (calls.pop(0),False,);
+    return (depth,peak,);
+
+  def MaxDepth(self):
+    """
+    Return the maximum depth of the stack including the preemption by the
+    interrupt handler at the deepest point of the main program.\n
+    The interrupt pushes the return address onto the return stack and then the
+    interrupt handler is entered with the interrupts disabled.
+    """
+    depth = self.FunctionCost('.main')[1];
+    if '.interrupt' in self.functions:
+      if self.stack == 'return':
+        depth += 1;
+      depth += self.FunctionCost('.interrupt')[1];
+    return depth;
+
+  def UnboundedDecrease(self,name,label,gain):
+    """
+    Record the loop that decreases the stack depth without a minimum number of
+    passes and return the change in the depth after its first pass.
+    """
+    if (name,label,) not in self.unboundedLoops:
+      self.unboundedLoops.append((name,label,));
+    return -self.unboundedDepth if self.optimistic else 0;
+
+################################################################################
+#
+# Compute the required stack sizes and write the report.
+#
+################################################################################
+
+def StackRequirements(ad,loopBounds,program):
+  """
+  Return the stack depth analysis for the data and return stacks.\n
+  ad            asmDef_9x8 object after EvaluateFunctionTree
+  loopBounds    dictionary of the "@loop" annotations (see asmWCET)
+  program       program body as per asmDef_9x8.ProgramImage\n
+  The return is a dictionary indexed by 'data_stack' and 'return_stack' with
+  the following content:
+    analysis    asmStack object for the stack
+    depth       maximum stack depth or None if it cannot be bounded
+    reason      reason the depth cannot be bounded
+    approximate list of the (function,label) tuples of the loops assumed to be
+                executed once that the depth depends on
+    firmMinLength minimum stack length required by the depth when these loops
+                empty the stack, i.e., the depth that does not depend on them
+    minLength   minimum stack length required by the depth or None
+    length      smallest power of 2 stack length allowed by ssbcc that is at
+                least minLength or None
+  The data stack depth includes the T and N registers so the minimum data stack
+  length is 2 less than its depth.
+  """
+  requirements = dict();
+  for (name,stack,offset,minimum,) in (('data_stack','data',2,8,),('return_stack','return',0,2,),):
+    analysis = asmStack(ad,loopBounds,program,stack);
+    requirement = dict(analysis=analysis, depth=None, reason=None, approximate=list(), firmMinLength=None, minLength=None, length=None);
+    try:
+      requirement['depth'] = analysis.MaxDepth();
+      # The depth depends on the loops assumed to be executed once if it is
+      # smaller when these loops empty the stack.
+      firmDepth = requirement['depth'];
+      if analysis.unboundedLoops:
+        firmDepth = asmStack(ad,loopBounds,program,stack,optimistic=True).MaxDepth();
+        if firmDepth < requirement['depth']:
+          requirement['approximate'] = list(analysis.unboundedLoops);
+    except asmDef.AsmException, msg:
+      requirement['reason'] = str(msg);
+    if requirement['depth'] != None:
+      requirement['firmMinLength'] = max(firmDepth-offset,0);
+      requirement['minLength'] = max(requirement['depth']-offset,0);
+      length = minimum;
+      while length < requirement['minLength']:
+        length *= 2;
+      requirement['length'] = length;
+    requirements[name] = requirement;
+  return requirements;
+
+def Report(fp,requirements,stackLengths=None):
+  """
+  Write the stack depth report.\n
+  requirements  return from StackRequirements
+  stackLengths  optional list of (name,length) tuples for the configured stack
+                lengths
+  """
+  configured = dict(stackLengths or list());
+  functions = requirements['data_stack']['analysis'].functions;
+  fp.write('Maximum stack depths relative to the depth when the function is entered\n');
+  width = max([len(name) for name in functions]+[len('function')]);
+  fp.write('  %-*s %8s %8s\n' % (width,'function','data','return',));
+  for name in functions:
+    values = list();
+    reasons = list();
+    for stackName in ('data_stack','return_stack',):
+      try:
+        values.append('%d' % requirements[stackName]['analysis'].FunctionCost(name)[1]);
+      except asmDef.AsmException, msg:
+        values.append('-');
+        if str(msg) not in reasons:
+          reasons.append(str(msg));
+    fp.write('  %-*s %8s %8s%s\n' % (width,name,values[0],values[1],''.join(['  (%s)' % reason for reason in reasons]),));
+  fp.write('\n');
+  for (stackName,configName,) in (('data_stack','DATA_STACK',),('return_stack','RETURN_STACK',),):
+    requirement = requirements[stackName];
+    if requirement['depth'] == None:
+      fp.write('%-12s  depth cannot be bounded:  %s\n' % (configName,requirement['reason'],));
+      continue;
+    fp.write('%-12s  maximum depth %d, minimum safe size %d' % (configName,requirement['depth'],requirement['length'],));
+    if stackName in configured:
+      fp.write(', configured size %d' % configured[stackName]);
+      if configured[stackName] < requirement['firmMinLength']:
+        fp.write(' is TOO SMALL');
+      elif configured[stackName] < requirement['minLength']:
+        fp.write(' may be TOO SMALL');
+    fp.write('\n');
+    for (name,label,) in requirement['approximate']:
+      fp.write('%-12s  assumes one pass through the loop at label "%s" in "%s", add "; @loop %s <max> <min>" to tighten\n' % ('',label,name,label,));
+  fp.write('The data stack depth includes the T and N registers.\n');
+  if '.interrupt' in functions:
+    fp.write('The maximum depths include the interrupt handler preempting the deepest point of .main.\n');
@@ -0,0 +1,427 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Static worst-case execution time analysis for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import re
+
+import asmDef
+
+class asmWCET:
+  """
+  Worst-case execution time analysis of the functions identified by
+  asmDef_9x8.EvaluateFunctionTree.\n
+  Every instruction executes in exactly one clock cycle, so the worst-case
+  execution time of a path is the number of instructions along the path,
+  including the pushed addresses and the delay slots of the jump, call, and
+  return macros.  A ".call" or ".callc" adds the worst-case execution time of
+  the called function, as does a ".jump" made from a tail call by the
+  optimizer since the function then returns from the calling function.\n
+  Each function body is divided into basic blocks at its labels and after its
+  ".jump", ".jumpc", ".return", and ".returni" macros.  The loops are the
+  natural loops of the resulting control flow graph and the label at the top of
+  each loop must have a loop bound annotation of the form
+    ; @loop <label> <max> [<min>]
+  where <max> and the optional <min> are the maximum and minimum numbers of
+  times the loop body, starting at the label, is executed each time the loop is
+  entered.  Loops without an exit, such
+  as the loop in ".main", do not need a bound.  Loops are collapsed from the
+  innermost outward into single nodes and the worst-case execution time is then
+  the longest path through the resulting acyclic graph.\n
+  Recursion, loops that are not entered through a single label, and loops
+  without bounds cannot be analyzed.\n
+  The block costs are computed by the BlockCost method as a net change and a
+  peak so that other metrics that accumulate along a path, such as the stack
+  depths, can reuse the analysis by overriding it.
+  """
+
+  # The execution time of a loop without an exit only matters for the paths
+  # within the loop.
+  peakRequired = False;
+  metricName = 'The execution time';
+
+  def __init__(self,ad,loopBounds,functions=None):
+    """
+    Initialize the analysis.\n
+    ad          asmDef_9x8 object after EvaluateFunctionTree
+    loopBounds  dictionary of the "@loop" annotations for each function name,
+                ".main", and ".interrupt" as collected by asmDef.RawTokens
+    functions   optional replacement for the function bodies and lengths in
+                ad.functionEvaluation, e.g., the bodies before optimization
+    """
+    self.ad = ad;
+    self.functions = functions if functions != None else ad.functionEvaluation;
+    self.bounds = dict();
+    for name in loopBounds:
+      if name not in self.functions:
+        continue;
+      labels = [token['value'] for token in self.functions[name]['body'] if token['type'] == 'label'];
+      self.bounds[name] = dict();
+      for loopBound in loopBounds[name]:
+        if loopBound['label'] not in labels:
+          raise asmDef.AsmException('Label "%s" for "@loop" annotation not in "%s" at %s' % (loopBound['label'],name,loopBound['loc'],));
+        if loopBound['label'] in self.bounds[name]:
+          raise asmDef.AsmException('Repeated "@loop" annotation for "%s" at %s' % (loopBound['label'],loopBound['loc'],));
+        self.bounds[name][loopBound['label']] = loopBound;
+    self.graphs = dict();
+    self.costs = dict();
+    self.inProgress = list();
+
+  ################################################################################
+  #
+  # Construct the control flow graph for a function body.
+  #
+  ################################################################################
+
+  def Graph(self,name):
+    """
+    Return the control flow graph for the named function.\n
+    The graph is a dictionary with the following content:
+      labels    offset of each label
+      names     list of the labels at the start of each block
+      cost      number of instructions in each block, not including the called
+                functions
+      calls     list of the functions called by each block
+      succ      list of the successors for each block where 'exit' indicates a
+                return from the function\n
+    Blocks are identified by the offset of their first instruction.
+    """
+    if name in self.graphs:
+      return self.graphs[name];
+    body = self.functions[name]['body'];
+    length = self.functions[name]['length'];
+    graph = dict(labels=dict(), names=dict(), cost=dict(), calls=dict(), succ=dict());
+    for token in body:
+      if token['type'] == 'label':
+        graph['labels'][token['value']] = token['offset'];
+    def StartBlock(offset):
+      if offset in graph['cost']:
+        return;
+      graph['names'][offset] = list();
+      graph['cost'][offset] = 0;
+      graph['calls'][offset] = list();
+      graph['succ'][offset] = list();
+    current = 0;
+    StartBlock(current);
+    for ixToken in range(len(body)):
+      token = body[ixToken];
+      nextOffset = body[ixToken+1]['offset'] if ixToken+1 < len(body) else length;
+      if token['type'] == 'label':
+        if token['offset'] != current:
+          graph['succ'][current].append(token['offset']);
+          current = token['offset'];
+          StartBlock(current);
+        graph['names'][current].append(token['value']);
+        continue;
+      graph['cost'][current] += nextOffset - token['offset'];
+      if token['type'] != 'macro':
+        continue;
+      if token['value'] in ('.call','.callc',):
+        graph['calls'][current].append(token['argument'][0]['value']);
+        continue;
+      if token.get('tailCall'):
+        graph['calls'][current].append(token['argument'][0]['value']);
+        graph['succ'][current].append('exit');
+      elif token['value'] in ('.jump','.jumpc',):
+        graph['succ'][current].append(graph['labels'][token['argument'][0]['value']]);
+        if token['value'] == '.jumpc':
+          graph['succ'][current].append(nextOffset);
+      elif token['value'] in ('.return','.returni',):
+        graph['succ'][current].append('exit');
+      else:
+        continue;
+      current = nextOffset;
+      StartBlock(current);
+    self.graphs[name] = graph;
+    return graph;
+
+  ################################################################################
+  #
+  # Compute the worst-case execution times.
+  #
+  ################################################################################
+
+  def BlockCost(self,name,node):
+    """
+    Return the net change and the peak of the metric over the block as an
+    ordered tuple.\n
+    For the execution time both are the number of clock cycles for the block,
+    including the called functions.
+    """
+    graph = self.Graph(name);
+    cost = graph['cost'][node] + sum([self.FunctionWCET(callName) for callName in graph['calls'][node]]);
+    return (cost,cost,);
+
+  def FunctionCost(self,name):
+    """
+    Return the net change of the metric from the first instruction of the named
+    function through the delay slot of its return and the peak of the metric
+    within the function as an ordered tuple.  The net change is None if the
+    function does not return.
+    """
+    if name in self.costs:
+      return self.costs[name];
+    if name in self.inProgress:
+      raise asmDef.AsmException('Recursive call to "%s" through %s' % (name,' -> '.join(self.inProgress[self.inProgress.index(name):]+[name]),));
+    self.inProgress.append(name);
+    try:
+      self.costs[name] = self.LongestPath(name,0,'exit');
+    finally:
+      self.inProgress.pop();
+    return self.costs[name];
+
+  def FunctionWCET(self,name):
+    """
+    Return the worst-case number of clock cycles from the first instruction of
+    the named function through the delay slot of its return.\n
+    An AsmException is raised if the time cannot be bounded.
+    """
+    wcet = self.FunctionCost(name)[0];
+    if wcet == None:
+      raise asmDef.AsmException('"%s" does not return' % name);
+    return wcet;
+
+  def LabelWCET(self,name,fromLabel,toLabel):
+    """
+    Return the worst-case number of clock cycles from the instruction at
+    fromLabel until the instruction at toLabel is reached in the named function.
+    When the two labels are the same this is the time for one pass through the
+    loop starting at the label.
+    """
+    if name not in self.functions:
+      raise asmDef.AsmException('Function "%s" is not in the program' % name);
+    graph = self.Graph(name);
+    for label in (fromLabel,toLabel,):
+      if label not in graph['labels']:
+        raise asmDef.AsmException('Label "%s" not in "%s"' % (label,name,));
+    wcet = self.LongestPath(name,graph['labels'][fromLabel],graph['labels'][toLabel])[0];
+    if wcet == None:
+      raise asmDef.AsmException('Label "%s" cannot be reached from label "%s" in "%s"' % (toLabel,fromLabel,name,));
+    return wcet;
+
+  def LongestPath(self,name,entry,sink):
+    """
+    Return the worst-case net change of the metric from the start of the entry
+    block until the sink is reached, or None if the sink cannot be reached, and
+    the peak of the metric along the paths from the entry block as an ordered
+    tuple.\n
+    The sink is either the offset of a block or 'exit' for the return from the
+    function.
+    """
+    graph = self.Graph(name);
+    # Compute the block costs, including the called functions, and the edges
+    # for the blocks reachable from the entry.  Edges into the sink terminate
+    # the path.
+    net = dict();
+    peak = dict();
+    succ = dict();
+    pending = [entry];
+    while pending:
+      node = pending.pop();
+      if node in net:
+        continue;
+      (net[node],peak[node],) = self.BlockCost(name,node);
+      succ[node] = dict();
+      for target in graph['succ'][node]:
+        if target == sink:
+          target = 'sink';
+        elif target == 'exit':
+          continue;
+        succ[node][target] = 0;
+        if target not in net and target != 'sink':
+          pending.append(target);
+    net['sink'] = 0;
+    peak['sink'] = 0;
+    succ['sink'] = dict();
+    # Identify the loops and collapse them from the innermost outward.
+    for (header,body,) in self.Loops(name,entry,succ):
+      self.CollapseLoop(name,header,body,net,peak,succ);
+    # The remaining graph is acyclic.
+    dist = self.Distances(entry,net,succ,set(net),None);
+    return (dist.get('sink'),max([dist[node]+peak[node] for node in dist]),);
+
+  def Loops(self,name,entry,succ):
+    """
+    Return the list of natural loops of the graph as (header,body) tuples where
+    the body includes the header.  Inner loops precede the loops that contain
+    them.
+    """
+    nodes = sorted(succ);
+    pred = dict((node,set(),) for node in nodes);
+    for node in nodes:
+      for target in succ[node]:
+        pred[target].add(node);
+    # Compute the dominators of each block.
+    dom = dict((node,set(nodes),) for node in nodes);
+    dom[entry] = set([entry]);
+    changed = True;
+    while changed:
+      changed = False;
+      for node in nodes:
+        if node == entry:
+          continue;
+        newDom = set(nodes);
+        for p in pred[node]:
+          newDom &= dom[p];
+        newDom.add(node);
+        if newDom != dom[node]:
+          dom[node] = newDom;
+          changed = True;
+    # Back edges are edges to a dominator.  The graph is reducible if and only
+    # if it is acyclic once the back edges are removed.
+    backEdges = [(node,target,) for node in nodes for target in succ[node] if target in dom[node]];
+    forward = dict((node,dict((target,0,) for target in succ[node] if (node,target,) not in backEdges),) for node in nodes);
+    if self.Distances(entry,dict((node,0,) for node in nodes),forward,set(nodes),None) == None:
+      raise asmDef.AsmException('Loop in "%s" is not entered through a single label' % name);
+    # Construct the natural loops, merging the loops with the same header.
+    loops = dict();
+    for (tail,header,) in backEdges:
+      body = loops.setdefault(header,set([header]));
+      pending = [tail];
+      while pending:
+        node = pending.pop();
+        if node in body:
+          continue;
+        body.add(node);
+        pending += list(pred[node]);
+    return sorted(loops.iteritems(), key=lambda loop : (len(loop[1]),loop[0],));
+
+  def CollapseLoop(self,name,header,body,net,peak,succ):
+    """
+    Replace the loop by its header with edges to the loop exits.\n
+    The cost of an edge from the collapsed loop is the worst-case net change of
+    the metric for the maximum number of passes through the loop with the last
+    pass leaving the loop through that edge.  A bound on the number of passes is
+    required if the metric increases on a pass through the loop and the loop has
+    an exit, or if peakRequired is True.  The net change for a loop that
+    decreases the metric and has no minimum number of passes is provided by
+    UnboundedDecrease.
+    """
+    body = set(node for node in body if node in net);
+    exits = [(node,target,) for node in body for target in succ[node] if target not in body];
+    dist = self.Distances(header,net,succ,body,header);
+    gain = max([dist[node] + net[node] + succ[node][header] for node in body if header in succ[node]]);
+    labels = self.Graph(name)['names'][header];
+    bounds = [self.bounds[name][label] for label in labels if label in self.bounds.get(name,dict())];
+    if gain <= 0:
+      # The metric is largest on the first pass and, when the minimum number of
+      # passes is known, smallest after the last pass.
+      minimums = [bound['min'] for bound in bounds if bound['min'] != None];
+      if (gain < 0) and not minimums:
+        growth = self.UnboundedDecrease(name,labels[0],gain);
+      else:
+        growth = (max(minimums+[1])-1)*gain;
+      peakGrowth = 0;
+    elif exits:
+      if not bounds:
+        raise asmDef.AsmException('Loop at label "%s" in "%s" requires a "; @loop %s <max>" annotation' % (labels[0],name,labels[0],));
+      growth = (min([bound['max'] for bound in bounds])-1)*gain;
+      peakGrowth = growth;
+    elif self.peakRequired:
+      raise asmDef.AsmException('%s increases on each pass through the loop at label "%s" in "%s"' % (self.metricName,labels[0],name,));
+    else:
+      growth = 0;
+      peakGrowth = 0;
+    newSucc = dict();
+    for (node,target,) in exits:
+      exitCost = growth + dist[node] + net[node] + succ[node][target];
+      if (target not in newSucc) or (exitCost > newSucc[target]):
+        newSucc[target] = exitCost;
+    newPeak = peakGrowth + max([dist[node] + peak[node] for node in body]);
+    for node in body:
+      if node != header:
+        del net[node];
+        del peak[node];
+        del succ[node];
+    net[header] = 0;
+    peak[header] = newPeak;
+    succ[header] = newSucc;
+
+  def Distances(self,entry,net,succ,nodes,header):
+    """
+    Return the longest distances from the start of the entry block to the start
+    of each block in the set of nodes reachable without returning to the header,
+    or None if there is a cycle.
+    """
+    order = list();
+    state = dict();
+    stack = [(entry,iter(succ[entry]),)];
+    state[entry] = 'active';
+    while stack:
+      (node,targets,) = stack[-1];
+      for target in targets:
+        if (target not in nodes) or (target == header):
+          continue;
+        if state.get(target) == 'active':
+          return None;
+        if target not in state:
+          state[target] = 'active';
+          stack.append((target,iter(succ[target]),));
+          break;
+      else:
+        state[node] = 'done';
+        order.append(node);
+        stack.pop();
+    order.reverse();
+    dist = dict();
+    dist[entry] = 0;
+    for node in order:
+      for target in succ[node]:
+        if (target not in nodes) or (target == header):
+          continue;
+        d = dist[node] + net[node] + succ[node][target];
+        if (target not in dist) or (d > dist[target]):
+          dist[target] = d;
+    return dist;
+
+  def UnboundedDecrease(self,name,label,gain):
+    """
+    Return the net change of the metric beyond the first pass through a loop
+    that decreases the metric on each pass and has no minimum number of passes.\n
+    The loop is assumed to be executed once.
+    """
+    return 0;
+
+  ################################################################################
+  #
+  # Write the report.
+  #
+  ################################################################################
+
+  def Report(self,fp,paths=None):
+    """
+    Write the worst-case execution times for the functions, the interrupt
+    handler, and the listed paths.\n
+    paths       list of (function,fromLabel,toLabel) tuples\n
+    Functions whose times cannot be bounded are listed with the reason.  An
+    AsmException is raised if a listed path cannot be bounded.
+    """
+    pathWCETs = [self.LabelWCET(*path) for path in paths or list()];
+    fp.write('Worst-case execution times in clock cycles\n');
+    width = max([len(name) for name in self.functions]);
+    for name in self.functions:
+      try:
+        wcet = self.FunctionWCET(name);
+        if name == '.interrupt':
+          fp.write('  %-*s %8d  (including 2 clock cycles to enter the interrupt handler)\n' % (width,name,wcet+2,));
+        else:
+          fp.write('  %-*s %8d\n' % (width,name,wcet,));
+      except asmDef.AsmException, msg:
+        fp.write('  %-*s %8s  (%s)\n' % (width,name,'-',str(msg),));
+    if paths:
+      fp.write('\nWorst-case execution times between labels in clock cycles\n');
+      width = max([len('%s:%s:%s' % path) for path in paths]);
+      for (path,wcet,) in zip(paths,pathWCETs):
+        fp.write('  %-*s %8d\n' % (width,'%s:%s:%s' % path,wcet,));
+
+def ParsePath(path):
+  """
+  Convert a "FUNCTION:FROM:TO" string to a (function,fromLabel,toLabel) tuple.
+  """
+  a = re.findall(r'^(\.main|\.interrupt|\w+):(\w+):(\w+)$',path);
+  if not a:
+    raise asmDef.AsmException('Malformed worst-case execution time path "%s"' % path);
+  return a[0];
@@ -0,0 +1,145 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+################################################################################
+
+import re
+
+from ssbccPeripheral import SSBCCperipheral
+from ssbccUtil import SSBCCException
+
+class perf_counters(SSBCCperipheral):
+  """
+  The documentation is recorded in the file perf_counters.md
+  """
+
+  # Counters in the order they are listed in the documentation.
+  counters = ('cycles','instructions','jumps','calls','returns','interrupt','window',);
+
+  def __init__(self,peripheralFile,config,param_list,loc):
+    # Use the externally provided file name for the peripheral
+    self.peripheralFile = peripheralFile
+    # Get the parameters.
+    allowables = (
+      ( 'outlatch',     r'O_\w+$',                      None,   ),
+      ( 'outclear',     r'O_\w+$',                      None,   ),
+      ( 'range',        r'([A-Za-z_.][\w.]*|(0x[0-9A-Fa-f]+|\d+):(0x[0-9A-Fa-f]+|\d+))$', None, ),
+      ( 'width',        r'[1-9]\d*$',                   int,    ),
+    ) + tuple((counter, r'I_\w+$', None,) for counter in self.counters)
+    names = [a[0] for a in allowables]
+    for param_tuple in param_list:
+      param = param_tuple[0]
+      if param not in names:
+        raise SSBCCException('Unrecognized parameter "%s" at %s' % (param,loc,))
+      param_test = allowables[names.index(param)]
+      self.AddAttr(config,param,param_tuple[1],param_test[1],loc,param_test[2])
+    # Ensure the required parameters are provided.
+    if not hasattr(self,'outlatch'):
+      raise SSBCCException('Required parameter "outlatch" is missing at %s' % loc)
+    self.used = [counter for counter in self.counters if hasattr(self,counter)]
+    if not self.used:
+      raise SSBCCException('At least one counter is required at %s' % loc)
+    if hasattr(self,'window') != hasattr(self,'range'):
+      raise SSBCCException('The "window" and "range" parameters must be used together at %s' % loc)
+    # Set optional parameters.
+    if not hasattr(self,'width'):
+      self.width = 32
+    if self.width < 9:
+      raise SSBCCException('width=%d must be at least 9 at %s' % (self.width,loc,))
+    self.loc = loc
+    # Add the internal signals and the INPORT and OUTPORT symbols for this
+    # peripheral.
+    self.ix_latch = config.NOutports()
+    config.AddOutport((self.outlatch,True,
+                      # empty list
+                      ),loc)
+    if hasattr(self,'outclear'):
+      self.ix_clear = config.NOutports()
+      config.AddOutport((self.outclear,True,
+                        # empty list
+                        ),loc)
+    self.ix_inport = dict()
+    for counter in self.used:
+      inport = getattr(self,counter)
+      config.AddSignal('s__%s' % inport.lower(), self.width, loc)
+      self.ix_inport[counter] = config.NInports()
+      config.AddInport((inport,
+                       ('s__%s' % inport.lower(), self.width, 'data', ),
+                       ),loc)
+
+  def Range(self,config):
+    """
+    Return the first and last addresses of the program counter window, i.e., of
+    the named function or of the "low:high" range.
+    """
+    a = re.match(r'(0x[0-9A-Fa-f]+|\d+):(0x[0-9A-Fa-f]+|\d+)$',self.range)
+    if a:
+      (low,high,) = (int(a.group(1),0),int(a.group(2),0),)
+      if low > high:
+        raise SSBCCException('Empty range "%s" at %s' % (self.range,self.loc,))
+      return (low,high,)
+    functions = config.Get('functions')
+    if self.range not in functions:
+      raise SSBCCException('Function "%s" is not in the program at %s' % (self.range,self.loc,))
+    function = functions[self.range]
+    return (function['address'],function['address']+function['length']-1,)
+
+  def GenVerilog(self,fp,config):
+    body = self.LoadCore(self.peripheralFile,'.v')
+    # Compute the events for the counters.
+    events = dict(
+      cycles            = "1'b1",
+      instructions      = "!(s_interrupt || s_interrupted)",
+      jumps             = "(s_bus_pc == C_BUS_PC_JUMP) && !s_opcode[6]",
+      calls             = "(s_bus_pc == C_BUS_PC_JUMP) && s_opcode[6]",
+      returns           = "(s_bus_pc == C_BUS_PC_RETURN)",
+      interrupt         = "s_interrupt || s__in_interrupt",
+      window            = "1'b0",
+    )
+    if hasattr(self,'range'):
+      (low,high,) = self.Range(config)
+      events['window'] = "(s__PC_s >= %d) && (s__PC_s <= %d)" % (low,high,)
+    if config.InterruptVector():
+      ix_ena = [ix for ix in range(config.NOutports()) if config.outports[ix][0] == 'O_INTERRUPT_ENA'][0]
+      body = re.sub(r'@IX_INTERRUPT_ENA@',"8'h%02x" % ix_ena,body)
+    else:
+      body = re.sub(r'@INTERRUPT_BEGIN@.*?@INTERRUPT_END@\n','',body,flags=re.DOTALL)
+      events['interrupt'] = "1'b0"
+    body = re.sub(r'@INTERRUPT_(BEGIN|END)@\n','',body)
+    # Generate the counters and their shift registers.
+    counters = ''
+    for counter in self.used:
+      inport = getattr(self,counter)
+      counterBody = re.search(r'@COUNTER_BEGIN@\n(.*?)@COUNTER_END@\n',body,flags=re.DOTALL).group(1)
+      for subpair in (
+          ( r'@COUNTER@',       counter, ),
+          ( r'@EVENT@',         events[counter], ),
+          ( r'@IX_INPORT@',     "8'h%02x" % self.ix_inport[counter], ),
+          ( r'@INPORT@',        inport.lower(), ),
+        ):
+        counterBody = re.sub(subpair[0],subpair[1],counterBody)
+      counters += counterBody
+    body = re.sub(r'@COUNTER_BEGIN@\n.*?@COUNTER_END@\n',counters,body,flags=re.DOTALL)
+    clear = "s_outport && (s_T == 8'h%02x)" % self.ix_clear if hasattr(self,'outclear') else "1'b0"
+    for subpair in (
+        ( r'\bs__in_interrupt\b',       's__@NAME@__in_interrupt', ),
+        ( r'\bs__PC_s\b',               's__@NAME@__PC_s', ),
+        ( r'\bs__clear\b',              's__@NAME@__clear', ),
+        ( r'\bs__count__',              's__@NAME@__count__', ),
+        ( r'@CLEAR@',                   clear, ),
+        ( r'@IX_LATCH@',                "8'h%02x" % self.ix_latch, ),
+        ( r'@WIDTH@',                   str(self.width), ),
+        ( r'@WIDTH-1@',                 str(self.width-1), ),
+        ( r'@WIDTH-8@',                 str(self.width-8), ),
+        ( r'@NAME@',                    self.outlatch.lower(), ),
+        ( r'@OUTLATCH@',                self.outlatch, ),
+        ( r'@UC_CLK@',                  'i_clk', ),
+        ( r'@UC_RST@',                  'i_rst', ),
+      ):
+      body = re.sub(subpair[0],subpair[1],body)
+    if not config.InterruptVector():
+      for replace in (r's_interrupt\b',r's_interrupted\b',):
+        body = re.sub(replace,'1\'b0',body)
+    body = self.GenVerilogFinal(config,body)
+    fp.write(body)
@@ -0,0 +1,46 @@
+//
+// PERIPHERAL:  perf_counters (@OUTLATCH@)
+//
+
+// Program counter of the instruction being executed.
+reg [C_PC_WIDTH-1:0] s__PC_s = {(C_PC_WIDTH){1'b0}};
+always @ (posedge @UC_CLK@)
+  s__PC_s <= s_PC;
+
+@INTERRUPT_BEGIN@
+// Clock cycles from the start of the interrupt until the delay slot of the
+// ".returni" enables interrupts.
+reg s__in_interrupt = 1'b0;
+always @ (posedge @UC_CLK@)
+  if (@UC_RST@)
+    s__in_interrupt <= 1'b0;
+  else if (s_interrupt)
+    s__in_interrupt <= 1'b1;
+  else if (s_outport && (s_T == @IX_INTERRUPT_ENA@))
+    s__in_interrupt <= 1'b0;
+  else
+    s__in_interrupt <= s__in_interrupt;
+@INTERRUPT_END@
+
+wire s__clear = @CLEAR@;
+
+@COUNTER_BEGIN@
+// @COUNTER@ counter
+reg [@WIDTH-1@:0] s__count__@COUNTER@ = @WIDTH@'d0;
+always @ (posedge @UC_CLK@)
+  if (@UC_RST@ || s__clear)
+    s__count__@COUNTER@ <= @WIDTH@'d0;
+  else if (@EVENT@)
+    s__count__@COUNTER@ <= s__count__@COUNTER@ + @WIDTH@'d1;
+  else
+    s__count__@COUNTER@ <= s__count__@COUNTER@;
+always @ (posedge @UC_CLK@)
+  if (@UC_RST@)
+    s__@INPORT@ <= @WIDTH@'d0;
+  else if (s_outport && (s_T == @IX_LATCH@))
+    s__@INPORT@ <= s__count__@COUNTER@;
+  else if (s_inport && (s_T == @IX_INPORT@))
+    s__@INPORT@ <= { 8'd0, s__@INPORT@[8+:@WIDTH-8@] };
+  else
+    s__@INPORT@ <= s__@INPORT@;
+@COUNTER_END@
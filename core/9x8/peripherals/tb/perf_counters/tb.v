@@ -0,0 +1,57 @@
+/*******************************************************************************
+ *
+ * Copyright 2015, Sinclair R.F., Inc.
+ *
+ * Test bench for perf_counters peripheral.
+ *
+ ******************************************************************************/
+
+`timescale 1ns/1ps
+
+module tb;
+
+// 100 MHz clock
+reg s_clk = 1'b1;
+always @ (s_clk)
+  s_clk <= #5 ~s_clk;
+
+reg s_rst = 1'b1;
+initial begin
+  repeat (5) @ (posedge s_clk);
+  s_rst = 1'b0;
+end
+
+// Raise the interrupt when it is requested.
+wire            s_go;
+reg             s_interrupt     = 1'b0;
+always @ (posedge s_clk)
+  if (s_go)
+    s_interrupt <= 1'b1;
+
+wire      [7:0] s_diag;
+wire            s_diag_wr;
+wire            s_done;
+tb_perf_counters uut(
+  // synchronous reset and processor clock
+  .i_rst        (s_rst),
+  .i_clk        (s_clk),
+  // external interrupt
+  .i_interrupt  (s_interrupt),
+  // request for the external interrupt
+  .o_go         (s_go),
+  // diagnostic echo of the counts
+  .o_diag       (s_diag),
+  .o_diag_wr    (s_diag_wr),
+  // termination signal
+  .o_done       (s_done)
+);
+
+always @ (posedge s_clk)
+  if (s_diag_wr)
+    $display("%h", s_diag);
+
+always @ (posedge s_clk)
+  if (s_done)
+    $finish;
+
+endmodule
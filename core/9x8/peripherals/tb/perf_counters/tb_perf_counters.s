@@ -0,0 +1,54 @@
+; Copyright 2015, Sinclair R.F., Inc.
+;
+; Test bench for perf_counters peripheral.
+
+.main
+
+  ; Count the events for a call to "work" without interrupts.
+  .outstrobe(O_PERF_CLEAR)
+  3 .call(work)
+  .outstrobe(O_PERF_LATCH)
+  .inport(I_PERF_CYCLES) .inport(I_PERF_CYCLES) .call(out16)
+  .inport(I_PERF_INSTRUCTIONS) .inport(I_PERF_INSTRUCTIONS) .call(out16)
+  .inport(I_PERF_JUMPS) .inport(I_PERF_JUMPS) .call(out16)
+  .inport(I_PERF_CALLS) .inport(I_PERF_CALLS) .call(out16)
+  .inport(I_PERF_RETURNS) .inport(I_PERF_RETURNS) .call(out16)
+  .inport(I_PERF_INTERRUPT) .inport(I_PERF_INTERRUPT) .call(out16)
+  .inport(I_PERF_WORK) .inport(I_PERF_WORK) .call(out16)
+
+  ; Request the interrupt and wait until the interrupt handler has run.  The
+  ; jumps in the wait loop depend on when the interrupt occurs, so only the
+  ; counts for the interrupt handler are echoed.
+  .outstrobe(O_GO)
+  .outstrobe(O_PERF_CLEAR)
+  .ena
+  :wait .outstrobe(O_PERF_LATCH) .inport(I_PERF_INTERRUPT) 0= .jumpc(wait)
+  .outstrobe(O_PERF_LATCH)
+  .inport(I_PERF_INTERRUPT) .inport(I_PERF_INTERRUPT) .call(out16)
+  .inport(I_PERF_CALLS) .inport(I_PERF_CALLS) .call(out16)
+  .inport(I_PERF_RETURNS) .inport(I_PERF_RETURNS) .call(out16)
+  .inport(I_PERF_WORK) .inport(I_PERF_WORK) .call(out16)
+
+  ; The difference between the clock cycles and the instructions is the two
+  ; clock cycles that enter the interrupt handler.
+  .inport(I_PERF_CYCLES) .inport(I_PERF_CYCLES) drop
+  .inport(I_PERF_INSTRUCTIONS) .inport(I_PERF_INSTRUCTIONS) drop
+  - .outport(O_DIAG)
+
+  ; Send the termination signal and then enter an infinite loop.
+  1 .outport(O_DONE)
+  :infinite .jump(infinite)
+
+.interrupt
+  2 .call(work)
+  .returni
+
+; ( n - )
+; Decrement the count through zero.
+.function work
+  :loop .jumpc(loop,1-) .return(drop)
+
+; ( u_LSB u_MSB - )
+; Echo a 16-bit count, MSB first.
+.function out16
+  .outport(O_DIAG) .outport(O_DIAG) .return
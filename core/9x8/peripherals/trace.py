@@ -15,7 +15,21 @@ class trace(SSBCCperipheral):
   counter and opcode are delayed so that they are aligned with the results of
   the opcode.\n
   Usage:
-    PERIPHERAL trace\n
+    PERIPHERAL trace [format={text|binary|flow}] [filename=name]\n
+  Where:
+    format=text
+      is the default and displays one line per clock cycle
+    format=binary
+      writes one 3 word record per clock cycle to a binary file
+    format=flow
+      writes one 1 word record per change in the control flow to a binary file,
+      i.e., for taken jumps, calls, and returns, for the two clock cycles that
+      enter the interrupt handler, and after 127 sequential clock cycles
+      Note:  The up to 127 sequential clock cycles after the last record are
+             not written when the simulation ends.
+    filename=name
+      is the name of the binary file
+      Note:  The default is "<outCoreName>.9x8-trace".\n
   The following values are displayed in this order during the execution:
     program counter
     numeric opcode
@@ -27,17 +41,52 @@ class trace(SSBCCperipheral):
     ':'
     top of the return stack
     return stack pointer\n
+  The binary formats are written with "$fwrite" and are much smaller and
+  faster to write than the text format.  The records are described in
+  core/9x8/trace9x8.py and the binary files are decoded by core/9x8/detrace,
+  which regenerates the lines of the text format, and by core/9x8/profile.  The
+  flow format only records the program counter and opcode, and the opcodes of
+  the sequential clock cycles are taken from the simulation image written by
+  ssbcc's "--write-sim" option.\n
   Example:  See core/9x8/tb/core which is used to validate correct operation of
-            the core.
+            the core.\n
+  Example:  Write the control flow of the processor to "uc.9x8-trace":\n
+    PERIPHERAL trace format=flow\n
+    and decode it using:\n
+    ssbcc -q --write-sim uc.9x8
+    detrace --image uc.9x8-sim uc.9x8-trace
   """
 
   def __init__(self,peripheralFile,config,params,loc):
     # Use the externally provided file name for the peripheral
     self.peripheralFile = peripheralFile;
-    config.functions['display_trace'] = True;
+    # Get the parameters.
+    allowables = (
+      ( 'filename',     r'[^"\\\s]+$',         None,   ),
+      ( 'format',       r'(text|binary|flow)$', None,   ),
+    );
+    names = [a[0] for a in allowables];
+    for param_tuple in params:
+      param = param_tuple[0];
+      if param not in names:
+        raise SSBCCException('Unrecognized parameter "%s" at %s' % (param,loc,));
+      param_test = allowables[names.index(param)];
+      self.AddAttr(config,param,param_tuple[1],param_test[1],loc,param_test[2]);
+    # Set optional parameters.
+    if not hasattr(self,'format'):
+      self.format = 'text';
+    if not hasattr(self,'filename'):
+      self.filename = config.Get('outCoreName') + '.9x8-trace';
+    elif self.format == 'text':
+      raise SSBCCException('"filename" requires a binary format at %s' % loc);
+    self.loc = loc;
+    # Configure the system for this peripheral.
+    if self.format == 'text':
+      config.functions['display_trace'] = True;
 
   def GenVerilog(self,fp,config):
-    body = """
+    if self.format == 'text':
+      body = """
 //
 // Trace peripheral
 //
@@ -61,6 +110,62 @@ always @ (posedge i_clk) begin
 end
 endgenerate
 """;
+    else:
+      body = """
+//
+// Trace peripheral
+//
+generate
+reg [C_PC_WIDTH-1:0] s__PC_s[1:0];
+reg            [8:0] s__opcode_s = 9'h000;
+reg                  s__interrupt_s = 1'b0;
+reg                  s__interrupted_s = 1'b0;
+wire          [13:0] s__PC = s__PC_s[1];
+integer              s__fd;
+initial begin
+  s__PC_s[0] = {(C_PC_WIDTH){1'b0}};
+  s__PC_s[1] = {(C_PC_WIDTH){1'b0}};
+  s__fd = $fopen("@FILENAME@","wb");
+  $fwrite(s__fd,"%u%u%u",32'h54387839,{ 16'd0, 8'd@FORMAT@, 8'd1 },C_RETURN_PTR_WIDTH*32'h01000000+C_RETURN_WIDTH*32'h00010000+C_DATA_PTR_WIDTH*32'h00000100+C_PC_WIDTH);
+end
+always @ (posedge i_clk) begin
+  s__PC_s[0] <= s_PC;
+  s__PC_s[1] <= s__PC_s[0];
+  s__interrupt_s <= s_interrupt;
+  s__interrupted_s <= s_interrupted;
+  s__opcode_s <= s_opcode;
+end
+@WRITE@
+endgenerate
+""";
+    if (self.format != 'text') and (max(config.Get('data_stack'),config.Get('return_stack')) > 256):
+      raise SSBCCException('Binary trace formats are limited to 256 word data and return stacks at %s' % self.loc);
+    if self.format == 'binary':
+      write = """wire          [15:0] s__R = s_R;
+wire           [7:0] s__Np_stack_ptr = s_Np_stack_ptr;
+wire           [7:0] s__R_stack_ptr = s_R_stack_ptr;
+always @ (posedge i_clk)
+  $fwrite(s__fd,"%u%u%u",{ 7'd0, s__opcode_s, s__interrupt_s, s__interrupted_s, s__PC },{ s__R_stack_ptr, s__Np_stack_ptr, s_T, s_N },{ 16'd0, s__R });""";
+    elif self.format == 'flow':
+      write = """reg [C_PC_WIDTH-1:0] s__PC_last = {(C_PC_WIDTH){1'b0}};
+reg                  s__first = 1'b1;
+reg            [6:0] s__run = 7'd0;
+always @ (posedge i_clk) begin
+  if (s__first || s__interrupt_s || s__interrupted_s || (s__PC_s[1] != s__PC_last + { {(C_PC_WIDTH-1){1'b0}}, 1'b1 }) || (s__run == 7'h7F)) begin
+    $fwrite(s__fd,"%u",{ s__run, s__opcode_s, s__interrupt_s, s__interrupted_s, s__PC });
+    s__run <= 7'd0;
+  end else
+    s__run <= s__run + 7'd1;
+  s__PC_last <= s__PC_s[1];
+  s__first <= 1'b0;
+end""";
+    if self.format != 'text':
+      for subpair in (
+          ( r'@WRITE@',         write, ),
+          ( r'@FILENAME@',      self.filename, ),
+          ( r'@FORMAT@',        str(('binary','flow',).index(self.format)+1), ),
+        ):
+        body = re.sub(subpair[0],subpair[1],body);
     if not config.InterruptVector():
       for replace in ('s_interrupt','s_interrupted',):
         body = re.sub(replace+';','1\'b0;',body);
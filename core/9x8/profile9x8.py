@@ -0,0 +1,319 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Trace decoder and clock cycle profiler for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import json
+
+class ProfileException(Exception):
+  """
+  Exception class for the profiler.\n
+  These are errors in the debug information or in the trace.
+  """
+  def __init__(self,message):
+    self.message = message;
+  def __str__(self):
+    return self.message;
+
+class profile9x8:
+  """
+  Attribute the clock cycles of a trace to the functions, source lines, and
+  loops of the program.\n
+  The trace is the output of the trace peripheral (see display_trace.v) or of
+  the instruction-set simulator (see sim), i.e., one line per clock cycle
+  starting with the program counter, the opcode, and the name of the opcode.
+  Other lines, such as simulator messages, are ignored.  The addresses are
+  mapped to the functions and source lines using the debug information written
+  by ssbcc's "--write-debug" option.\n
+  The trace is read one line at a time and only the counts per address, per
+  call stack, per call, and per loop are kept, so the memory does not depend on
+  the length of the trace.\n
+  The call stack is tracked from the control flow in the trace:  a ".call" or
+  a taken ".callc" adds the calling function to the stack, a return removes
+  it, and an interrupt adds the interrupted function.  The function at the top
+  of the stack is the function containing the program counter, so a tail call
+  made by the optimizer replaces the calling function.  The two clock cycles
+  that enter the interrupt handler, i.e., the "int" and "nop_int" lines, are
+  attributed to ".interrupt".  Lines whose opcode does not match the program,
+  such as the lines while the processor is in reset, are counted but not
+  attributed.\n
+  Example:
+    profile = profile9x8.profile9x8('uc.9x8-debug');
+    profile.Read(open('trace.txt','rt'));
+    profile.Report(sys.stdout);
+  """
+
+  def __init__(self,debugInfo):
+    """
+    Load the debug information and initialize the counts.\n
+    debugInfo   name of the debug information file, an open file object, or
+                the dictionary returned by asmListing.DebugInfo
+    """
+    if type(debugInfo) == str:
+      try:
+        fp = open(debugInfo,'rt');
+      except:
+        raise ProfileException('Error opening "%s"' % debugInfo);
+    else:
+      fp = debugInfo;
+    if hasattr(fp,'read'):
+      try:
+        debugInfo = json.load(fp);
+      except ValueError:
+        raise ProfileException('Malformed debug information in "%s"' % getattr(fp,'name','debug information'));
+      fp.close();
+    self.debugInfo = debugInfo;
+    # Function name, source location, and expected opcode of each address.
+    instructions = debugInfo['instructions'];
+    self.length = len(instructions);
+    self.functionNames = [instruction['function'] or 'reset vector' for instruction in instructions];
+    self.sources = [(instruction['file'],instruction['line'],) for instruction in instructions];
+    self.opcodes = [None if instruction['opcode'] == 'p' else int(instruction['opcode'],16) for instruction in instructions];
+    self.labels = dict();
+    for (name,labels,) in debugInfo['labels'].iteritems():
+      for (label,address,) in labels.iteritems():
+        self.labels.setdefault(address,label);
+    # Counts.
+    self.nCycles = 0;
+    self.nIgnored = 0;
+    self.nMismatched = 0;
+    self.addressCounts = [0] * self.length;
+    self.stackCounts = dict();
+    self.callCounts = dict();
+    self.loopCounts = dict();
+    self.nInterrupts = 0;
+    self.interruptCycles = list();
+    # Trace decoding state.
+    self.callers = list();
+    self.stackKey = None;
+    self.pending = list();
+    self.interruptStarts = list();
+
+  ##############################################################################
+  #
+  # Decode the trace.
+  #
+  ##############################################################################
+
+  def Read(self,fp):
+    """
+    Decode the trace lines read from the file object.\n
+    The program counter, opcode, and opcode name at the start of each line only
+    have a few distinct values, so their decoded values are cached.
+    """
+    decoded = dict();
+    for line in fp:
+      prefix = line[:line.find(':')];
+      if prefix not in decoded:
+        a = prefix.split();
+        try:
+          if (len(a) != 3) or (len(a[1]) != 3):
+            raise ValueError;
+          decoded[prefix] = (int(a[0],16),int(a[1],16),a[2] in ('int','nop_int',),);
+        except ValueError:
+          continue;
+      self.Step(*decoded[prefix]);
+
+  def ReadBinary(self,trace):
+    """
+    Decode the clock cycles of the trace9x8 object for a binary trace.
+    """
+    for cycle in trace.Cycles():
+      self.Step(cycle[2],cycle[3],cycle[0] or cycle[1]);
+
+  def Step(self,pc,opcode,interrupt=False):
+    """
+    Process one clock cycle of the trace.\n
+    pc          address of the instruction whose results are displayed
+    opcode      opcode of the instruction
+    interrupt   True for the two clock cycles that enter the interrupt handler
+    """
+    self.nCycles += 1;
+    if (pc >= self.length) or (not interrupt and (self.opcodes[pc] != opcode) and ((self.opcodes[pc] != None) or not (opcode & 0x100))):
+      # Ignore the reset cycles and discard the call stack.
+      if (pc == 0) and (opcode == 0):
+        self.nIgnored += 1;
+        self.callers = list();
+        self.pending = list();
+        self.interruptStarts = list();
+        self.stackKey = None;
+      else:
+        self.nMismatched += 1;
+      return;
+    # Complete the control flow changes made two clock cycles ago, i.e., before
+    # the delay slot.
+    while self.pending and (self.pending[0][0] <= self.nCycles):
+      (cycle,kind,fromPC,) = self.pending.pop(0);
+      if cycle != self.nCycles:
+        continue;
+      if (kind == 'call') or ((kind == 'callc') and (pc != fromPC+2)):
+        self.Push(fromPC,pc);
+      elif kind == 'return':
+        self.Pop();
+      elif (kind == 'jump') and (pc <= fromPC) and (self.functionNames[pc] == self.functionNames[fromPC]):
+        loop = (pc,fromPC,);
+        self.loopCounts[loop] = self.loopCounts.get(loop,0) + 1;
+    if interrupt:
+      if not self.interruptStarts or (self.interruptStarts[-1][1] != self.nCycles-1):
+        self.Push(pc,None);
+        self.interruptStarts.append((len(self.callers),self.nCycles,));
+        self.nInterrupts += 1;
+      leaf = '.interrupt';
+    else:
+      self.addressCounts[pc] += 1;
+      leaf = self.functionNames[pc];
+      if opcode & 0x100:
+        pass;
+      elif opcode & 0x080:
+        self.pending.append((self.nCycles+2,('jump','jump','call','callc',)[(opcode >> 5) & 0x3],pc,));
+      elif opcode == 0x028:
+        self.pending.append((self.nCycles+2,'return',pc,));
+    if (self.stackKey == None) or (self.stackKey[-1] != leaf):
+      self.stackKey = tuple(self.callers) + (leaf,);
+    self.stackCounts[self.stackKey] = self.stackCounts.get(self.stackKey,0) + 1;
+
+  def Push(self,fromPC,toPC):
+    """
+    Add the function containing fromPC to the call stack for a call to toPC or,
+    if toPC is None, for an interrupt.
+    """
+    caller = self.functionNames[fromPC];
+    callee = self.functionNames[toPC] if toPC != None else '.interrupt';
+    self.callers.append(caller);
+    self.callCounts[(caller,callee,)] = self.callCounts.get((caller,callee,),0) + 1;
+    self.stackKey = None;
+
+  def Pop(self):
+    """
+    Remove the top of the call stack for a return.
+    """
+    if self.callers:
+      self.callers.pop();
+    self.stackKey = None;
+    if self.interruptStarts and (self.interruptStarts[-1][0] > len(self.callers)):
+      cycles = self.nCycles - self.interruptStarts.pop()[1];
+      if not self.interruptCycles:
+        self.interruptCycles = [0,cycles,cycles,0,];
+      self.interruptCycles[0] += 1;
+      self.interruptCycles[1] = min(self.interruptCycles[1],cycles);
+      self.interruptCycles[2] = max(self.interruptCycles[2],cycles);
+      self.interruptCycles[3] += cycles;
+
+  ##############################################################################
+  #
+  # Summarize the counts.
+  #
+  ##############################################################################
+
+  def FunctionCycles(self):
+    """
+    Return dictionaries of the clock cycles spent in each function, i.e., its
+    self time, and of the clock cycles spent in each function and the functions
+    it called, i.e., its total time.
+    """
+    selfCycles = dict();
+    totalCycles = dict();
+    for (stack,count,) in self.stackCounts.iteritems():
+      selfCycles[stack[-1]] = selfCycles.get(stack[-1],0) + count;
+      for name in set(stack):
+        totalCycles[name] = totalCycles.get(name,0) + count;
+    return (selfCycles,totalCycles,);
+
+  def LineCycles(self):
+    """
+    Return a dictionary of the clock cycles spent in each (file,line) source
+    line, excluding the functions it called.
+    """
+    lineCycles = dict();
+    for (address,count,) in enumerate(self.addressCounts):
+      if count and self.sources[address][0]:
+        lineCycles[self.sources[address]] = lineCycles.get(self.sources[address],0) + count;
+    return lineCycles;
+
+  def Loops(self):
+    """
+    Return the list of the loops as tuples of the clock cycles spent in the
+    instructions of the loop, excluding the functions it called, the number of
+    taken backward jumps, and the first and last addresses of the loop.
+    """
+    return [(sum(self.addressCounts[start:end+2]),count,start,end+1,) for ((start,end,),count,) in self.loopCounts.iteritems()];
+
+  ##############################################################################
+  #
+  # Write the profiles.
+  #
+  ##############################################################################
+
+  def Report(self,fp,nLines=20,nLoops=10):
+    """
+    Write the flat profile, the call graph, the most frequently executed source
+    lines and loops, and the time spent in the interrupt handler.\n
+    fp          file object for the report
+    nLines      number of source lines listed
+    nLoops      number of loops listed
+    """
+    nAttributed = sum(self.stackCounts.itervalues());
+    def Percent(count):
+      return 100.0*count/max(nAttributed,1);
+    fp.write('%d clock cycles, %d attributed to the program' % (self.nCycles,nAttributed,));
+    if self.nIgnored:
+      fp.write(', %d in reset' % self.nIgnored);
+    if self.nMismatched:
+      fp.write(', %d not matching the program' % self.nMismatched);
+    fp.write('\n');
+    # Flat profile.
+    (selfCycles,totalCycles,) = self.FunctionCycles();
+    calls = dict();
+    for ((caller,callee,),count,) in self.callCounts.iteritems():
+      calls[callee] = calls.get(callee,0) + count;
+    width = max([len(name) for name in totalCycles]+[len('function')]);
+    fp.write('\nFlat profile\n');
+    fp.write('  %-*s %10s %6s %10s %6s %8s\n' % (width,'function','self','%','total','%','calls',));
+    for name in sorted(totalCycles,key=lambda name : (-selfCycles.get(name,0),name,)):
+      fp.write('  %-*s %10d %6.2f %10d %6.2f %8d\n' % (width,name,selfCycles.get(name,0),Percent(selfCycles.get(name,0)),totalCycles[name],Percent(totalCycles[name]),calls.get(name,0),));
+    # Call graph.
+    if self.callCounts:
+      edgeCycles = dict();
+      for (stack,count,) in self.stackCounts.iteritems():
+        for edge in set(zip(stack[:-1],stack[1:])):
+          edgeCycles[edge] = edgeCycles.get(edge,0) + count;
+      edges = sorted(self.callCounts,key=lambda edge : (-edgeCycles.get(edge,0),edge,));
+      edgeWidth = max([len('%s -> %s' % edge) for edge in edges]+[len('call')]);
+      fp.write('\nCall graph\n');
+      fp.write('  %-*s %8s %10s %6s\n' % (edgeWidth,'call','calls','total','%',));
+      for edge in edges:
+        fp.write('  %-*s %8d %10d %6.2f\n' % (edgeWidth,'%s -> %s' % edge,self.callCounts[edge],edgeCycles.get(edge,0),Percent(edgeCycles.get(edge,0)),));
+    # Source lines.
+    lineCycles = sorted(self.LineCycles().iteritems(),key=lambda item : (-item[1],item[0],))[:nLines];
+    if lineCycles:
+      fp.write('\nSource lines\n');
+      fp.write('  %10s %6s  %s\n' % ('cycles','%','line',));
+      for ((filename,line,),count,) in lineCycles:
+        fp.write('  %10d %6.2f  %s:%d\n' % (count,Percent(count),filename,line,));
+    # Loops.
+    loops = sorted(self.Loops(),reverse=True)[:nLoops];
+    if loops:
+      fp.write('\nHot loops\n');
+      fp.write('  %10s %6s %10s  %s\n' % ('cycles','%','iterations','loop',));
+      for (count,iterations,start,end,) in loops:
+        (filename,line,) = self.sources[start];
+        fp.write('  %10d %6.2f %10d  %s:%s 0x%04X-0x%04X %s:%s\n' % (count,Percent(count),iterations,self.functionNames[start],self.labels.get(start,''),start,end,filename,line,));
+    # Interrupt handler.
+    if self.debugInfo['program']['interruptVector'] != None:
+      fp.write('\nInterrupt handler\n');
+      fp.write('  %d interrupts, %d clock cycles (%.2f%%) including 2 clock cycles to enter the handler\n' % (self.nInterrupts,totalCycles.get('.interrupt',0),Percent(totalCycles.get('.interrupt',0)),));
+      if self.interruptCycles:
+        (nCompleted,minCycles,maxCycles,sumCycles,) = self.interruptCycles;
+        fp.write('  %d/%.1f/%d min/average/max clock cycles per interrupt\n' % (minCycles,1.0*sumCycles/nCompleted,maxCycles,));
+
+  def WriteFolded(self,fp):
+    """
+    Write the call stacks and their clock cycles in the folded format used by
+    flame graph tools, i.e., one line per call stack with the function names
+    separated by ";" followed by a space and the number of clock cycles.
+    """
+    for stack in sorted(self.stackCounts):
+      fp.write('%s %d\n' % (';'.join(stack),self.stackCounts[stack],));
@@ -0,0 +1,823 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Cycle-accurate instruction-set simulator for SSBCC 9x8.
+#
+################################################################################
+
+class SimException(Exception):
+  """
+  Exception class for the simulator.\n
+  These are errors in the simulation image or in the simulation setup.
+  """
+  def __init__(self,message):
+    self.message = message;
+  def __str__(self):
+    return self.message;
+
+class sim9x8:
+  """
+  Cycle-accurate simulation of the 9x8 core as implemented by core.v.\n
+  The state is updated once per clock cycle using the same registers and
+  combinatorial signals as core.v, including the delay slot after jumps, calls,
+  and returns, the data and return stack pointers, the memory banks, the
+  inport/outport strobes, and the interrupt sequencing.\n
+  The processor is loaded from the simulation image written by ssbcc's
+  "--write-sim" option.  The lines of the image are:
+    :sim9x8
+    :pc_width <nbits>
+    :data_stack <nwords>
+    :return_stack <nwords>
+    :interrupt <vector> <enable outport> <disable outport> <inport or ->
+    :inport <index> <name>
+    :outport <index> <name>
+    :memory <RAM|ROM> <name> <bank> <address width>
+    <one 2-digit hex value per line>
+    :program <nwords>
+    <one 3-digit hex opcode per line>
+  where the ":interrupt", ":inport", ":outport", and ":memory" lines are
+  optional.\n
+  Peripherals are not simulated.  Instead, inport values are provided by the
+  Inport method, which can be replaced, outport writes are reported to the
+  Outport method, and interrupts are triggered by the RaiseInterrupt method.\n
+  Example:
+    sim = sim9x8.sim9x8('uc.9x8-sim');
+    sim.Reset(6);
+    for ix in range(1000):
+      print sim.Trace();
+      sim.Step();
+  """
+
+  # Names for the non-jump opcodes as displayed by display_trace.v.
+  opcodeNames = {
+    0x000:'nop', 0x001:'<<0', 0x002:'<<1', 0x003:'<<msb',
+    0x004:'0>>', 0x005:'1>>', 0x006:'msb>>', 0x007:'lsb>>',
+    0x008:'dup', 0x009:'r@', 0x00A:'over', 0x00B:'+c', 0x00F:'-c',
+    0x012:'swap', 0x018:'+', 0x01C:'-',
+    0x020:'0=', 0x021:'0<>', 0x022:'-1=', 0x023:'-1<>',
+    0x028:'return', 0x030:'inport', 0x038:'outport', 0x040:'>r', 0x049:'r>',
+    0x050:'&', 0x051:'or', 0x052:'^', 0x053:'nip', 0x054:'drop',
+    0x058:'1+', 0x05C:'1-',
+    0x060:'store0', 0x061:'store1', 0x062:'store2', 0x063:'store3',
+    0x068:'fetch0', 0x069:'fetch1', 0x06A:'fetch2', 0x06B:'fetch3',
+    0x070:'store0+', 0x071:'store1+', 0x072:'store2+', 0x073:'store3+',
+    0x074:'store0-', 0x075:'store1-', 0x076:'store2-', 0x077:'store3-',
+    0x078:'fetch0+', 0x079:'fetch1+', 0x07A:'fetch2+', 0x07B:'fetch3+',
+    0x07C:'fetch0-', 0x07D:'fetch1-', 0x07E:'fetch2-', 0x07F:'fetch3-',
+  };
+
+  # Maximum number of instructions in a translated block.
+  maxBlockLength = 256;
+
+  def __init__(self,image,translate=True):
+    """
+    Load the simulation image and initialize the processor.\n
+    image       name of the simulation image file or an open file object
+    translate   use translated blocks for untraced runs (see RunTranslated)
+    """
+    if type(image) == str:
+      try:
+        fp = open(image,'rt');
+      except:
+        raise SimException('Error opening "%s"' % image);
+    else:
+      fp = image;
+    self.LoadImage(fp);
+    fp.close();
+    # Sizes and masks.
+    self.pcMask = 2**self.pcWidth-1;
+    self.returnWidth = max(self.pcWidth,8);
+    self.dataPtrWidth = CeilLog2(self.dataStackLength);
+    self.returnPtrWidth = CeilLog2(self.returnStackLength);
+    self.dataPtrMask = 2**self.dataPtrWidth-1;
+    self.returnPtrMask = 2**self.returnPtrWidth-1;
+    self.dataPtrInit = self.dataPtrMask - 2;
+    self.returnPtrInit = self.returnPtrMask;
+    self.traceFormat = TraceFormat(self.pcWidth,self.dataPtrWidth,self.returnWidth,self.returnPtrWidth);
+    # Memory and stack contents are not affected by the reset.
+    self.dataStack = [0] * 2**self.dataPtrWidth;
+    self.returnStack = [0] * 2**self.returnPtrWidth;
+    self.banks = [None] * 4;
+    for memory in self.memories:
+      memory['value'] = memory['body'] + [0] * (2**memory['addrWidth'] - len(memory['body']));
+      memory['mask'] = 2**memory['addrWidth'] - 1;
+      self.banks[memory['bank']] = memory;
+    # Registers that aren't reset.
+    self.cycle = 0;
+    self.pcS0 = 0;
+    self.pcS1 = 0;
+    self.opcodeS = 0;
+    self.interruptS = False;
+    self.interruptedS = False;
+    self.pcS = 0;
+    self.runEnd = 0;
+    # Translated blocks indexed by (pc,opcode) and the blocks that depend on
+    # each instruction memory address.
+    self.translate = translate;
+    self.blocks = dict();
+    self.blockAddrs = dict();
+    # The initial values of the registers are the same as their reset values.
+    self.ResetRegisters();
+
+  ##############################################################################
+  #
+  # Load the simulation image.
+  #
+  ##############################################################################
+
+  def LoadImage(self,fp):
+    """
+    Read the simulation image described in the class documentation.
+    """
+    self.interrupt = None;
+    self.inports = dict();
+    self.outports = dict();
+    self.memories = list();
+    self.program = None;
+    body = None;
+    ixLine = 0;
+    for line in fp:
+      ixLine += 1;
+      line = line.strip();
+      if not line:
+        continue;
+      loc = '%s:%d' % (getattr(fp,'name','image'),ixLine,);
+      if line[0] != ':':
+        if body == None:
+          raise SimException('Value outside of a memory or program body at %s' % loc);
+        try:
+          body.append(int(line,16));
+        except:
+          raise SimException('Malformed value "%s" at %s' % (line,loc,));
+        continue;
+      a = line[1:].split();
+      try:
+        if a[0] == 'sim9x8':
+          continue;
+        elif a[0] == 'pc_width':
+          self.pcWidth = int(a[1]);
+        elif a[0] == 'data_stack':
+          self.dataStackLength = int(a[1]);
+        elif a[0] == 'return_stack':
+          self.returnStackLength = int(a[1]);
+        elif a[0] == 'interrupt':
+          self.interrupt = dict(vector=int(a[1],0), ena=int(a[2]), dis=int(a[3]), inport=None if a[4] == '-' else int(a[4]));
+        elif a[0] == 'inport':
+          self.inports[a[2]] = int(a[1]);
+        elif a[0] == 'outport':
+          self.outports[a[2]] = int(a[1]);
+        elif a[0] == 'memory':
+          body = list();
+          self.memories.append(dict(type=a[1], name=a[2], bank=int(a[3]), addrWidth=int(a[4]), body=body));
+        elif a[0] == 'program':
+          body = list();
+          self.program = body;
+          self.programLength = int(a[1]);
+        else:
+          raise SimException('Unrecognized line "%s" at %s' % (line,loc,));
+      except (IndexError,ValueError):
+        raise SimException('Malformed line "%s" at %s' % (line,loc,));
+    for name in ('pcWidth','dataStackLength','returnStackLength',):
+      if not hasattr(self,name):
+        raise SimException('Simulation image is missing the %s' % name);
+    if self.program == None:
+      raise SimException('Simulation image is missing the program');
+    self.program += [0] * (2**self.pcWidth - len(self.program));
+
+  ##############################################################################
+  #
+  # Peripheral interface.
+  #
+  ##############################################################################
+
+  def Inport(self,ix):
+    """
+    Return the value of the specified input port.\n
+    Note:  This is called when an "inport" instruction is executed and can be
+           replaced to simulate the input ports.  The default returns 0.
+    """
+    return 0;
+
+  def Outport(self,ix,value):
+    """
+    Record the value written to the specified output port.\n
+    Note:  This is called when an "outport" instruction is executed and can be
+           replaced to simulate the output ports.  The default does nothing.
+    """
+    pass;
+
+  def RaiseInterrupt(self,mask=1):
+    """
+    Trigger the interrupt condition(s) in mask on the next clock cycle.
+    """
+    self.interruptRaw |= mask;
+
+  ##############################################################################
+  #
+  # Run the processor.
+  #
+  ##############################################################################
+
+  def Reset(self,nCycles=1):
+    """
+    Hold the processor in reset for the specified number of clock cycles.
+    """
+    for ix in range(nCycles):
+      self.Step(rst=True);
+
+  def Run(self,nCycles,fpTrace=None):
+    """
+    Run the processor for the specified number of clock cycles, optionally
+    writing the trace to fpTrace.\n
+    fpTrace     optional file object for the trace lines or
+                trace9x8.traceWriter object for a binary trace\n
+    Note:  Untraced runs use the translated blocks unless translation was
+           disabled when the simulator was constructed.
+    """
+    self.runEnd = self.cycle + nCycles;
+    if not fpTrace and self.translate:
+      self.RunTranslated();
+      return;
+    while self.cycle < self.runEnd:
+      self.WriteTrace(fpTrace);
+      self.Step();
+
+  def Stop(self,cycle=None):
+    """
+    End the current Run at the specified clock cycle or after the current clock
+    cycle if the cycle isn't specified.\n
+    Note:  This is intended to be called by the Inport and Outport methods.
+    """
+    if cycle == None:
+      cycle = self.cycle;
+    self.runEnd = min(self.runEnd,cycle);
+
+  def Step(self,rst=False):
+    """
+    Perform one clock cycle of the processor.
+    """
+    opcode = self.opcode;
+    T = self.T;
+    N = self.N;
+    R = self.returnStack[self.RPtr];
+    Np = self.dataStack[self.NpPtr];
+    # interrupt conditions
+    if self.interrupt:
+      interrupt = self.interruptEna and self.interruptTrigger and not self.inJump;
+      interrupted = self.interrupted;
+    else:
+      interrupt = False;
+      interrupted = False;
+    # default operation is nop/math_rotate
+    busPC = 'normal';
+    busRisPC = False;
+    returnOp = 0;
+    busT = 'rotate';
+    busN = 'N';
+    stackOp = 0;
+    isInport = False;
+    isOutport = False;
+    memWr = False;
+    if interrupted:
+      pass;
+    elif interrupt:
+      returnOp = 1;
+    elif opcode & 0x100:                        # push
+      busT = 'opcode';
+      busN = 'T';
+      stackOp = 1;
+    elif opcode & 0x080:                        # jump, jumpc, call, callc
+      if not (opcode & 0x020) or N:
+        busPC = 'jump';
+        if opcode & 0x040:
+          returnOp = 1;
+      busRisPC = True;
+      busT = 'N';
+      busN = 'stack';
+      stackOp = -1;
+    else:
+      group = (opcode >> 3) & 0xF;
+      if group == 0x1:                          # dup, r@, over, +/-c
+        busT = 'pre';
+        busN = 'T';
+        stackOp = 1;
+      elif group == 0x2:                        # swap
+        busT = 'N';
+        busN = 'T';
+      elif group == 0x3:                        # add, sub
+        busT = 'adder';
+        busN = 'stack';
+        stackOp = -1;
+      elif group == 0x4:                        # 0=, -1=, 0<>, -1<>
+        busT = 'compare';
+      elif group == 0x5:                        # return
+        busPC = 'return';
+        returnOp = -1;
+      elif group == 0x6:                        # inport
+        busT = 'inport';
+        isInport = True;
+      elif group == 0x7:                        # outport
+        busT = 'N';
+        busN = 'stack';
+        stackOp = -1;
+        isOutport = True;
+      elif group == 0x8:                        # >r
+        returnOp = 1;
+        busT = 'N';
+        busN = 'stack';
+        stackOp = -1;
+      elif group == 0x9:                        # r>
+        returnOp = -1;
+        busT = 'pre';
+        busN = 'T';
+        stackOp = 1;
+      elif group == 0xA:                        # &, or, ^, nip, drop
+        busT = 'logic';
+        busN = 'stack';
+        stackOp = -1;
+      elif group == 0xB:                        # 1+, 1-
+        busT = 'adder';
+      elif group == 0xC:                        # store
+        busT = 'N';
+        busN = 'stack';
+        stackOp = -1;
+        memWr = True;
+      elif group == 0xD:                        # fetch
+        busT = 'mem';
+      elif group == 0xE:                        # store+, store-
+        busT = 'adder';
+        busN = 'stack';
+        stackOp = -1;
+        memWr = True;
+      elif group == 0xF:                        # fetch+, fetch-
+        busT = 'adder';
+        busN = 'mem';
+        stackOp = 1;
+    # adder
+    if not (opcode & 0x040):
+      if opcode & 0x004:
+        adder = (N - T) & 0x1FF;
+      else:
+        adder = N + T;
+    elif opcode & 0x004:
+      adder = (T - 1) & 0x1FF;
+    else:
+      adder = T + 1;
+    # memory bus
+    memory = self.banks[opcode & 0x3];
+    memValue = memory['value'][T & memory['mask']] if memory else 0;
+    # next T
+    if busT == 'rotate':
+      if interrupt or interrupted:
+        Tnext = T;
+      else:
+        Tnext = self.Rotate(opcode & 0x7,T);
+    elif busT == 'opcode':
+      Tnext = opcode & 0xFF;
+    elif busT == 'N':
+      Tnext = N;
+    elif busT == 'pre':
+      sel = opcode & 0x3;
+      Tnext = (T, R & 0xFF, N, adder >> 8,)[sel];
+    elif busT == 'adder':
+      Tnext = adder & 0xFF;
+    elif busT == 'compare':
+      Tnext = 0xFF if (opcode & 0x1) ^ (T == (0xFF if opcode & 0x2 else 0x00)) else 0x00;
+    elif busT == 'inport':
+      Tnext = self.InportValue(T) & 0xFF;
+    elif busT == 'logic':
+      sel = opcode & 0x7;
+      Tnext = (N & T, N | T, N ^ T, T,)[sel] if sel < 4 else N;
+    else: # busT == 'mem'
+      Tnext = memValue;
+    # next N
+    if busN == 'stack':
+      Nnext = Np;
+    elif busN == 'T':
+      Nnext = T;
+    elif busN == 'mem':
+      Nnext = memValue;
+    else:
+      Nnext = N;
+    # next PC and value pushed onto the return stack
+    pcPlus1 = (self.pc + 1) & self.pcMask;
+    if interrupt:
+      pcNext = self.interrupt['vector'];
+      Rpre = self.pcS;
+    elif busPC == 'jump':
+      if self.pcWidth <= 8:
+        pcNext = T & self.pcMask;
+      else:
+        pcNext = ((opcode & (2**(self.pcWidth-8)-1)) << 8) | T;
+    elif busPC == 'return':
+      pcNext = R & self.pcMask;
+    else:
+      pcNext = pcPlus1;
+    if not interrupt:
+      Rpre = pcPlus1 if busRisPC else T;
+    # stack pointers
+    NpPtrNext = (self.NpPtr + stackOp) & self.dataPtrMask;
+    RPtrNext = (self.RPtr + returnOp) & self.returnPtrMask;
+    # Clock edge:  memories and stacks (not affected by the reset).
+    if stackOp == 1:
+      self.dataStack[NpPtrNext] = N;
+    if returnOp == 1:
+      self.returnStack[RPtrNext] = Rpre;
+    if memWr and memory and (memory['type'] == 'RAM'):
+      memory['value'][T & memory['mask']] = N;
+    # Clock edge:  trace and interrupt registers.
+    self.pcS1 = self.pcS0;
+    self.pcS0 = self.pc;
+    self.opcodeS = opcode;
+    self.interruptS = interrupt;
+    self.interruptedS = interrupted;
+    self.pcS = 0 if rst else self.pc;
+    self.cycle += 1;
+    if rst:
+      self.ResetRegisters();
+      return;
+    if self.interrupt:
+      self.inJump = busPC in ('jump','return',);
+      self.interrupted = interrupt;
+      if interrupt:
+        self.interruptEna = False;
+      elif isOutport and (T == self.interrupt['ena']):
+        self.interruptEna = True;
+      elif isOutport and (T == self.interrupt['dis']):
+        self.interruptEna = False;
+      if self.interrupt['inport'] == None:
+        clearTrigger = interrupt;
+      else:
+        clearTrigger = isInport and (T == self.interrupt['inport']);
+      if clearTrigger:
+        self.interruptTrigger = self.interruptRaw;
+      else:
+        self.interruptTrigger |= self.interruptRaw;
+      self.interruptRaw = 0;
+    # Clock edge:  processor registers and output ports.
+    if isOutport:
+      self.Outport(T,N);
+    self.opcode = self.program[self.pc];
+    self.pc = pcNext;
+    self.T = Tnext;
+    self.N = Nnext;
+    self.NpPtr = NpPtrNext;
+    self.RPtr = RPtrNext;
+
+  def ResetRegisters(self):
+    """
+    Set the registers to their values during the reset.
+    """
+    self.pc = 0;
+    self.opcode = 0;
+    self.T = 0;
+    self.N = 0;
+    self.NpPtr = self.dataPtrInit;
+    self.RPtr = self.returnPtrInit;
+    self.inJump = False;
+    self.interrupted = False;
+    self.interruptEna = False;
+    self.interruptTrigger = 0;
+    self.interruptRaw = 0;
+
+  def InportValue(self,ix):
+    """
+    Return the value for the inport instruction, including the interrupt
+    peripheral's trigger port.
+    """
+    if self.interrupt and (ix == self.interrupt['inport']):
+      return self.interruptTrigger;
+    return self.Inport(ix);
+
+  @staticmethod
+  def Rotate(op,T):
+    """
+    Compute the nop and shift/rotate instructions.
+    """
+    if op == 0:
+      return T;
+    elif op < 4:
+      return ((T << 1) & 0xFF) | (0, 0, 1, T >> 7,)[op];
+    else:
+      return (T >> 1) | ((0, 1, T >> 7, T & 0x1,)[op-4] << 7);
+
+  ##############################################################################
+  #
+  # Trace output.
+  #
+  ##############################################################################
+
+  @classmethod
+  def OpcodeName(cls,opcode):
+    """
+    Return the human-readable name of the opcode as displayed by
+    display_trace.v.
+    """
+    if opcode & 0x100:
+      return 'push';
+    if opcode & 0x080:
+      return ('jump','jumpc','call','callc',)[(opcode >> 5) & 0x3];
+    return cls.opcodeNames.get(opcode,'INVALID');
+
+  def Trace(self):
+    """
+    Return the trace line for the current clock cycle.\n
+    The line matches the output of the trace peripheral (see display_trace.v),
+    i.e., the program counter and opcode of the instruction whose results are
+    displayed followed by the data and return stacks.
+    """
+    if self.interruptS:
+      name = 'int';
+    elif self.interruptedS:
+      name = 'nop_int';
+    else:
+      name = self.OpcodeName(self.opcodeS);
+    return self.traceFormat % (
+      self.pcS1,
+      self.opcodeS,
+      name,
+      self.NpPtr,
+      self.N,
+      self.T,
+      self.returnStack[self.RPtr],
+      self.RPtr,
+    );
+
+  def WriteTrace(self,fpTrace):
+    """
+    Write the trace line for the current clock cycle to the file object or the
+    current clock cycle to the trace9x8.traceWriter object.
+    """
+    if not fpTrace:
+      pass;
+    elif hasattr(fpTrace,'WriteCycle'):
+      fpTrace.WriteCycle(self);
+    else:
+      fpTrace.write(self.Trace() + '\n');
+
+  ##############################################################################
+  #
+  # Block translation.
+  #
+  ##############################################################################
+
+  def RunTranslated(self):
+    """
+    Run the processor until the end of the current Run using the translated
+    blocks.\n
+    A block is the straight-line sequence of instructions from the current
+    program counter and opcode up to and including the next jump, call, or
+    return.  Each block is translated once into a Python function that performs
+    all of its clock cycles and is then reused whenever the processor reaches
+    the same program counter and opcode.  Inport and outport instructions also
+    end a block.  Clock cycles that can't be translated are performed by Step,
+    i.e., clock cycles where an interrupt could occur, inport and outport
+    instructions when there is an interrupt peripheral (since these can change
+    the interrupt state), and blocks that would run past the end of the Run.\n
+    Note:  The processor state after each block is the same as if Step had been
+           called for each of its clock cycles.
+    """
+    blocks = self.blocks;
+    interrupt = self.interrupt;
+    while self.cycle < self.runEnd:
+      if interrupt and (self.interrupted or self.interruptRaw or (self.interruptEna and self.interruptTrigger)):
+        self.Step();
+        continue;
+      key = (self.pc,self.opcode,);
+      if key in blocks:
+        block = blocks[key];
+      else:
+        block = self.TranslateBlock(self.pc,self.opcode);
+      if not block or (self.cycle + block[1] > self.runEnd):
+        self.Step();
+      else:
+        block[0](self);
+
+  def TranslateBlock(self,pc,opcode):
+    """
+    Translate the block starting with the specified program counter and opcode
+    and return the function and number of clock cycles for the block or None if
+    the first instruction can't be translated.\n
+    Note:  The block is added to the translated blocks.
+    """
+    key = (pc,opcode,);
+    pcs = list();
+    ops = list();
+    body = list();
+    pcNext = None;
+    while len(ops) < self.maxBlockLength:
+      isPort = (opcode & 0x1F0 == 0x030);
+      if isPort and self.interrupt:
+        break;
+      # Record the instruction memory address read during this clock cycle.
+      pcs.append(pc);
+      ops.append(opcode);
+      self.blockAddrs.setdefault(pc,set()).add(key);
+      if isPort:
+        body += self.TranslatePort(opcode,pcs,ops);
+        pcNext = '%d' % ((pc+1) & self.pcMask);
+        break;
+      if (opcode & 0x180 == 0x080) or (opcode & 0x1F8 == 0x028):
+        body += self.TranslateControl(opcode,(pc+1) & self.pcMask);
+        pcNext = 'pc';
+        break;
+      body += self.TranslateOpcode(opcode);
+      opcode = self.program[pc];
+      pc = (pc+1) & self.pcMask;
+    if not ops:
+      self.blocks[key] = None;
+      return None;
+    if pcNext == None:
+      pcNext = '%d' % pc;
+    # Load the registers, execute the block, and update the registers.
+    lines = [
+      'def block(sim,ds=ds,rs=rs,m0=m0,m1=m1,m2=m2,m3=m3):',
+      '  T = sim.T; N = sim.N; Np = sim.NpPtr; Rp = sim.RPtr',
+    ];
+    lines += ['  ' + line for line in body];
+    lines += [
+      '  sim.T = T; sim.N = N; sim.NpPtr = Np; sim.RPtr = Rp',
+      '  sim.pc = %s; sim.opcode = %d' % (pcNext,self.program[pcs[-1]],),
+    ];
+    if not (ops[-1] & 0x1F0 == 0x030):
+      lines += ['  ' + line for line in self.TranslateCycles(pcs,ops)];
+    if self.interrupt:
+      if pcNext != 'pc':
+        lines.append('  sim.inJump = False');
+      elif ops[-1] & 0x1A0 == 0x0A0:
+        lines.append('  sim.inJump = taken');
+      else:
+        lines.append('  sim.inJump = True');
+    namespace = dict(ds=self.dataStack, rs=self.returnStack);
+    for ix in range(4):
+      namespace['m%d' % ix] = self.banks[ix]['value'] if self.banks[ix] else None;
+    exec compile('\n'.join(lines) + '\n','<block 0x%X>' % pcs[0],'exec') in namespace;
+    block = (namespace['block'],len(ops),);
+    self.blocks[key] = block;
+    return block;
+
+  def TranslateCycles(self,pcs,ops):
+    """
+    Return the Python statements that update the clock cycle count and the
+    registers used by the trace after the specified clock cycles.
+    """
+    return [
+      'sim.cycle += %d' % len(ops),
+      'sim.pcS1 = %s' % ('%d' % pcs[-2] if len(pcs) > 1 else 'sim.pcS0'),
+      'sim.pcS0 = %d; sim.pcS = %d; sim.opcodeS = %d' % (pcs[-1],pcs[-1],ops[-1],),
+      'sim.interruptS = False; sim.interruptedS = False',
+    ];
+
+  def TranslateControl(self,opcode,pcPlus1):
+    """
+    Return the Python statements for the jump, call, or return opcode.\n
+    pcPlus1     value pushed onto the return stack by a call
+    """
+    dPop = 'N = ds[Np]; Np = (Np - 1) & %d' % self.dataPtrMask;
+    rPush = 'Rp = (Rp + 1) & %d; rs[Rp] = %d' % (self.returnPtrMask,pcPlus1,);
+    if opcode & 0x080 == 0:
+      return [
+        'pc = rs[Rp] & %d' % self.pcMask,
+        'Rp = (Rp - 1) & %d' % self.returnPtrMask,
+      ];
+    if self.pcWidth <= 8:
+      target = 'T & %d' % self.pcMask;
+    else:
+      target = '%d | T' % ((opcode & (2**(self.pcWidth-8)-1)) << 8);
+    lines = list();
+    if opcode & 0x020:
+      lines.append('taken = N != 0');
+      lines.append('if taken:');
+      lines.append('  pc = %s' % target);
+      if opcode & 0x040:
+        lines.append('  ' + rPush);
+      lines.append('else:');
+      lines.append('  pc = %d' % pcPlus1);
+    else:
+      lines.append('pc = %s' % target);
+      if opcode & 0x040:
+        lines.append(rPush);
+    lines.append('T = N; ' + dPop);
+    return lines;
+
+  def TranslateOpcode(self,opcode):
+    """
+    Return the Python statements for the opcode other than the jump, call,
+    return, inport, and outport opcodes.\n
+    Note:  These are the same calculations as Step.
+    """
+    dPush = 'Np = (Np + 1) & %d; ds[Np] = N' % self.dataPtrMask;
+    dPop = 'N = ds[Np]; Np = (Np - 1) & %d' % self.dataPtrMask;
+    if opcode & 0x100:                          # push
+      return [dPush, 'N = T; T = %d' % (opcode & 0xFF)];
+    # adder
+    if not (opcode & 0x040):
+      adder = '((N - T) & 0x1FF)' if opcode & 0x004 else '(N + T)';
+    else:
+      adder = '((T - 1) & 0x1FF)' if opcode & 0x004 else '(T + 1)';
+    # pre-computed value for dup, r@, over, +/-c, and r>
+    pre = ('T', '(rs[Rp] & 0xFF)', 'N', '(%s >> 8)' % adder,)[opcode & 0x3];
+    # memory bus
+    memory = self.banks[opcode & 0x3];
+    if memory:
+      memValue = 'm%d[T & %d]' % (opcode & 0x3,memory['mask'],);
+      memWr = [memValue + ' = N'] if memory['type'] == 'RAM' else [];
+    else:
+      memValue = '0';
+      memWr = [];
+    group = (opcode >> 3) & 0xF;
+    if group == 0x0:                            # nop, <<0, ..., lsb>>
+      rotate = (None,
+        '(T << 1) & 0xFF', '((T << 1) & 0xFF) | 1', '((T << 1) & 0xFF) | (T >> 7)',
+        'T >> 1', '(T >> 1) | 0x80', '(T >> 1) | (T & 0x80)', '(T >> 1) | ((T & 1) << 7)',
+      )[opcode & 0x7];
+      return ['T = ' + rotate] if rotate else [];
+    elif group == 0x1:                          # dup, r@, over, +/-c
+      return [dPush, 'N, T = T, ' + pre];
+    elif group == 0x2:                          # swap
+      return ['N, T = T, N'];
+    elif group == 0x3:                          # add, sub
+      return ['T = %s & 0xFF' % adder, dPop];
+    elif group == 0x4:                          # 0=, -1=, 0<>, -1<>
+      values = (0x00,0xFF,) if opcode & 0x1 else (0xFF,0x00,);
+      return ['T = %d if T == %d else %d' % (values[0],0xFF if opcode & 0x2 else 0x00,values[1],)];
+    elif group == 0x8:                          # >r
+      return ['Rp = (Rp + 1) & %d; rs[Rp] = T' % self.returnPtrMask, 'T = N; ' + dPop];
+    elif group == 0x9:                          # r>
+      return [dPush, 'N, T = T, ' + pre, 'Rp = (Rp - 1) & %d' % self.returnPtrMask];
+    elif group == 0xA:                          # &, or, ^, nip, drop
+      sel = opcode & 0x7;
+      return ['T = ' + (('N & T', 'N | T', 'N ^ T', 'T',)[sel] if sel < 4 else 'N'), dPop];
+    elif group == 0xB:                          # 1+, 1-
+      return ['T = %s & 0xFF' % adder];
+    elif group == 0xC:                          # store
+      return memWr + ['T = N; ' + dPop];
+    elif group == 0xD:                          # fetch
+      return ['T = ' + memValue];
+    elif group == 0xE:                          # store+, store-
+      return memWr + ['T = %s & 0xFF' % adder, dPop];
+    elif group == 0xF:                          # fetch+, fetch-
+      return [dPush, 'N, T = %s, %s & 0xFF' % (memValue,adder,)];
+    else:
+      raise Exception('Program Bug -- opcode 0x%03X not translated' % opcode);
+
+  def TranslatePort(self,opcode,pcs,ops):
+    """
+    Return the Python statements for the inport or outport opcode at the end of
+    a block.\n
+    The registers are written to the simulator before the Inport or Outport
+    method is called so that the method sees the same state as it would when
+    called by Step.\n
+    Note:  This is only used when there isn't an interrupt peripheral.
+    """
+    lines = [
+      'sim.T = T; sim.N = N; sim.NpPtr = Np; sim.RPtr = Rp',
+      'sim.pc = %d; sim.opcode = %d' % (pcs[-1],ops[-1],),
+    ];
+    if opcode & 0x008:                          # outport
+      lines += self.TranslateCycles(pcs,ops);
+      lines.append('sim.Outport(T,N)');
+      lines.append('T = N; N = ds[Np]; Np = (Np - 1) & %d' % self.dataPtrMask);
+    else:                                       # inport
+      if len(pcs) > 1:
+        lines += self.TranslateCycles(pcs[:-1],ops[:-1]);
+      lines.append('T = sim.Inport(T) & 0xFF');
+      lines += self.TranslateCycles(pcs[-1:],ops[-1:]);
+    return lines;
+
+  def WriteProgram(self,addr,values):
+    """
+    Write the values to the instruction memory starting at the specified
+    address and discard the translated blocks that include the modified
+    addresses.
+    """
+    for value in values:
+      addr &= self.pcMask;
+      self.program[addr] = value;
+      for key in self.blockAddrs.pop(addr,set()):
+        self.blocks.pop(key,None);
+      addr += 1;
+
+def TraceFormat(pcWidth,dataPtrWidth,returnWidth,returnPtrWidth):
+  """
+  Return the format of the trace lines for the program counter, opcode, opcode
+  name, data stack pointer, N, T, top of the return stack, and return stack
+  pointer with the widths used by display_trace.v.
+  """
+  return '%%0%dx %%03x %%-7s : %%0%dx %%02x %%02x : %%0%dx %%0%dx' % (
+    (pcWidth+3)/4,
+    (dataPtrWidth+3)/4,
+    (returnWidth+3)/4,
+    (returnPtrWidth+3)/4,
+  );
+
+def CeilLog2(v):
+  """
+  Return the smallest integer that has a power of 2 greater than or equal to
+  the argument.
+  """
+  tmp = 0;
+  while 2**tmp < v:
+    tmp = tmp + 1;
+  return tmp;
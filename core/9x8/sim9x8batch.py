@@ -0,0 +1,335 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Lockstep simulation of many instances of an SSBCC 9x8 processor using NumPy.
+#
+################################################################################
+
+import copy
+import numpy
+
+import sim9x8
+
+class sim9x8batch:
+  """
+  Cycle-accurate simulation of many instances of the same 9x8 program.\n
+  The registers, stacks, and memories of the instances are held in NumPy
+  arrays indexed by the instance and all of the instances are advanced by one
+  clock cycle with a single sequence of array operations.  Instances that take
+  different paths through the program are handled by computing the result of
+  every instruction class and selecting the result for each instance with
+  masks, i.e., each clock cycle costs about the same regardless of how far the
+  instances have diverged.\n
+  The instances differ only by the values provided by the Inport method and by
+  the interrupts raised for each instance.  For example, a sweep of sensor
+  values on an input port can be run using:
+    sim = sim9x8batch.sim9x8batch('uc.9x8-sim',1000);
+    sim.inportValues[:,sim.inports['I_SENSOR']] = numpy.random.randint(0,256,1000);
+    sim.Reset(6);
+    sim.Run(100000);
+  The Outport method is called with the per-instance port indices, values, and
+  the mask of the instances that executed an outport instruction and can be
+  replaced to record the results or to Stop the instances that are done.\n
+  The state of any instance can be extracted as a sim9x8 simulator using the
+  Instance method.
+  """
+
+  def __init__(self,image,nInstances):
+    """
+    Load the simulation image and initialize the instances.\n
+    image       name of the simulation image file or an open file object
+    nInstances  number of processor instances
+    """
+    self.sim = sim9x8.sim9x8(image,translate=False);
+    sim = self.sim;
+    self.nInstances = nInstances;
+    self.ix = numpy.arange(nInstances);
+    self.program = numpy.array(sim.program,dtype=numpy.int32);
+    for name in ('interrupt','inports','outports','pcWidth','pcMask','dataPtrMask','returnPtrMask','dataPtrInit','returnPtrInit',):
+      setattr(self,name,getattr(sim,name));
+    # Memory and stack contents are not affected by the reset.
+    self.dataStack = numpy.zeros((nInstances,len(sim.dataStack),),dtype=numpy.int32);
+    self.returnStack = numpy.zeros((nInstances,len(sim.returnStack),),dtype=numpy.int32);
+    self.banks = [None] * 4;
+    for memory in sim.memories:
+      self.banks[memory['bank']] = dict(
+        type=memory['type'],
+        name=memory['name'],
+        mask=memory['mask'],
+        value=numpy.tile(numpy.array(memory['value'],dtype=numpy.int32),(nInstances,1,)),
+      );
+    # Constant input port values used by the default Inport method.
+    self.inportValues = numpy.zeros((nInstances,256,),dtype=numpy.int32);
+    # Registers that aren't reset.
+    self.cycle = 0;
+    self.pcS = numpy.zeros(nInstances,dtype=numpy.int32);
+    self.active = numpy.ones(nInstances,dtype=bool);
+    self.runEnd = 0;
+    # The initial values of the registers are the same as their reset values.
+    self.ResetRegisters();
+
+  ##############################################################################
+  #
+  # Peripheral interface.
+  #
+  ##############################################################################
+
+  def Inport(self,ports,mask):
+    """
+    Return the values of the input ports for the instances.\n
+    ports       per-instance index of the input port
+    mask        instances executing an inport instruction\n
+    Note:  This can be replaced to simulate the input ports.  The default
+           returns the values in the inportValues array.
+    """
+    return self.inportValues[self.ix,ports & 0xFF];
+
+  def Outport(self,ports,values,mask):
+    """
+    Record the values written to the output ports by the instances.\n
+    ports       per-instance index of the output port
+    values      per-instance value written to the output port
+    mask        instances executing an outport instruction\n
+    Note:  This can be replaced to simulate the output ports.  The default does
+           nothing.
+    """
+    pass;
+
+  def RaiseInterrupt(self,mask=None,conditions=1):
+    """
+    Trigger the interrupt condition(s) in the specified instances (default all
+    instances) on the next clock cycle.
+    """
+    if mask is None:
+      self.interruptRaw |= conditions;
+    else:
+      self.interruptRaw[mask] |= conditions;
+
+  ##############################################################################
+  #
+  # Run the processors.
+  #
+  ##############################################################################
+
+  def Reset(self,nCycles=1):
+    """
+    Hold all of the instances in reset for the specified number of clock cycles
+    and make them all active.
+    """
+    self.active[:] = True;
+    for ix in range(nCycles):
+      self.Step(rst=True);
+
+  def Run(self,nCycles):
+    """
+    Run the processors for the specified number of clock cycles or until all of
+    the instances have been stopped.
+    """
+    self.runEnd = self.cycle + nCycles;
+    while (self.cycle < self.runEnd) and self.active.any():
+      self.Step();
+
+  def Stop(self,mask):
+    """
+    Stop the specified instances.  Their state is no longer updated.\n
+    Note:  This is intended to be called by the Inport and Outport methods.
+    """
+    self.active &= ~mask;
+
+  def Step(self,rst=False):
+    """
+    Perform one clock cycle of the active instances.\n
+    Note:  This is a vectorized version of sim9x8.Step.
+    """
+    ix = self.ix;
+    opcode = self.opcode;
+    T = self.T;
+    N = self.N;
+    R = self.returnStack[ix,self.RPtr];
+    Np = self.dataStack[ix,self.NpPtr];
+    active = self.active;
+    # interrupt conditions
+    if self.interrupt:
+      interrupt = active & self.interruptEna & (self.interruptTrigger != 0) & ~self.inJump;
+      interrupted = self.interrupted.copy();
+    else:
+      interrupt = numpy.zeros(self.nInstances,dtype=bool);
+      interrupted = interrupt;
+    # instruction classes
+    normal = active & ~interrupt & ~interrupted;
+    isPush = normal & (opcode & 0x100 != 0);
+    isJump = normal & (opcode & 0x180 == 0x080);
+    taken = isJump & ((opcode & 0x020 == 0) | (N != 0));
+    isCall = taken & (opcode & 0x040 != 0);
+    group = numpy.where(normal & (opcode & 0x180 == 0),(opcode >> 3) & 0xF,-1);
+    g = [group == ixGroup for ixGroup in range(16)];
+    isInport = g[0x6];
+    isOutport = g[0x7];
+    memWr = g[0xC] | g[0xE];
+    popData = isJump | g[0x3] | g[0x7] | g[0x8] | g[0xA] | g[0xC] | g[0xE];
+    pushData = isPush | g[0x1] | g[0x9] | g[0xF];
+    pushReturn = interrupt | isCall | g[0x8];
+    popReturn = g[0x5] | g[0x9];
+    # adder
+    bit2 = (opcode & 0x004 != 0);
+    adder = numpy.where(opcode & 0x040 == 0,
+                        numpy.where(bit2, (N - T) & 0x1FF, N + T),
+                        numpy.where(bit2, (T - 1) & 0x1FF, T + 1));
+    # memory bus
+    bank = opcode & 0x3;
+    memValue = numpy.zeros(self.nInstances,dtype=numpy.int32);
+    for ixBank in range(4):
+      memory = self.banks[ixBank];
+      if memory:
+        sel = (bank == ixBank);
+        memValue[sel] = memory['value'][ix[sel],T[sel] & memory['mask']];
+    # next T
+    sel = opcode & 0x3;
+    pre = numpy.choose(sel,(T, R & 0xFF, N, adder >> 8,));
+    compare = numpy.where((opcode & 0x1 != 0) ^ (T == numpy.where(opcode & 0x2 != 0,0xFF,0x00)),0xFF,0x00);
+    sel = opcode & 0x7;
+    logic = numpy.where(sel < 4,numpy.choose(sel & 0x3,(N & T, N | T, N ^ T, T,)),N);
+    rotate = numpy.choose(sel,(
+      T,
+      (T << 1) & 0xFF,
+      ((T << 1) & 0xFF) | 1,
+      ((T << 1) & 0xFF) | (T >> 7),
+      T >> 1,
+      (T >> 1) | 0x80,
+      (T >> 1) | (T & 0x80),
+      (T >> 1) | ((T & 1) << 7),
+    ));
+    rotate = numpy.where(normal,rotate,T);
+    if isInport.any():
+      inport = self.InportValue(T,isInport) & 0xFF;
+    else:
+      inport = T;
+    Tnext = numpy.select(
+      [isPush, isJump | g[0x2] | g[0x7] | g[0x8] | g[0xC], g[0x1] | g[0x9], g[0x3] | g[0xB] | g[0xE] | g[0xF], g[0x4], isInport, g[0xA], g[0xD]],
+      [opcode & 0xFF, N, pre, adder & 0xFF, compare, inport, logic, memValue],
+      rotate);
+    # next N
+    Nnext = numpy.select(
+      [g[0xF], popData, pushData | g[0x2]],
+      [memValue, Np, T],
+      N);
+    # next PC and value pushed onto the return stack
+    pcPlus1 = (self.pc + 1) & self.pcMask;
+    if self.pcWidth <= 8:
+      target = T & self.pcMask;
+    else:
+      target = ((opcode & (2**(self.pcWidth-8)-1)) << 8) | T;
+    pcNext = numpy.select(
+      [interrupt, taken, g[0x5]],
+      [self.interrupt['vector'] if self.interrupt else 0, target, R & self.pcMask],
+      pcPlus1);
+    Rpre = numpy.select([interrupt, isJump],[self.pcS, pcPlus1],T);
+    # stack pointers
+    stackOp = pushData.astype(numpy.int32) - popData.astype(numpy.int32);
+    returnOp = pushReturn.astype(numpy.int32) - popReturn.astype(numpy.int32);
+    NpPtrNext = (self.NpPtr + stackOp) & self.dataPtrMask;
+    RPtrNext = (self.RPtr + returnOp) & self.returnPtrMask;
+    # Clock edge:  memories and stacks (not affected by the reset).
+    self.dataStack[ix[pushData],NpPtrNext[pushData]] = N[pushData];
+    self.returnStack[ix[pushReturn],RPtrNext[pushReturn]] = Rpre[pushReturn];
+    for ixBank in range(4):
+      memory = self.banks[ixBank];
+      if memory and (memory['type'] == 'RAM'):
+        sel = memWr & (bank == ixBank);
+        memory['value'][ix[sel],T[sel] & memory['mask']] = N[sel];
+    # Clock edge:  trace and interrupt registers.
+    self.pcS = numpy.where(active,0 if rst else self.pc,self.pcS);
+    self.cycle += 1;
+    if rst:
+      self.ResetRegisters();
+      return;
+    if self.interrupt:
+      self.inJump = numpy.where(active,taken | g[0x5],self.inJump);
+      self.interrupted = numpy.where(active,interrupt,self.interrupted);
+      ena = self.interruptEna & ~interrupt;
+      ena |= isOutport & (T == self.interrupt['ena']);
+      ena &= ~(isOutport & (T == self.interrupt['dis']) & (T != self.interrupt['ena']));
+      self.interruptEna = numpy.where(active,ena,self.interruptEna);
+      if self.interrupt['inport'] == None:
+        clearTrigger = interrupt;
+      else:
+        clearTrigger = isInport & (T == self.interrupt['inport']);
+      trigger = numpy.where(clearTrigger,self.interruptRaw,self.interruptTrigger | self.interruptRaw);
+      self.interruptTrigger = numpy.where(active,trigger,self.interruptTrigger);
+      self.interruptRaw = numpy.where(active,0,self.interruptRaw);
+    # Clock edge:  processor registers and output ports.
+    if isOutport.any():
+      self.Outport(T,N,isOutport);
+    self.opcode = numpy.where(active,self.program[self.pc],opcode);
+    self.pc = numpy.where(active,pcNext,self.pc);
+    self.T = numpy.where(active,Tnext,T);
+    self.N = numpy.where(active,Nnext,N);
+    self.NpPtr = numpy.where(active,NpPtrNext,self.NpPtr);
+    self.RPtr = numpy.where(active,RPtrNext,self.RPtr);
+
+  def ResetRegisters(self):
+    """
+    Set the registers of the active instances to their values during the reset.
+    """
+    n = self.nInstances;
+    if not hasattr(self,'pc'):
+      self.pc = numpy.zeros(n,dtype=numpy.int32);
+      self.opcode = numpy.zeros(n,dtype=numpy.int32);
+      self.T = numpy.zeros(n,dtype=numpy.int32);
+      self.N = numpy.zeros(n,dtype=numpy.int32);
+      self.NpPtr = numpy.zeros(n,dtype=numpy.int32);
+      self.RPtr = numpy.zeros(n,dtype=numpy.int32);
+      self.inJump = numpy.zeros(n,dtype=bool);
+      self.interrupted = numpy.zeros(n,dtype=bool);
+      self.interruptEna = numpy.zeros(n,dtype=bool);
+      self.interruptTrigger = numpy.zeros(n,dtype=numpy.int32);
+      self.interruptRaw = numpy.zeros(n,dtype=numpy.int32);
+    active = self.active;
+    for name in ('pc','opcode','T','N','interruptTrigger','interruptRaw',):
+      getattr(self,name)[active] = 0;
+    self.NpPtr[active] = self.dataPtrInit;
+    self.RPtr[active] = self.returnPtrInit;
+    for name in ('inJump','interrupted','interruptEna',):
+      getattr(self,name)[active] = False;
+
+  def InportValue(self,ports,mask):
+    """
+    Return the values for the inport instruction, including the interrupt
+    peripheral's trigger port.
+    """
+    values = self.Inport(ports,mask);
+    if self.interrupt and (self.interrupt['inport'] != None):
+      values = numpy.where(ports == self.interrupt['inport'],self.interruptTrigger,values);
+    return values;
+
+  ##############################################################################
+  #
+  # Access to individual instances.
+  #
+  ##############################################################################
+
+  def Instance(self,ixInstance):
+    """
+    Return a sim9x8 simulator with the state of the specified instance.\n
+    Note:  The trace registers of the returned simulator are not set.
+    """
+    sim = copy.copy(self.sim);
+    sim.blocks = dict();
+    sim.blockAddrs = dict();
+    sim.cycle = self.cycle;
+    for name in ('pc','opcode','T','N','NpPtr','RPtr','interruptTrigger','interruptRaw',):
+      setattr(sim,name,int(getattr(self,name)[ixInstance]));
+    for name in ('inJump','interrupted','interruptEna',):
+      setattr(sim,name,bool(getattr(self,name)[ixInstance]));
+    sim.pcS = int(self.pcS[ixInstance]);
+    sim.dataStack = [int(v) for v in self.dataStack[ixInstance]];
+    sim.returnStack = [int(v) for v in self.returnStack[ixInstance]];
+    sim.banks = [None] * 4;
+    sim.memories = list();
+    for memory in self.sim.memories:
+      memory = dict(memory);
+      memory['value'] = [int(v) for v in self.banks[memory['bank']]['value'][ixInstance]];
+      sim.memories.append(memory);
+      sim.banks[memory['bank']] = memory;
+    return sim;
@@ -11,6 +11,7 @@ import os
 import random
 import re
 
+from ssbccPeripheral import SSBCCinterruptPeripheral;
 from ssbccUtil import *;
 
 ################################################################################
@@ -237,7 +238,14 @@ def genMemories(fp,fpMemFile,config,programBody):
   Initialize the instruction memory.\n
   fp            file handle for the output core
   fpMemFile     file handle for the memory initialization file
-                Note:  This can be used to avoid running synthesis again.
+                Note:  This can be used to avoid running synthesis again.\n
+  If "readmemh" is set then the memories are initialized by $readmemh calls
+  and the bodies of the corresponding hex files are added to config.hexfiles.
+  Words set by parameters are still assigned in the core so that parameter
+  overrides are honored.\n
+  The return is the tuple of the start and end positions in fp of the
+  "initial" blocks for the memories.  Everything else generated for the core is
+  independent of the memory contents.
   """
   combines = config.config['combine'];
   # Declare instruction ROM(s).
@@ -269,6 +277,8 @@ def genMemories(fp,fpMemFile,config,programBody):
   # Vertical separation between declarations and first initialization.
   fp.write('\n');
   # Initialize the instruction memory.
+  initStart = fp.tell();
+  readmemh = config.Get('readmemh');
   (combined,port,packing) = config.GetPacking('INSTRUCTION');
   fp.write('initial begin\n');
   ixRecordedBody = 0;
@@ -289,12 +299,16 @@ def genMemories(fp,fpMemFile,config,programBody):
       formatn = '  %s[\'h%%0%dX] = { %d\'d0, 9\'h%%s }; // %%s\n' % (memName,instructionAddrWidth,nbits-9,);
       formate = '  %s[\'h%%0%dX] = { %d\'d0, 9\'h%%03x };\n' % (memName,instructionAddrWidth,nbits-9,);
     rand_instr_mem = config.Get('rand_instr_mem');
+    hexBody = genMemories_readmemh(fp,config,memName,nbits) if readmemh else None;
     for ixMem in range(instructionMemory['blockSize']):
       memAddr = instructionMemory['blockSize']*ixBlock+ixMem;
       if ixRecordedBody < len(programBody):
         for ixRecordedBody in range(ixRecordedBody,len(programBody)):
           if programBody[ixRecordedBody][0] == '-':
-            fp.write('  // %s\n' % programBody[ixRecordedBody][2:]);
+            if readmemh:
+              hexBody.append((None,None,programBody[ixRecordedBody][2:],));
+            else:
+              fp.write('  // %s\n' % programBody[ixRecordedBody][2:]);
           else:
             if programBody[ixRecordedBody][0] == 'p':
               (parameterString,parameterComment) = re.findall(r'(\S+)(.*)$',programBody[ixRecordedBody][2:])[0];
@@ -303,13 +317,21 @@ def genMemories(fp,fpMemFile,config,programBody):
               if len(parameterComment) > 0:
                 fp.write(' // %s' % parameterComment[1:]);
               fp.write('\n');
+              if readmemh:
+                hexBody.append((ixMem,0x100 + config.GetParameterValue(parameterString),parameterString,));
+            elif readmemh:
+              hexBody.append((ixMem,int(programBody[ixRecordedBody][0:3],16),programBody[ixRecordedBody][4:],));
+              fpMemFile.write('@%04X %s\n' % (memAddr,programBody[ixRecordedBody][0:3],));
             else:
               fp.write(formatn % (ixMem,programBody[ixRecordedBody][0:3],programBody[ixRecordedBody][4:]));
               fpMemFile.write('@%04X %s\n' % (memAddr,programBody[ixRecordedBody][0:3],));
             break;
         ixRecordedBody = ixRecordedBody + 1;
       elif ixInstruction < instructionBodyLength:
-        fp.write(formate % (ixMem,0 if not rand_instr_mem else random.randint(0,2**9-1),));
+        if readmemh:
+          hexBody.append((ixMem,0 if not rand_instr_mem else random.randint(0,2**9-1),None,));
+        else:
+          fp.write(formate % (ixMem,0 if not rand_instr_mem else random.randint(0,2**9-1),));
         fpMemFile.write('@%04X 000\n' % memAddr);
       else:
         break;
@@ -319,25 +341,26 @@ def genMemories(fp,fpMemFile,config,programBody):
   if len(combined['port']) > 1:
     offset0 = instructionMemory['blockSize']*(instructionMemory['nBlocks']-1);
     combined['port'][1]['offset'] -= offset0;
-    genMemories_init(fp,config,combined,fpMemFile=fpMemFile,memName=memName,memLength=instructionMemory['blockSize']);
+    genMemories_init(fp,config,combined,fpMemFile=fpMemFile,memName=memName,memLength=instructionMemory['blockSize'],hexBody=hexBody);
   fp.write('end\n\n');
   # Initialize the data stack.
   for combined in [thisCombined for thisCombined in combines if thisCombined['port'][0]['packing'][0]['name'] == 'DATA_STACK']:
     fp.write('initial begin\n');
-    genMemories_init(fp,config,combined);
+    genMemories_init(fp,config,combined,hexBody=genMemories_readmemh(fp,config,combined['memName'],combined['memWidth']) if readmemh else None);
     fp.write('end\n\n');
     break;
   # Initialize the return stack.
   for combined in [thisCombined for thisCombined in combines if thisCombined['port'][0]['packing'][0]['name'] == 'RETURN_STACK']:
     fp.write('initial begin\n');
-    genMemories_init(fp,config,combined);
+    genMemories_init(fp,config,combined,hexBody=genMemories_readmemh(fp,config,combined['memName'],combined['memWidth']) if readmemh else None);
     fp.write('end\n\n');
     break;
   # Initialize the memories
   for combined in [thisCombined for thisCombined in combines if thisCombined['port'][0]['packing'][0]['name'] not in ('INSTRUCTION','DATA_STACK','RETURN_STACK',)]:
     fp.write('initial begin\n');
-    genMemories_init(fp,config,combined);
+    genMemories_init(fp,config,combined,hexBody=genMemories_readmemh(fp,config,combined['memName'],combined['memWidth']) if readmemh else None);
     fp.write('end\n\n');
+  initEnd = fp.tell();
   # Generate the opcode read logic.
   fp.write('//\n');
   fp.write('// opcode read logic\n');
@@ -503,6 +526,8 @@ def genMemories(fp,fpMemFile,config,programBody):
               source = '{ %d\'d0, s_N }' % (combined['memWidth']-8);
             fp.write('    %s[%s] <= %s; // memory %s\n' % (combined['memName'],addrString,source,packing['name'],));
         fp.write('end\n\n');
+  # Return the location of the memory initialization.
+  return (initStart,initEnd,);
 
 def genMemories_assign(fp,mode,combined,port,packing,addr,sigName):
   """
@@ -559,11 +584,13 @@ def genMemories_assign(fp,mode,combined,port,packing,addr,sigName):
       fp.write('always @ (%s[%s],%s)\n' % (memName,thisAddr,thisAddr,));
       fp.write('  %s = %s[%s];\n' % (thisSignal,memName,thisAddr,));
 
-def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=None):
+def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=None,hexBody=None):
   """
   Utility function for genMemories.\n
   Generate the logic to initialize memories based on the memory width and the
-  initialization output from the assembler.
+  initialization output from the assembler.\n
+  If hexBody is provided then the addresses, values, and comments are appended
+  to it for the $readmemh file instead of generating the initialization logic.
   """
   if not memName:
     memName = combined['memName'];
@@ -594,7 +621,7 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
           curOffset = 0;
           while curOffset < port['packing'][0]['length']:
             addr = port['offset']+port['ratio']*curOffset+packing['lane']+thisRatio;
-            thisFill.append({ 'assign':(formate % addr) });
+            thisFill.append({ 'addr':addr, 'assign':(formate % addr) });
             thisValue.append(0);
             curOffset += 1;
       else:
@@ -609,10 +636,10 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
         if memParam['body'] != None:
           for line in memParam['body']:
             if line[0] == '-':
-              varName = line[2:-1];
+              varName = line[2:];
               continue;
             addr = port['offset']+port['ratio']*curOffset+packing['lane'];
-            thisFill.append({ 'assign':(formatd % (addr,line[0:2],)) });
+            thisFill.append({ 'addr':addr, 'assign':(formatd % (addr,line[0:2],)) });
             thisFill[-1]['comment'] = varName if varName else '.';
             thisValue.append(int(line[0:2],16));
             varName = None;
@@ -621,7 +648,7 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
         raise Exception('Program Bug -- memory body longer than allocated memory space');
       while curOffset < packing['length']:
         addr = port['ratio']*curOffset+port['offset'];
-        thisFill.append({ 'assign':(formate % addr) });
+        thisFill.append({ 'addr':addr, 'assign':(formate % addr) });
         thisValue.append(0);
         curOffset += 1;
     endLength = port['nWords']/port['ratio'];
@@ -631,12 +658,12 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
       curOffset = len(thisFill);
       if curOffset < endLength:
         addr = port['ratio']*curOffset+port['offset']+ixFill;
-        thisFill.append({ 'assign':(formate % addr), 'comment':'***' });
+        thisFill.append({ 'addr':addr, 'assign':(formate % addr), 'comment':'***' });
         thisValue.append(0);
         curOffset += 1;
         while curOffset < endLength:
           addr = port['ratio']*curOffset+port['offset']+ixFill;
-          thisFill.append({ 'assign':(formate % addr) });
+          thisFill.append({ 'addr':addr, 'assign':(formate % addr) });
           thisValue.append(0);
           curOffset += 1;
     for thisFill in fills:
@@ -664,10 +691,17 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
     names = [packing['name'] for packing in port['packing']];
     while len(names) < len(fills):
       names.append('');
-    names[0] = '// '+names[0];
-    fp.write(formatLine % tuple(names));
-    for ixFill in range(lens[0]):
-      fp.write(formatLine % tuple([thisFill[ixFill]['output'] for thisFill in fills]));
+    if hexBody != None:
+      hexBody.append((None,None,' '.join(name for name in names if name),));
+      for ixFill in range(lens[0]):
+        for ixCol in range(len(fills)):
+          entry = fills[ixCol][ixFill];
+          hexBody.append((entry['addr'],values[ixCol][ixFill],entry.get('comment'),));
+    else:
+      names[0] = '// '+names[0];
+      fp.write(formatLine % tuple(names));
+      for ixFill in range(lens[0]):
+        fp.write(formatLine % tuple([thisFill[ixFill]['output'] for thisFill in fills]));
     if fpMemFile:
       for port in combined['port']:
         if port['packing'][0]['name'] != 'INSTRUCTION':
@@ -680,6 +714,39 @@ def genMemories_init(fp,config,combined,fpMemFile=None,memName=None,memLength=No
           fpMemFile.write('@%04X %03X\n' % (addr,values[ixCol][ixFill],));
           addr += 1;
 
+def genMemories_readmemh(fp,config,memName,memWidth):
+  """
+  Utility function for genMemories.\n
+  Generate the $readmemh call to initialize the named memory, add the
+  corresponding hex file to config.hexfiles, and return the list to which the
+  addresses, values, and comments for the memory are to be appended.
+  """
+  hexName = '%s_%s.hex' % (os.path.splitext(genOutName(config.Get('outCoreName')))[0],memName,);
+  fp.write('  $readmemh("%s", %s);\n' % (hexName,memName,));
+  hexBody = list();
+  config.hexfiles.append(dict(name=hexName, memWidth=memWidth, body=hexBody));
+  return hexBody;
+
+def genMemories_hexFile(fp,hexfile):
+  """
+  Write the hex file for a memory initialized by $readmemh.\n
+  Comments without an address are written on their own lines and the address is
+  written whenever it doesn't follow the previous address.
+  """
+  format = '%%0%dX' % ((hexfile['memWidth']+3)/4,);
+  nextAddr = None;
+  for (addr,value,comment) in hexfile['body']:
+    if addr == None:
+      fp.write('// %s\n' % comment);
+      continue;
+    if addr != nextAddr:
+      fp.write('@%X\n' % addr);
+    if comment:
+      fp.write('%s // %s\n' % (format % value,comment,));
+    else:
+      fp.write('%s\n' % (format % value));
+    nextAddr = addr + 1;
+
 def genMemories_stack(fp,combined,port,packing,inSignalName,outSignalName,muxTest):
   nbits = packing['nbits'];                             # number of bits in the signal
   totalWidth = packing['ratio'] * combined['memWidth']; # width of the [multi-]word memory access
@@ -887,6 +954,49 @@ def genSignals(fp,config):
     outString += ';\n'
     fp.write(outString);
 
+def genSimImage(fp,config,programBody):
+  """
+  Write the image used by the instruction-set simulator in sim9x8.py.\n
+  The parameters used by the program are set to their values in the
+  architecture file or on the command line.  The address width of each memory
+  is the width used by the memory read and write logic.
+  """
+  fp.write(':sim9x8\n');
+  fp.write(':pc_width %d\n' % CeilLog2(config.Get('nInstructions')['length']));
+  fp.write(':data_stack %d\n' % config.Get('data_stack'));
+  fp.write(':return_stack %d\n' % config.Get('return_stack'));
+  if config.InterruptVector():
+    interrupt = SSBCCinterruptPeripheral.instance;
+    fp.write(':interrupt 0x%X %d %d %s\n' % (
+      config.InterruptVector(),
+      interrupt.ix_outport_interrupt_ena,
+      interrupt.ix_outport_interrupt_dis,
+      interrupt.ix_inport if hasattr(interrupt,'ix_inport') else '-',
+    ));
+  for ix in range(config.NInports()):
+    fp.write(':inport %d %s\n' % (ix,config.inports[ix][0],));
+  for ix in range(config.NOutports()):
+    fp.write(':outport %d %s\n' % (ix,config.outports[ix][0],));
+  for ixBank in range(4):
+    memParam = config.GetMemoryByBank(ixBank);
+    if not memParam:
+      continue;
+    (combined,port,packing) = config.GetPacking(memParam['name']);
+    addrWidth = CeilLog2(port['nWords'])-CeilLog2(port['ratio']);
+    fp.write(':memory %s %s %d %d\n' % (memParam['type'],memParam['name'],ixBank,addrWidth,));
+    for line in memParam['body'] or list():
+      if line[0] != '-':
+        fp.write('%s\n' % line[0:2]);
+  fp.write(':program %d\n' % config.Get('nInstructions')['length']);
+  for line in programBody:
+    if line[0] == '-':
+      continue;
+    elif line[0] == 'p':
+      parameterString = re.findall(r'(\S+)',line[2:])[0];
+      fp.write('%03X\n' % (0x100 + config.GetParameterValue(parameterString)));
+    else:
+      fp.write('%s\n' % line[0:3]);
+
 def genSPCnext(fp,config):
   """
   Write the logic to generate the next PC address.\n
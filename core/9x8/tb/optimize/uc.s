@@ -0,0 +1,96 @@
+; Copyright 2015, Sinclair R.F., Inc.
+;
+; Test bench for the program transformations made by the assembler.  The values
+; written to O_VALUE must be the same with and without the transformations.
+
+.main
+
+  ; Peephole rules.
+  0x12 0x34 swap swap - .call(out)
+  3 4 + 0x0F & .call(out)
+  0x5A dup drop 0<> 0<> .call(out)
+
+  ; The "+" is moved into the delay slot of the ".return".
+  0x20 .call(add3) .call(out)
+
+  ; The ".call" followed by ".return" becomes a ".jump".
+  0x30 .call(tail)
+
+  ; Not a tail call since the delay slot of the ".return" is not empty.
+  0x99 0x21 0x22 .call(tail_drop) .call(out)
+
+  ; The ">r" is not moved into the delay slot of the ".call".
+  0x44 >r .call(nothing) r> .call(out)
+
+  ; The "r>" is not moved into the delay slot of the ".return".
+  0x50 .call(keep_r) .call(out)
+
+  ; Not a tail call since the delay slot of the ".call" uses the return stack.
+  0x60 .call(give_r)
+
+  ; Functions inlined into a function that is not inlined.
+  6 1 .callc(inline_test)
+  0 1 .callc(inline_test)
+
+  .outstrobe(O_DONE)
+  :infinite .jump(infinite)
+
+; ( u - )
+.function out
+  .outport(O_VALUE) .return
+
+; ( u - u+3 )
+.function add3
+  3 + .return
+
+; ( u - )
+.function tail
+  1+ .call(out) .return
+
+; ( u v - )
+.function tail_drop
+  .call(out) .return(drop)
+
+; ( - )
+.function nothing
+  .return
+
+; ( u - u )
+.function keep_r
+  >r 0x55 .call(out) r> .return
+
+; ( u - )
+.function give_r
+  .call(take_r,>r) .return
+
+; ( - )
+.function take_r
+  r> 1+ .call(out) .return
+
+; ( n - )
+; The function with one call site is inlined.  The functions with two call sites
+; are inlined, including within the first function, only with a large
+; "--inline-threshold".
+.function inline_test
+  .call(limit_sums)
+  5 .call(sum_down) .call(out)
+  0x35 .call(limit) .call(out)
+  .return
+
+; ( n - )  Output the sums of 1 through k, limited to 0x0F, for k = n down to 0.
+; Nothing is output for n = 0.
+.function limit_sums
+  dup .jumpc(some) .return(drop)
+  :some
+  ; @loop limit_loop 16
+  :limit_loop dup .call(sum_down) .call(limit) .call(out) .jumpc(limit_loop,1-) .return(drop)
+
+; ( n - sum )  Sum of 1 through n.
+.function sum_down
+  ; @loop sum_loop 16
+  0 swap :sum_loop swap over + swap .jumpc(sum_loop,1-) drop .return
+
+; ( u - u' )  Limit the value to 0x0F.
+.function limit
+  dup 0xF0 & .jumpc(large) .return
+  :large drop 0x0F .return
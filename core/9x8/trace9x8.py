@@ -0,0 +1,247 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Binary trace writer and decoder for the SSBCC 9x8 processor.
+#
+################################################################################
+
+import struct
+
+import sim9x8
+
+class TraceException(Exception):
+  """
+  Exception class for the binary traces.\n
+  These are errors in the trace file or in the simulation image used to decode
+  it.
+  """
+  def __init__(self,message):
+    self.message = message;
+  def __str__(self):
+    return self.message;
+
+# Binary trace magic number, i.e., "9x8T" when written little-endian, version,
+# and formats.
+MAGIC = 0x54387839;
+VERSION = 1;
+FORMATS = ('binary','flow',);
+
+# Maximum number of sequential clock cycles between two flow records.
+MAX_RUN = 0x7F;
+
+################################################################################
+#
+# Write the binary traces.
+#
+################################################################################
+
+class traceWriter:
+  """
+  Write the binary trace of a simulation in the same format as the trace
+  peripheral's "format=binary" and "format=flow" options.\n
+  The trace is a sequence of 32-bit words.  The header is 3 words:
+    0x54387839, i.e., "9x8T" for little-endian words
+    {16'd0, 8'd<format>, 8'd<version>} where the format is 1 for binary and 2
+      for flow
+    {8'd<return ptr width>, 8'd<return width>, 8'd<data ptr width>,
+      8'd<pc width>}
+  The binary format has 3 words for every clock cycle:
+    {7'd0, opcode[8:0], int, nop_int, pc[13:0]}
+    {R ptr[7:0], N ptr[7:0], T[7:0], N[7:0]}
+    {16'd0, R[15:0]}
+  where int and nop_int are the two clock cycles that enter the interrupt
+  handler, N ptr is the data stack pointer, and R and R ptr are the top of the
+  return stack and the return stack pointer.\n
+  The flow format has one word for each change in the control flow:
+    {run[6:0], opcode[8:0], int, nop_int, pc[13:0]}
+  where "run" is the number of clock cycles since the previous word where the
+  program counter was incremented.  A word is written when the program counter
+  is not one more than on the previous clock cycle, i.e., for taken jumps,
+  calls, and returns and during the reset, for the two clock cycles that enter
+  the interrupt handler, and when the run reaches 127.  Close writes a last
+  word for the sequential clock cycles after the previous word.
+  """
+
+  def __init__(self,fp,traceFormat,pcWidth,dataPtrWidth,returnWidth,returnPtrWidth):
+    """
+    Write the header.\n
+    fp          binary file object for the trace
+    traceFormat "binary" or "flow"
+    """
+    if traceFormat not in FORMATS:
+      raise TraceException('Unrecognized trace format "%s"' % traceFormat);
+    self.fp = fp;
+    self.flow = (traceFormat == 'flow');
+    self.pcMask = 2**pcWidth-1;
+    self.pcLast = None;
+    self.wordLast = None;
+    self.run = 0;
+    self.fp.write(struct.pack('<3I',
+      MAGIC,
+      (FORMATS.index(traceFormat)+1) << 8 | VERSION,
+      returnPtrWidth << 24 | returnWidth << 16 | dataPtrWidth << 8 | pcWidth,
+    ));
+
+  def WriteCycle(self,sim):
+    """
+    Write the current clock cycle of the sim9x8 object.
+    """
+    word = sim.opcodeS << 16 | sim.interruptS << 15 | sim.interruptedS << 14 | sim.pcS1;
+    if not self.flow:
+      self.fp.write(struct.pack('<3I',
+        word,
+        sim.RPtr << 24 | sim.NpPtr << 16 | sim.T << 8 | sim.N,
+        sim.returnStack[sim.RPtr],
+      ));
+      return;
+    pcLast = self.pcLast;
+    self.pcLast = sim.pcS1;
+    self.wordLast = word;
+    if (pcLast != None) and (sim.pcS1 == (pcLast+1) & self.pcMask) and not (sim.interruptS or sim.interruptedS) and (self.run < MAX_RUN):
+      self.run += 1;
+      return;
+    self.fp.write(struct.pack('<I',self.run << 25 | word));
+    self.run = 0;
+
+  def Close(self):
+    """
+    Write the sequential clock cycles after the last word of the flow format as
+    a word for the last clock cycle and close the file.
+    """
+    if self.flow and self.run:
+      self.fp.write(struct.pack('<I',(self.run-1) << 25 | self.wordLast));
+      self.run = 0;
+    self.fp.close();
+
+################################################################################
+#
+# Decode the binary traces.
+#
+################################################################################
+
+class trace9x8:
+  """
+  Decode a binary trace written by the trace peripheral or by the simulator
+  (see traceWriter).\n
+  The flow format only records the changes in the control flow, so the opcodes
+  of the sequential clock cycles are taken from the simulation image written by
+  ssbcc's "--write-sim" option and the data and return stacks are not
+  available.\n
+  Example:
+    trace = trace9x8.trace9x8(open('uc.9x8-trace','rb'),'uc.9x8-sim');
+    for line in trace.Lines():
+      print line;
+  """
+
+  def __init__(self,fp,image=None,header=''):
+    """
+    Read the header of the trace.\n
+    fp          binary file object for the trace
+    image       name of the simulation image file, an open file object, or a
+                sim9x8 object (required for the flow format)
+    header      start of the header if it has already been read from fp, for
+                example, to distinguish binary and text traces
+    """
+    self.fp = fp;
+    self.name = getattr(fp,'name','trace');
+    header += fp.read(12-len(header));
+    if len(header) != 12:
+      raise TraceException('Truncated header in "%s"' % self.name);
+    for self.endian in ('<','>',):
+      if struct.unpack(self.endian+'I',header[0:4])[0] == MAGIC:
+        break;
+    else:
+      raise TraceException('"%s" is not a binary trace' % self.name);
+    (magic,version,widths,) = struct.unpack(self.endian+'3I',header);
+    if (version & 0xFF) != VERSION:
+      raise TraceException('Unrecognized version %d in "%s"' % (version & 0xFF,self.name,));
+    if not (1 <= (version >> 8) <= len(FORMATS)):
+      raise TraceException('Unrecognized format %d in "%s"' % (version >> 8,self.name,));
+    self.format = FORMATS[(version >> 8) - 1];
+    self.pcWidth = widths & 0xFF;
+    self.dataPtrWidth = (widths >> 8) & 0xFF;
+    self.returnWidth = (widths >> 16) & 0xFF;
+    self.returnPtrWidth = (widths >> 24) & 0xFF;
+    self.pcMask = 2**self.pcWidth-1;
+    self.traceFormat = sim9x8.TraceFormat(self.pcWidth,self.dataPtrWidth,self.returnWidth,self.returnPtrWidth);
+    self.flowFormat = self.traceFormat.split(':')[0] + ':';
+    self.program = None;
+    if image != None:
+      if not isinstance(image,sim9x8.sim9x8):
+        try:
+          image = sim9x8.sim9x8(image,translate=False);
+        except sim9x8.SimException, msg:
+          raise TraceException(str(msg));
+      if image.pcWidth != self.pcWidth:
+        raise TraceException('Program counter width of "%s" does not match the simulation image' % self.name);
+      self.program = image.program;
+    elif self.format == 'flow':
+      raise TraceException('Simulation image required to decode the flow trace "%s"' % self.name);
+
+  def Words(self,nWords):
+    """
+    Return an iterator over the 32-bit words of the trace in groups of nWords.
+    """
+    size = 4*nWords;
+    unpack = struct.Struct(self.endian+'%dI' % nWords).unpack;
+    while True:
+      data = self.fp.read(size*4096);
+      if len(data) % size:
+        raise TraceException('Truncated record at the end of "%s"' % self.name);
+      if not data:
+        return;
+      for ix in range(0,len(data),size):
+        yield unpack(data[ix:ix+size]);
+
+  def Cycles(self):
+    """
+    Return an iterator over the clock cycles of the trace as tuples of the int
+    and nop_int flags, the program counter, the opcode, and, for the binary
+    format, the data stack pointer, N, T, the top of the return stack, and the
+    return stack pointer.  The stack values are None for the flow format.
+    """
+    if self.format == 'binary':
+      for (word,stacks,R,) in self.Words(3):
+        yield (
+          bool(word & 0x8000),
+          bool(word & 0x4000),
+          word & 0x3FFF,
+          (word >> 16) & 0x1FF,
+          (stacks >> 16) & 0xFF,
+          stacks & 0xFF,
+          (stacks >> 8) & 0xFF,
+          R & 0xFFFF,
+          stacks >> 24,
+        );
+      return;
+    program = self.program;
+    pcMask = self.pcMask;
+    pc = None;
+    for (word,) in self.Words(1):
+      if word >> 25:
+        if pc == None:
+          raise TraceException('Malformed first record in "%s"' % self.name);
+        for ix in range(word >> 25):
+          pc = (pc+1) & pcMask;
+          yield (False,False,pc,program[pc],None,None,None,None,None,);
+      pc = word & 0x3FFF;
+      yield (bool(word & 0x8000),bool(word & 0x4000),pc,(word >> 16) & 0x1FF,None,None,None,None,None,);
+
+  def Lines(self):
+    """
+    Return an iterator over the lines of the trace in the format of the trace
+    peripheral (see display_trace.v).\n
+    Note:  The lines of the flow format end after the name of the opcode.
+    """
+    for cycle in self.Cycles():
+      if cycle[0]:
+        name = 'int';
+      elif cycle[1]:
+        name = 'nop_int';
+      else:
+        name = sim9x8.sim9x8.OpcodeName(cycle[3]);
+      if cycle[4] == None:
+        yield self.flowFormat % (cycle[2],cycle[3],name,);
+      else:
+        yield self.traceFormat % ((cycle[2],cycle[3],name,)+cycle[4:]);
@@ -0,0 +1,270 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Assemble the program and generate the processor core for a configuration.
+#
+# These are the steps of ssbcc after the configuration file has been processed.
+# They are also used by ssbccSweep to build many variants of a processor.
+#
+################################################################################
+
+import os
+import re
+import StringIO
+import sys
+
+import ssbccGenVhdlPkg
+from ssbccPeripheral import InterruptPeripheralAssigned
+from ssbccUtil import *
+
+def AssembleProgram(config,**kwargs):
+  """
+  Run the assembler on the processor code and return the assembled memories
+  and program (see asmAssemble.Assemble).\n
+  config        processed configuration (see CompleteConfig)
+  kwargs        additional arguments for asmAssemble.Assemble, e.g., the
+                library and macro search paths, the optimization options, and
+                the optional output files
+  """
+  if config.Get('corepath') not in sys.path:
+    sys.path.append(config.Get('corepath'));
+  import asmAssemble
+  import asmDef
+  args = AssemblerInputs(config);
+  args.update(kwargs);
+  try:
+    return asmAssemble.Assemble(**args);
+  except asmDef.AsmException, msg:
+    raise SSBCCException(str(msg));
+
+def AssemblerInputs(config):
+  """
+  Return the arguments for asmAssemble.Assemble that are computed from the
+  configuration, i.e., the assembly source files, the symbols, the memory and
+  stack lengths, and the instruction memory size.
+  """
+  return dict(
+    filenames=re.split(r'\s+',config.Get('compiler')[1].strip()),
+    interruptsEnabled=InterruptPeripheralAssigned(),
+    constants=[(name,config.constants[name],) for name in config.constants],
+    defines=[name for name in config.defines],
+    parameters=[parameter[0] for parameter in config.parameters],
+    inports=[(config.inports[ix][0],ix,) for ix in range(config.NInports())],
+    outports=[(config.outports[ix][0],ix,) for ix in range(config.NOutports()) if not config.IsStrobeOnlyOutport(config.outports[ix])],
+    outstrobes=[(config.outports[ix][0],ix,) for ix in range(config.NOutports()) if config.IsStrobeOnlyOutport(config.outports[ix])],
+    memoryLengths=config.MemoryNameLengthList()+config.SignalLengthList(),
+    stackLengths=[(stack_name,config.config[stack_name],) for stack_name in ('data_stack','return_stack',)],
+    inlineBudget=config.Get('nInstructions')['length'],
+    instructionLength=config.Get('nInstructions')['length'],
+    memoryPacking=config.MemoryPacking(),
+  );
+
+def CompleteConfig(config):
+  """
+  Set the default values of the unspecified configuration commands, ensure the
+  required configuration commands were specified, and complete the memory
+  address assignments.
+  """
+  if not config.Exists('sram_width'):
+    config.Set('sram_width',9);
+  if not config.Exists('invertReset'):
+    config.Set('invertReset',False);
+  for (configName, configString) in [
+    ('architecture',  'ARCHITECTURE', ),
+    ('data_stack',    'DATA_STACK',   ),
+    ('nInstructions', 'INSTRUCTION',  ),
+    ('return_stack',  'RETURN_STACK', ),
+  ]:
+    if not config.Exists(configName):
+      raise SSBCCException('Required %s configuration command missing' % configString);
+  # Add memories that are not combined into singleton entries in the "combined"
+  # list and complete the address range assignments.
+  config.CompleteCombines();
+
+def GenerateCore(config,programBody,programOnly=False,writeSim=False):
+  """
+  Generate the processor core, its memory initialization file, and its VHDL
+  package file in the current directory and return a dictionary of their names
+  (core, mem, package, hexfiles, and sim).\n
+  config        configuration with the program recorded by RecordProgram
+  programBody   program body returned by RecordProgram
+  programOnly   if True, only update the memory initialization in the existing
+                core and memory initialization file
+  writeSim      if True, also write the instruction-set simulator image
+  """
+
+  #
+  # Access the language-specific core generator and core.
+  #
+
+  if config.Get('hdl') == 'Verilog':
+    ssbccGenFile = 'ssbccGenVerilog.py';
+  elif config.Get('hdl') == 'VHDL':
+    ssbccGenFile = 'ssbccGenVHDL.py';
+  else:
+    raise SSBCCException('Unrecognized hdl = "%s"' % config.Get('hdl'));
+
+  ssbccGenFile = os.path.join(config.Get('corepath'),ssbccGenFile);
+  if not os.path.isfile(ssbccGenFile):
+    raise SSBCCException('Core generator "%s" missing for hdl = "%s"' % (ssbccGenFile,config.Get('hdl'),));
+  gen = LoadModule(ssbccGenFile,globals());
+
+  rawCoreName = os.path.join(config.Get('corepath'),gen.genCoreName());
+  if not os.path.isfile(rawCoreName):
+    raise SSBCCException('Core "%s% missing for hdl = "%s"' % (rawCoreName,config.Get('hdl'),));
+  fpRawCore = open(rawCoreName,'rt');
+
+  outName = gen.genOutName(config.Get('outCoreName'));
+  memFileName = re.sub(r'\.v.*','.mem',outName);
+  outputs = dict(core=outName, mem=memFileName, package=None, hexfiles=list(), sim=None);
+
+  # Generate the core in memory for a program-only rebuild so that it can be
+  # compared to the existing core.
+  if programOnly:
+    fpOutCore = StringIO.StringIO();
+    fpMemFile = StringIO.StringIO();
+  else:
+    fpOutCore = open(outName,'wt');
+    fpMemFile = open(memFileName,'wt');
+
+  #
+  # Loop through the core, copying or filling in the file as required.
+  #
+
+  for line in fpRawCore:
+    # output fixed core contents while ensursing user-defined signals do not
+    # conflict with pre-defined core I/Os
+    if not re.match(r'..@SSBCC@',line):
+      if re.match(r'\s*(reg|wire)\s',line):
+        cmd = re.findall(r'\s*(reg|wire)\s+([[][^]]+]\s+)?(\w+)\b',line);
+        if config.IsSymbol(cmd[0][-1]):
+          raise SSBCCException('Symbol "%s" is used by the core and cannot be used by I/Os, peripherals, etc.' % cmd[0][-1]);
+      fpOutCore.write(line);
+      continue;
+    fillCommand = re.findall(r'..@SSBCC@\s+(\S+)',line)[0];
+    # memories
+    if fillCommand == 'memories':
+      memoryInitRange = gen.genMemories(fpOutCore,fpMemFile,config,programBody);
+    # peripherals
+    elif fillCommand == 'peripherals':
+      if not config.peripheral:
+        fpOutCore.write('//\n// No peripherals\n//\n');
+      for p in config.peripheral:
+        if p != config.peripheral[0]:
+          fpOutCore.write('\n');
+        p.GenHDL(fpOutCore,config);
+    # "s_memory" declaration
+    elif fillCommand == 's_memory':
+      if config.NMemories() == 0:
+        fpOutCore.write('wire [7:0] s_memory = 8\'h00;\n');
+      else:
+        fpOutCore.write('wire [7:0] s_memory;\n');
+    # user_header
+    elif fillCommand == 'user_header':
+      gen.genUserHeader(fpOutCore,config.Get('user_header'));
+    # Verilator tracing on/off
+    elif fillCommand == "verilator_tracing":
+      if config.Get('verilator_tracing_on'):
+        fpOutCore.write('/* verilator tracing_on */\n');
+      else:
+        fpOutCore.write('/* verilator tracing_off */\n');
+    # All others are specific to the core.
+    else:
+      gen.doFillCommand(fillCommand,fpOutCore,config);
+
+  fpRawCore.close();
+
+  if programOnly:
+    UpdateMemoryInitialization(outName,fpOutCore.getvalue(),memoryInitRange);
+    fp = open(memFileName,'wt');
+    fp.write(fpMemFile.getvalue());
+    fp.close();
+
+  # Write the $readmemh files.
+  for hexfile in config.hexfiles:
+    fp = open(hexfile['name'],'wt');
+    gen.genMemories_hexFile(fp,hexfile);
+    fp.close();
+    outputs['hexfiles'].append(hexfile['name']);
+
+  # Write the optional instruction-set simulator image.
+  if writeSim:
+    outputs['sim'] = config.Get('outCoreName')+'.9x8-sim';
+    fp = open(outputs['sim'],'wt');
+    gen.genSimImage(fp,config,programBody);
+    fp.close();
+
+  if programOnly:
+    return outputs;
+
+  fpOutCore.close();
+  fpMemFile.close();
+
+  # Write package file (for use in VHDL or mixed-language projects)
+  outputs['package'] = ssbccGenVhdlPkg.genVhdlPkg(config);
+
+  return outputs;
+
+def RecordProgram(config,assembled,filename,quiet=False):
+  """
+  Record the memories and the program returned by AssembleProgram in the
+  configuration, ensure the processor has been consistently defined, and
+  return the program body.\n
+  filename      name of the configuration file for error messages
+  quiet         if True, do not print the notes for stack depths that assume a
+                loop is executed once
+  """
+
+  # Record the memory bodies.
+  for memory in assembled['memories']:
+    memName = memory['name'];
+    if not config.IsMemory(memName):
+      raise SSBCCException('%s "%s" not declared in %s' % (memory['type'],memName,filename,));
+    memParam = config.GetMemoryParameters(memName);
+    if memory['type'] != memParam['type']:
+      raise SSBCCException('Type of memory "%s" is inconsistent' % memName);
+    if memory['length'] > memParam['maxLength']:
+      raise SSBCCException('Length of memory "%s" is %d which exceeds limit of %d' % (memName,memory['length'],memParam['maxLength'],));
+    config.SetMemoryParameters(memParam,dict(bank=memory['bank'],length=memory['length'],body=memory['body']));
+
+  # Record the program body, .main and optional .interrupt addresses, function
+  # addresses, and length.
+  program = assembled['program'];
+  if program['interrupt'] != None:
+    config.Set('interruptAddress',program['interrupt']);
+  config.Set('functions',assembled['functions']);
+  programBody = program['body'];
+  programBodyLength = len([line for line in programBody if line[0] != '-']);
+  if programBodyLength != program['length']:
+    raise SSBCCException('Program Bug:  program length doesn\'t match declared length');
+  maxProgramBodyLength = config.Get('nInstructions')['length'];
+  if programBodyLength > maxProgramBodyLength:
+    raise SSBCCException('Program body length = %d is longer than the allocated instruction table = %d' % (programBodyLength,maxProgramBodyLength,));
+
+  # Warn if the configured stacks are smaller than the depths computed by the
+  # assembler.  Depths that only exceed the stack lengths because a loop is
+  # assumed to be executed once are noted instead.
+  for (stackName,configName,) in (('data_stack','DATA_STACK',),('return_stack','RETURN_STACK',),):
+    stack = assembled['stacks'][stackName];
+    if (stack['minLength'] == None) or (config.Get(stackName) >= stack['minLength']):
+      continue;
+    if config.Get(stackName) < stack['firmMinLength']:
+      print 'WARNING:  %s %d is smaller than the maximum depth of the program, use %s %d' % (configName,config.Get(stackName),configName,stack['length'],);
+    elif not quiet:
+      print 'NOTE:  %s %d may be smaller than the maximum depth of the program, which assumes one pass through the loops at %s (add "; @loop <label> <max> <min>" to tighten)' % (configName,config.Get(stackName),', '.join(['"%s" in "%s"' % (label,name,) for (name,label,) in stack['approximate']]),);
+
+  # Ensure consistent implementation of an interrupt peripheral and an interrupt
+  # handler in the source assembly.
+  if InterruptPeripheralAssigned() and not config.InterruptVector():
+    raise SSBCCException('Interrupt peripheral defined but no .interrupt function defined');
+  if config.InterruptVector() and not InterruptPeripheralAssigned():
+    raise SSBCCException('.interrupt function defined but no interrupt peripheral defined');
+
+  # Ensure all memories are used.
+  for ixMem in range(config.NMemories()):
+    memParam = config.GetMemoryParameters(ixMem);
+    if 'length' not in memParam:
+      raise SSBCCException('Memory "%s" not used in program' % memParam['name']);
+
+  return programBody;
@@ -0,0 +1,223 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Content-hash build cache for ssbcc.
+#
+################################################################################
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from ssbccUtil import SSBCCException
+
+def FileDigest(filename):
+  """
+  Return the SHA-1 digest of the contents of the named file or None if the file
+  cannot be read.
+  """
+  try:
+    fp = open(filename,'rb');
+  except:
+    return None;
+  digest = hashlib.sha1(fp.read()).hexdigest();
+  fp.close();
+  return digest;
+
+class SSBCCcache:
+  """
+  On-disk cache of the files generated by ssbcc.\n
+  Each entry is a directory named by the primary key for the build.  The
+  primary key covers the tool version, the command-line settings, and the
+  contents of the files read while processing the configuration file (the
+  configuration file, ".INCLUDE"d files, and peripheral Python scripts).  The
+  entry records the contents of the remaining files read during the build (the
+  assembly sources including ".include"d files, the macro scripts, and the
+  peripheral HDL) in its "manifest" file.  The entry is only used if all of
+  these files are unchanged.\n
+  The least recently used entries are removed when the size of the cache
+  exceeds its limit.\n
+  Note:  The manifest records the files that were found, so a new file that
+         would be found earlier in the ".include" or macro search paths is not
+         detected.
+  """
+
+  def __init__(self,path,maxSize):
+    """
+    Open or create the cache.
+    path        directory for the cache
+    maxSize     maximum number of bytes for the cache entries
+    """
+    if not os.path.isdir(path):
+      try:
+        os.makedirs(path);
+      except:
+        raise SSBCCException('Cannot create cache directory "%s"' % path);
+    self.path = path;
+    self.maxSize = maxSize;
+
+  def Key(self,settings,filenames):
+    """
+    Compute the primary key for a build.
+    settings    list of strings for the tool version, command-line settings, etc.
+    filenames   list of files whose contents are part of the key
+    """
+    h = hashlib.sha1();
+    for setting in settings:
+      h.update('%s\n' % setting);
+    for filename in filenames:
+      digest = FileDigest(filename);
+      if not digest:
+        raise SSBCCException('Cannot read "%s" for the build cache' % filename);
+      h.update('%s %s\n' % (digest,os.path.abspath(filename),));
+    return h.hexdigest();
+
+  def Restore(self,key):
+    """
+    If the cache entry for the key exists and the files in its manifest are
+    unchanged, then copy its files to their output locations and return True.
+    Otherwise return False.\n
+    The hit and miss statistics are updated.
+    """
+    entry = os.path.join(self.path,key);
+    if not self.IsValid(entry):
+      self.UpdateStats('misses');
+      return False;
+    fp = open(os.path.join(entry,'outputs'),'rt');
+    outputs = [line.rstrip('\n') for line in fp];
+    fp.close();
+    for ix in range(len(outputs)):
+      shutil.copyfile(os.path.join(entry,'out%d' % ix),outputs[ix]);
+    # Mark the entry as recently used.
+    os.utime(entry,None);
+    self.UpdateStats('hits');
+    return True;
+
+  def IsValid(self,entry):
+    """
+    Indicate whether or not the cache entry exists and all of the files listed
+    in its manifest are unchanged.
+    """
+    try:
+      fp = open(os.path.join(entry,'manifest'),'rt');
+    except:
+      return False;
+    manifest = [line.rstrip('\n').split(' ',1) for line in fp];
+    fp.close();
+    for (digest,filename) in manifest:
+      if FileDigest(filename) != digest:
+        return False;
+    return True;
+
+  def Store(self,key,filenames,outputs):
+    """
+    Record the outputs of a build in the cache and then evict the least recently
+    used entries as required.
+    key         primary key computed by Key
+    filenames   list of the files read during the build for the manifest
+    outputs     list of the files generated by the build
+    """
+    tmpEntry = tempfile.mkdtemp(prefix='tmp',dir=self.path);
+    fp = open(os.path.join(tmpEntry,'manifest'),'wt');
+    for filename in sorted(set(os.path.abspath(f) for f in filenames)):
+      fp.write('%s %s\n' % (FileDigest(filename),filename,));
+    fp.close();
+    fp = open(os.path.join(tmpEntry,'outputs'),'wt');
+    for ix in range(len(outputs)):
+      fp.write('%s\n' % outputs[ix]);
+      shutil.copyfile(outputs[ix],os.path.join(tmpEntry,'out%d' % ix));
+    fp.close();
+    # Replace any previous entry for the key.
+    entry = os.path.join(self.path,key);
+    if os.path.isdir(entry):
+      shutil.rmtree(entry,ignore_errors=True);
+    try:
+      os.rename(tmpEntry,entry);
+    except OSError:
+      # Another build stored the same entry first.
+      shutil.rmtree(tmpEntry,ignore_errors=True);
+    self.Evict();
+
+  ##############################################################################
+  #
+  # Eviction and statistics.
+  #
+  ##############################################################################
+
+  def Entries(self):
+    """
+    Return the list of cache entries as (last use time, size, path) tuples,
+    least recently used first.
+    """
+    entries = list();
+    for name in os.listdir(self.path):
+      entry = os.path.join(self.path,name);
+      if (len(name) != 40) or not os.path.isdir(entry):
+        continue;
+      size = sum(os.path.getsize(os.path.join(entry,f)) for f in os.listdir(entry));
+      entries.append((os.path.getmtime(entry),size,entry,));
+    entries.sort();
+    return entries;
+
+  def Evict(self):
+    """
+    Remove the least recently used entries until the cache is within its size
+    limit.
+    """
+    entries = self.Entries();
+    totalSize = sum(entry[1] for entry in entries);
+    nEvicted = 0;
+    while entries and totalSize > self.maxSize:
+      (mtime,size,entry,) = entries.pop(0);
+      shutil.rmtree(entry,ignore_errors=True);
+      totalSize -= size;
+      nEvicted += 1;
+    if nEvicted:
+      self.UpdateStats('evictions',nEvicted);
+
+  def ReadStats(self):
+    """
+    Return the dictionary of hit, miss, and eviction counts.
+    """
+    stats = dict(hits=0, misses=0, evictions=0);
+    try:
+      fp = open(os.path.join(self.path,'stats'),'rt');
+    except:
+      return stats;
+    for line in fp:
+      a = line.split();
+      if (len(a) == 2) and (a[0] in stats):
+        stats[a[0]] = int(a[1]);
+    fp.close();
+    return stats;
+
+  def UpdateStats(self,name,count=1):
+    """
+    Increment the named statistic.
+    """
+    stats = self.ReadStats();
+    stats[name] += count;
+    (fd,tmpName) = tempfile.mkstemp(prefix='tmp',dir=self.path);
+    fp = os.fdopen(fd,'wt');
+    for statName in ('hits','misses','evictions',):
+      fp.write('%s %d\n' % (statName,stats[statName],));
+    fp.close();
+    os.rename(tmpName,os.path.join(self.path,'stats'));
+
+  def Report(self):
+    """
+    Return a printable report of the cache statistics.
+    """
+    stats = self.ReadStats();
+    entries = self.Entries();
+    nLookups = stats['hits'] + stats['misses'];
+    hitRate = 100.0 * stats['hits'] / nLookups if nLookups else 0.0;
+    body = 'Build cache %s\n' % self.path;
+    body += '  hits        %d (%.1f%%)\n' % (stats['hits'],hitRate,);
+    body += '  misses      %d\n' % stats['misses'];
+    body += '  evictions   %d\n' % stats['evictions'];
+    body += '  entries     %d\n' % len(entries);
+    body += '  size        %d of %d bytes' % (sum(entry[1] for entry in entries),self.maxSize,);
+    return body;
@@ -1,6 +1,7 @@
 # Copyright 2012-2015, Sinclair R.F., Inc.
 # Utilities required by ssbcc.
 
+import collections
 import math
 import os
 import re
@@ -9,6 +10,33 @@ import sys
 from ssbccPeripheral import SSBCCinterruptPeripheral
 from ssbccUtil import *
 
+# Blank and comment lines and the leading keyword of configuration commands.
+reBlank = re.compile(r'\s*(#.*)?$');
+reKeyword = re.compile(r'\s*(\.?\w+)');
+
+# Arguments of the configuration commands.
+reArchitecture = re.compile(r'\s*ARCHITECTURE\s+(\S+)\s+(\S+)$');
+reAssembly = re.compile(r'\s*ASSEMBLY\s+(\S.*)');
+reCombine = re.compile(r'\s*COMBINE\s+(\S+)\s*$');
+reConstant = re.compile(r'\s*CONSTANT\s+(C_\w+)\s+(\S+)\s*$');
+reDataStack = re.compile(r'\s*DATA_STACK\s+([1-9]\d*)');
+reEndUserHeader = re.compile(r'\s*END_USER_HEADER\b');
+reIfdef = re.compile(r'\s*\.IFDEF\s+(\w+)\s*$');
+reIfndef = re.compile(r'\s*\.IFNDEF\s+(\w+)\s*$');
+reInclude = re.compile(r'\s*\.INCLUDE\s+(\S+)\s*$');
+reInport = re.compile(r'\s*INPORT\s+(\S+)\s+(\S+)\s+(I_\w+)\s*$');
+reInstruction = re.compile(r'\s*INSTRUCTION\s+([1-9]\d*\*?[1-9]?\d*)\s*$');
+reInvertReset = re.compile(r'\s*INVERT_RESET\s*$');
+reListEntry = re.compile(r'([^,]+)');
+reLocalparam = re.compile(r'\s*LOCALPARAM\s+(L_\w+)\s+(\S+)$');
+reMemory = re.compile(r'\s*MEMORY\s+(RAM|ROM)\s+([A-Za-z]\w*)\s+(\d+)\s*$');
+reOutport = re.compile(r'^\s*OUTPORT\s+(\S+)\s+(\S+)\s+(O_\w+)\s*$');
+reParameter = re.compile(r'\s*PARAMETER\s+(G_\w+)\s+(\S+)$');
+rePeripheral = re.compile(r'\s*PERIPHERAL\s+(\w+)\s*(.*)$');
+rePortcomment = re.compile(r'\s*PORTCOMMENT\s+(.*)');
+reReturnStack = re.compile(r'\s*RETURN_STACK\s+([1-9]\d*)');
+reSramWidth = re.compile(r'\s*SRAM_WIDTH\s+([1-9]\d*)');
+
 class SSBCCconfig():
   """
   Container for ssbcc configuration commands, the associated parsing, and
@@ -20,17 +48,20 @@ class SSBCCconfig():
     Initialize the empty dictionaries holding the processor configuration
     parameters.  Initialize the paths to search for peripherals.
     """
+    self.commands       = list();               # (loc,line) of the processed configuration commands
     self.config         = dict();               # various settings, etc.
     self.constants      = dict();               # CONSTANTs
     self.defines        = dict();               # defines
     self.functions      = dict();               # list of functions to define
+    self.hexfiles       = list();               # $readmemh memory initialization files
     self.inports        = list();               # INPORT definitions
     self.ios            = list();               # List of I/Os
     self.outports       = list();               # OUTPORT definitions (see AddOutport)
     self.parameters     = list();               # PARAMETERs and LOCALPARAMs
     self.peripheral     = list();               # PERIPHERALs
     self.signals        = list();               # internal signals
-    self.symbols        = list();               # constant, I/O, inport, etc.  names
+    self.sourcefiles    = list();               # configuration and peripheral files read
+    self.symbols        = set();                # constant, I/O, inport, etc.  names
 
     # list of memories
     self.memories = dict(name=list(), type=list(), maxLength=list());
@@ -38,6 +69,9 @@ class SSBCCconfig():
     # list of how the memories will be instantiated
     self.config['combine'] = list();
 
+    # lines of the USER_HEADER configuration commands
+    self.config['user_header'] = list();
+
     # initial search path for .INCLUDE configuration commands
     self.includepaths = list();
     self.includepaths.append('.');
@@ -48,6 +82,10 @@ class SSBCCconfig():
     self.peripheralpaths.append('peripherals');
     self.peripheralpaths.append(os.path.join(sys.path[0],'core/peripherals'));
 
+    # index of the peripherals in the search paths (built when the first
+    # peripheral is processed)
+    self.peripheralIndex = None;
+
   def AddConstant(self,name,value,loc):
     """
     Add the constant for the "CONSTANT" configuration command to the "constants"
@@ -177,7 +215,7 @@ class SSBCCconfig():
         raise SSBCCException('Symbol "%s" already defined, no line number provided');
       else:
         raise SSBCCException('Symbol "%s" already defined before %s' % (name,loc,));
-    self.symbols.append(name);
+    self.symbols.add(name);
 
   def AppendIncludePath(self,path):
     """
@@ -187,6 +225,32 @@ class SSBCCconfig():
     """
     self.includepaths.insert(-1,path);
 
+  def CommandTable(self):
+    """
+    Return the table of the configuration commands indexed by their leading
+    keyword.  Each command is processed by the listed method.  The second
+    element is True if the ARCHITECTURE must be defined before the command.
+    """
+    return {
+      'ARCHITECTURE'    : (self.ProcessArchitecture,    False,),
+      'ASSEMBLY'        : (self.ProcessAssembly,        False,),
+      'COMBINE'         : (self.ProcessCombine,         False,),
+      'CONSTANT'        : (self.ProcessConstant,        True, ),
+      'DATA_STACK'      : (self.ProcessDataStack,       False,),
+      'INPORT'          : (self.ProcessInport,          True, ),
+      'INSTRUCTION'     : (self.ProcessInstruction,     False,),
+      'INVERT_RESET'    : (self.ProcessInvertReset,     False,),
+      'LOCALPARAM'      : (self.ProcessLocalparam,      False,),
+      'MEMORY'          : (self.ProcessMemory,          True, ),
+      'OUTPORT'         : (self.ProcessOutport,         True, ),
+      'PARAMETER'       : (self.ProcessParameter,       False,),
+      'PERIPHERAL'      : (self.ProcessPeripheral,      True, ),
+      'PORTCOMMENT'     : (self.ProcessPortcomment,     False,),
+      'RETURN_STACK'    : (self.ProcessReturnStack,     False,),
+      'SRAM_WIDTH'      : (self.ProcessSramWidth,       False,),
+      'USER_HEADER'     : (self.ProcessUserHeader,      False,),
+    };
+
   def CompleteCombines(self):
     """
     Ensure all memories are assigned addresses.\n
@@ -234,6 +298,24 @@ class SSBCCconfig():
     for combined in self.config['combine']:
       self.PackCombinedMemory(combined);
 
+  def DispatchCommand(self,commands,loc,line):
+    """
+    Process the configuration command and record it in the list of processed
+    commands.\n
+    commands    table of configuration commands from CommandTable
+    loc         file name and line number of the command for error messages
+    line        configuration command
+    """
+    a = reKeyword.match(line);
+    keyword = a.group(1) if a else None;
+    if keyword not in commands:
+      raise SSBCCException('Unrecognized configuration command at %s: "%s"' % (loc,line,));
+    (method,needsArchitecture,) = commands[keyword];
+    if needsArchitecture and not self.Exists('architecture'):
+      raise SSBCCException('"%s"s cannot be defined before the "ARCHITECTURE" is defined at %s' % (keyword,loc,));
+    method(loc,line);
+    self.commands.append((loc,line,));
+
   def Exists(self,name):
     """
     Return true if the requested attribute has been created in the ssbccConfig
@@ -329,6 +411,7 @@ class SSBCCconfig():
     path        path to add to the list
     """
     self.peripheralpaths.insert(-1,path);
+    self.peripheralIndex = None;
 
   def InterruptVector(self):
     """
@@ -432,6 +515,20 @@ class SSBCCconfig():
       outlist.append((self.memories['name'][ix],self.memories['maxLength'][ix],));
     return outlist;
 
+  def MemoryPacking(self):
+    """
+    Return a dictionary of where each memory is packed into the HDL memories
+    for the assembler listing.  Each entry has the HDL memory name, the offset
+    of the memory's port within the HDL memory and its ratio, and the lane,
+    ratio, and number of words of the memory (see PackCombinedMemory).\n
+    Note:  This must be called after CompleteCombines.
+    """
+    packings = dict();
+    for name in self.memories['name']:
+      (combined,port,packing,) = self.GetPacking(name);
+      packings[name] = dict(memName=combined['memName'], offset=port['offset'], portRatio=port['ratio'], lane=packing['lane'], ratio=packing['ratio'], nWords=packing['nWords']);
+    return packings;
+
   def NInports(self):
     """
     Return the number of INPORTS.
@@ -619,6 +716,104 @@ class SSBCCconfig():
       combined['port'][1]['offset'] = combined['port'][0]['nWords'];
     combined['nWords'] = sum(port['nWords'] for port in combined['port']);
 
+  def ParseConfigFile(self,fp):
+    """
+    Read and process the configuration commands in the file and in the files it
+    ".INCLUDE"s.\n
+    fp          file object for the configuration file\n
+    The configuration commands are dispatched to their Process* methods through
+    a table indexed by their leading keyword.  The ".IFDEF", ".IFNDEF",
+    ".ELSE", ".ENDIF", and ".INCLUDE" commands are processed even when they are
+    disabled by a conditional.  The enabled commands are recorded in "commands"
+    so that they can be processed again by ProcessCommands.\n
+    Note:  fp is a file handle, so no paths are searched by LoadFile.
+    """
+    conditionals = {
+      '.ELSE'           : self.ProcessElse,
+      '.ENDIF'          : self.ProcessEndif,
+      '.IFDEF'          : self.ProcessIfdef,
+      '.IFNDEF'         : self.ProcessIfndef,
+      '.INCLUDE'        : self.ProcessInclude,
+    };
+    commands = self.CommandTable();
+    # The configuration file and the files it includes are processed from a
+    # stack with their names, their unprocessed lines, and their conditionals.
+    self.parseStack = [dict(filename=fp.name, lines=collections.deque(LoadFile(fp,None)), ifstack=list())];
+    bufLine = '';
+    while self.parseStack:
+      current = self.parseStack[-1];
+      # If the current file has ended, then validate correct file structure and
+      # proceed to the enclosing file.
+      if not current['lines']:
+        if bufLine and len(self.parseStack) == 1:
+          raise SSBCCException('Malformed last line(s): "%s"' % bufLine);
+        if bufLine:
+          raise SSBCCException('Malformed configuration command at the end of %s' % current['filename']);
+        if current['ifstack']:
+          raise SSBCCException('%d unmatched conditional(s) at end of %s' % (len(current['ifstack']),current['filename'],));
+        self.parseStack.pop();
+        continue;
+      # Get the next line to process and its line number.
+      (tmpLine,ixLine,) = current['lines'].popleft();
+      # Use the start line of a sequence of lines for error messages.
+      if not bufLine:
+        loc = '%s:%d' % (current['filename'],ixLine,);
+      # Merge continuation lines.
+      bufLine += tmpLine;
+      if bufLine and bufLine[-1] == '\\':
+        bufLine = bufLine[:-1];
+        continue;
+      line = bufLine;
+      bufLine = '';
+      # Reject blank and comment lines
+      if reBlank.match(line):
+        continue;
+      # Dispatch the command.
+      a = reKeyword.match(line);
+      keyword = a.group(1) if a else None;
+      if keyword in conditionals:
+        conditionals[keyword](loc,line);
+      elif current['ifstack'] and not current['ifstack'][-1]:
+        pass;
+      else:
+        # Append the lines of a USER_HEADER to the command.
+        if keyword == 'USER_HEADER':
+          while True:
+            if not current['lines']:
+              raise SSBCCException('No "END_USER_HEADER" found for "USER_HEADER" at %s' % loc);
+            (tmpLine,ixLine,) = current['lines'].popleft();
+            if reEndUserHeader.match(tmpLine):
+              break;
+            line += '\n' + tmpLine;
+        self.DispatchCommand(commands,loc,line);
+
+  def ProcessArchitecture(self,loc,line):
+    """
+    Process the "ARCHITECTURE" configuration command.
+    """
+    if self.Exists('architecture'):
+      raise SSBCCException('ARCHITECTURE already specified before %s' % loc);
+    cmd = reArchitecture.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed ARCHITECTURE configuration command at %s: "%s"' % (loc,line,));
+    cmd = cmd.groups();
+    self.Set('architecture',cmd[0]);
+    self.Set('hdl',cmd[1]);
+    self.Set('corepath',os.path.join(sys.path[0],self.Get('architecture')));
+    if not os.path.isdir(self.Get('corepath')):
+      raise SSBCCException('Architecture "%s" does not exist at %s' % (cmd,loc,));
+    self.InsertPeripheralPath(os.path.join(self.Get('corepath'),'peripherals'));
+    # TODO -- move these assignments into an object
+    self.Set('data_width',8);
+
+  def ProcessAssembly(self,loc,line):
+    """
+    Process the "ASSEMBLY" configuration command, i.e., the assembly language
+    source files for the processor code.
+    """
+    cmd = reAssembly.findall(line);
+    self.Set('compiler',('asm',cmd[0],));
+
   def ProcessCombine(self,loc,line):
     """
     Parse the "COMBINE" configuration command as follows:\n
@@ -636,7 +831,7 @@ class SSBCCconfig():
     a list of one or more RAMs or ROMs.
     """
     # Perform some syntax checking and get the list of memories to combine.
-    cmd = re.findall(r'\s*COMBINE\s+(\S+)\s*$',line);
+    cmd = reCombine.findall(line);
     if not cmd:
       raise SSBCCException('Malformed COMBINE configuration command on %s' % loc);
     mems = re.split(r',',cmd[0]);
@@ -669,6 +864,90 @@ class SSBCCconfig():
     # Append the listed memory types to the list of combined memories.
     self.config['combine'].append({'mems':mems, 'memArch':'sync', 'loc':loc});
 
+  def ProcessCommands(self,commands):
+    """
+    Process configuration commands recorded by ParseConfigFile, for example to
+    build a variant of a processor with some of its commands replaced.\n
+    commands    list of (loc,line) tuples of the configuration commands\n
+    Note:  The conditionals and ".INCLUDE"s were resolved by ParseConfigFile and
+           the lines of a "USER_HEADER" are part of its command.
+    """
+    table = self.CommandTable();
+    for (loc,line,) in commands:
+      self.DispatchCommand(table,loc,line);
+
+  def ProcessConstant(self,loc,line):
+    """
+    Process the "CONSTANT" configuration command.
+    """
+    cmd = reConstant.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed "CONSTANT" configuration command on %s: "%s"' % (loc,line,));
+    self.AddConstant(cmd.group(1),cmd.group(2),loc);
+
+  def ProcessDataStack(self,loc,line):
+    """
+    Process the "DATA_STACK" configuration command.
+    """
+    if self.Exists('data_stack'):
+      raise SSBCCException('DATA_STACK already defined before %s' % loc);
+    cmd = reDataStack.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed "DATA_STACK" configuration command on %s: "%s"' % (loc,line,));
+    x = int(cmd.group(1));
+    if math.modf(math.log(x,2))[0] != 0:
+      raise SSBCCException('DATA_STACK must be set to a power of 2, not %d, at %s' % (x,loc,));
+    if x < 8:
+      raise SSBCCException('DATA_STACK must be at least 8, not %d, at %s' % (x,loc,));
+    self.Set('data_stack',x);
+
+  def ProcessElse(self,loc,line):
+    """
+    Process the ".ELSE" conditional.
+    """
+    ifstack = self.parseStack[-1]['ifstack'];
+    if not ifstack:
+      raise SSBCCException('unmatched ".ELSE" at %s' % loc);
+    ifstack[-1] = not ifstack[-1];
+
+  def ProcessEndif(self,loc,line):
+    """
+    Process the ".ENDIF" conditional.
+    """
+    ifstack = self.parseStack[-1]['ifstack'];
+    if not ifstack:
+      raise SSBCCException('unmatched ".ENDIF" at %s' % loc);
+    ifstack.pop();
+
+  def ProcessIfdef(self,loc,line):
+    """
+    Process the ".IFDEF" conditional.
+    """
+    cmd = reIfdef.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed ".IFDEF" configuration command on %s' % loc);
+    self.parseStack[-1]['ifstack'].append(self.IsSymbol(cmd.group(1)));
+
+  def ProcessIfndef(self,loc,line):
+    """
+    Process the ".IFNDEF" conditional.
+    """
+    cmd = reIfndef.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed ".IFNDEF" configuration command on %s' % loc);
+    self.parseStack[-1]['ifstack'].append(not self.IsSymbol(cmd.group(1)));
+
+  def ProcessInclude(self,loc,line):
+    """
+    Process the ".INCLUDE" configuration command by pushing the included file
+    onto the stack of files being parsed.
+    """
+    cmd = reInclude.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed ".INCLUDE" configuration command on %s' % loc);
+    filename = cmd.group(1);
+    self.parseStack.append(dict(filename=filename, lines=collections.deque(LoadFile(filename,self)), ifstack=list()));
+
   def ProcessInport(self,loc,line):
     """
     Parse the "INPORT" configuration commands as follows:
@@ -688,11 +967,11 @@ class SSBCCconfig():
       signal width
       signal type
     """
-    cmd = re.findall(r'\s*INPORT\s+(\S+)\s+(\S+)\s+(I_\w+)\s*$',line);
+    cmd = reInport.findall(line);
     if not cmd:
       raise SSBCCException('Malformed INPORT statement at %s: "%s"' % (loc,line[:-1],));
-    modes = re.findall(r'([^,]+)',cmd[0][0]);
-    names = re.findall(r'([^,]+)',cmd[0][1]);
+    modes = reListEntry.findall(cmd[0][0]);
+    names = reListEntry.findall(cmd[0][1]);
     portName = cmd[0][2];
     if len(modes) != len(names):
       raise SSBCCException('Malformed INPORT configuration command -- number of options don\'t match on %s: "%s"' % (loc,line[:-1],));
@@ -722,7 +1001,51 @@ class SSBCCconfig():
         raise SSBCCException('Signal width too wide in "%s"' % line[:-1]);
     self.AddInport(thisPort,loc);
 
-  def ProcessOutport(self,line,loc):
+  def ProcessInstruction(self,loc,line):
+    """
+    Process the "INSTRUCTION" configuration command.
+    """
+    if self.Exists('nInstructions'):
+      raise SSBCCException('INSTRUCTION already specified before %s' % loc);
+    cmd = reInstruction.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed "INSTRUCTION" configuration command at %s: "%s"' % (loc,line,));
+    self.SetMemoryBlock('nInstructions',cmd.group(1),(loc,line,));
+    if self.Get('nInstructions')['length'] > 2**13:
+      raise SSBCCException('Instruction space cannot exceed %d at %s: "%s"' % (2**13,loc,line,));
+
+  def ProcessInvertReset(self,loc,line):
+    """
+    Process the "INVERT_RESET" configuration command.
+    """
+    if not reInvertReset.match(line):
+      raise SSBCCException('Unrecognized configuration command at %s: "%s"' % (loc,line,));
+    if self.Exists('invertReset'):
+      raise SSBCCException('INVERT_RESET already specified before %s' % loc);
+    self.Set('invertReset',True);
+
+  def ProcessLocalparam(self,loc,line):
+    """
+    Process the "LOCALPARAM" configuration command.
+    """
+    cmd = reLocalparam.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed LOCALPARAM configuration command at %s: "%s"' % (loc,line,));
+    self.AddParameter(cmd.group(1),cmd.group(2),loc);
+
+  def ProcessMemory(self,loc,line):
+    """
+    Process the "MEMORY" configuration command.
+    """
+    # TODO -- make the maximum number of memories architecture dependent
+    if self.NMemories() >= 4:
+      raise SSBCCException('Program is limited to 4 memories');
+    cmd = reMemory.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed MEMORY configuration command at %s: "%s"' % (loc,line,));
+    self.AddMemory(cmd.groups(),loc);
+
+  def ProcessOutport(self,loc,line):
     """
     Parse the "OUTPORT" configuration commands as follows:
       The configuration command is well formatted.
@@ -740,11 +1063,11 @@ class SSBCCconfig():
       signal type
       initial value (optional)
     """
-    cmd = re.findall(r'^\s*OUTPORT\s+(\S+)\s+(\S+)\s+(O_\w+)\s*$',line);
+    cmd = reOutport.findall(line);
     if not cmd:
       raise SSBCCException('Malformed OUTPUT configuration command on %s: "%s"' % (loc,line[:-1],));
-    modes = re.findall(r'([^,]+)',cmd[0][0]);
-    names = re.findall(r'([^,]+)',cmd[0][1]);
+    modes = reListEntry.findall(cmd[0][0]);
+    names = reListEntry.findall(cmd[0][1]);
     portName = cmd[0][2];
     if len(modes) != len(names):
       raise SSBCCException('Malformed OUTPORT configuration command -- number of widths/types and signal names don\'t match on %s: "%s"' % (loc,line[:-1],));
@@ -775,48 +1098,54 @@ class SSBCCconfig():
         raise SSBCCException('Signal width too wide on %s:  in "%s"' % (loc,line[:-1],));
     self.AddOutport((portName,isStrobeOnly,)+thisPort,loc);
 
+  def ProcessParameter(self,loc,line):
+    """
+    Process the "PARAMETER" configuration command.
+    """
+    cmd = reParameter.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed PARAMETER configuration command at %s: "%s"' % (loc,line,));
+    self.AddParameter(cmd.group(1),cmd.group(2),loc);
+
   def ProcessPeripheral(self,loc,line):
     """
     Process the "PERIPHERAL" configuration command as follows:
       Validate the format of the configuration command.
-      Find the peripheral in the candidate list of paths for peripherals.
-      Execute the file declaring the peripheral.
-        Note:  This is done since I couldn't find a way to "import" the
-               peripheral.  Executing the peripheral makes its definition local
-               to this invokation of the ProcessPeripheral function, but the
-               object subsequently created retains the required functionality
-               to instantiate the peripheral
+      Find the peripheral in the index of the paths for peripherals.
+      Load the file declaring the peripheral as a module.
+        Note:  The file is only executed for the first instance of the
+               peripheral and the module is reused for the subsequent
+               instances.  The globals of this module are available to the
+               peripheral as they were when the peripheral was loaded with
+               execfile.
       Go through the parameters for the peripheral and do the following for each:
         If the argument for the peripheral is the string "help", then print the
           docstring for the peripheral and exit.
         Append the parameter name and its argument to the list of parameters
           (use "None" as the argument if no argument was provided).
       Append the instantiated peripheral to the list of peripherals.
-        Note:  The "exec" function dynamically executes the instruction to
-               instantiate the peripheral and append it to the list of
-               peripherals.
     """
     # Validate the format of the peripheral configuration command and the the name of the peripheral.
-    cmd = re.findall(r'\s*PERIPHERAL\s+(\w+)\s*(.*)$',line);
+    cmd = rePeripheral.findall(line);
     if not cmd:
       raise SSBCCException('Missing peripheral name in %s:  %s' % (loc,line[:-1],));
     peripheral = cmd[0][0];
-    # Find and execute the peripheral Python script.
-    # Note:  Because "execfile" and "exec" method are used to load the
-    #        peripheral python script, the __file__ object is set to be this
-    #        file, not the peripheral source file.
-    for testPath in self.peripheralpaths:
-      fullperipheral = os.path.join(testPath,'%s.py' % peripheral);
-      if os.path.isfile(fullperipheral):
-        break;
-    else:
+    # Find and load the peripheral Python script.
+    if self.peripheralIndex == None:
+      self.peripheralIndex = ModuleIndex(self.peripheralpaths);
+    if peripheral not in self.peripheralIndex:
       raise SSBCCException('Peripheral "%s" not found' % peripheral);
-    execfile(fullperipheral);
+    fullperipheral = self.peripheralIndex[peripheral];
+    module = LoadModule(fullperipheral,globals());
+    if not hasattr(module,peripheral):
+      raise SSBCCException('Peripheral "%s" not defined in %s' % (peripheral,fullperipheral,));
+    peripheralClass = getattr(module,peripheral);
+    self.sourcefiles.append(fullperipheral);
     # Convert the space delimited parameters to a list of tuples.
     param_list = list();
     for param_string in re.findall(r'(\w+="[^"]*"|\w+=\S+|\w+)\s*',cmd[0][1]):
       if param_string == "help":
-        exec('helpmsg = %s.__doc__' % peripheral);
+        helpmsg = peripheralClass.__doc__;
         if not helpmsg:
           raise SSBCCException('No help for peripheral %s is provided' % fullperipheral);
         print;
@@ -833,7 +1162,44 @@ class SSBCCconfig():
       else:
         param_list.append((param_string,None));
     # Add the peripheral to the micro controller configuration.
-    exec('self.peripheral.append(%s(fullperipheral,self,param_list,loc));' % peripheral);
+    self.peripheral.append(peripheralClass(fullperipheral,self,param_list,loc));
+
+  def ProcessPortcomment(self,loc,line):
+    """
+    Process the "PORTCOMMENT" configuration command.
+    """
+    cmd = rePortcomment.findall(line);
+    self.AddIO(cmd[0],0,'comment',loc);
+
+  def ProcessReturnStack(self,loc,line):
+    """
+    Process the "RETURN_STACK" configuration command.
+    """
+    if self.Exists('return_stack'):
+      raise SSBCCException('RETURN_STACK already specified before %s' % loc);
+    cmd = reReturnStack.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed "RETURN_STACK" configuration command at %s: "%s"' % (loc,line,));
+    self.Set('return_stack',int(cmd.group(1)));
+
+  def ProcessSramWidth(self,loc,line):
+    """
+    Process the "SRAM_WIDTH" configuration command.
+    """
+    if self.Exists('sram_width'):
+      raise SSBCCException('SRAM_WIDTH already specified before %s' % loc);
+    cmd = reSramWidth.match(line);
+    if not cmd:
+      raise SSBCCException('Malformed "SRAM_WIDTH" configuration command %s: "%s"' % (loc,line,));
+    self.Set('sram_width',int(cmd.group(1)));
+
+  def ProcessUserHeader(self,loc,line):
+    """
+    Process the "USER_HEADER" configuration command, i.e., append the lines
+    following the command up to the "END_USER_HEADER" line to the user header.\n
+    Note:  ParseConfigFile appends these lines to the command.
+    """
+    self.config['user_header'] += line.split('\n')[1:];
 
   def Set(self,name,value):
     """
@@ -9,7 +9,7 @@ import ssbccUtil
 def genVhdlPkg(config):
   """
   Method to generate a VHDL Package file corresponding to the instantiated micro
-  controller.
+  controller.  Return the name of the package file.
   """
   coreName = config.Get('outCoreName');
   packageName = '%s_pkg' % coreName;
@@ -70,3 +70,4 @@ def genVhdlPkg(config):
   fp.write('end component %s;\n' % coreName);
   fp.write('end package;\n');
   fp.close();
+  return packageFileName;
@@ -14,13 +14,13 @@ from ssbccUtil import SSBCCException
 class SSBCCperipheral:
   """Base class for peripherals"""
 
+  # HDL and assembly files read by LoadCore (used by the build cache).
+  loadedFiles = list();
+
   def __init__(self,peripheralFile,config,param_list,loc):
     """
     Prototype constructor.
     peripheralFile      the full path name of the peripheral source
-                        Note:  "__file__" doesn't work because 'execfile" and
-                        "exec" are used to load the python script for the
-                        peripheral.
     config              the ssbccConfig object for the processor core
     param_list          parameter list for the processor
     loc                 file name and line number for error messages
@@ -118,6 +118,7 @@ class SSBCCperipheral:
     fp = open(hdlName,'rt');
     body = fp.read();
     fp.close();
+    SSBCCperipheral.loadedFiles.append(hdlName);
     return body;
 
   ##############################################################################
@@ -0,0 +1,319 @@
+################################################################################
+#
+# Copyright 2015, Sinclair R.F., Inc.
+#
+# Build many variants of a processor from one configuration file.
+#
+# The configuration file is read once and the commands it enables are recorded.
+# Each variant replaces, adds, or removes some of these commands, for example to
+# change the stack and memory sizes or the COMBINE commands, and its outputs are
+# written to its own directory.  Variants whose program is assembled from the
+# same symbols, memory lengths, and stack lengths share one run of the
+# assembler, and the variants are built on a pool of processes.
+#
+# For example, the following builds a processor with three data stack sizes,
+# each with and without a combined data stack and return stack:
+#
+#   sweep = SSBCCsweep('uc.9x8');
+#   variants = Product([
+#     [['DATA_STACK 16'],['DATA_STACK 32'],['DATA_STACK 64']],
+#     [[],['COMBINE RETURN_STACK,DATA_STACK']],
+#   ]);
+#   results = sweep.Build(variants,'sweep',jobs=4);
+#
+# As for ssbcc, sys.path[0] must be the directory with the ssbcc scripts.
+#
+################################################################################
+
+import copy
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from ssbccBuild import AssembleProgram, AssemblerInputs, CompleteConfig, GenerateCore, RecordProgram
+from ssbccConfig import SSBCCconfig
+from ssbccPeripheral import SSBCCinterruptPeripheral
+from ssbccUtil import SSBCCException
+
+# Configuration commands that can occur more than once and that are appended by
+# an override rather than replacing the existing command.
+additiveCommands = ('COMBINE','PERIPHERAL','PORTCOMMENT','USER_HEADER',);
+
+# Sweep being built by the pool of processes (see BuildChunk).
+activeSweep = None;
+
+def BuildChunk(chunk):
+  """
+  Build the listed variants of the active sweep and return their results.\n
+  Note:  This is the function run by the pool of processes, which inherit the
+         active sweep when they are forked.
+  """
+  return activeSweep.BuildVariants(chunk);
+
+def CommandKey(line):
+  """
+  Return the keyword and, for configuration commands that define a named
+  constant, parameter, memory, port, or peripheral, the name that identify the
+  command for overrides.
+  """
+  tokens = line.split();
+  keyword = tokens[0] if tokens else None;
+  name = None;
+  if keyword in ('CONSTANT','LOCALPARAM','PARAMETER','PERIPHERAL',) and len(tokens) > 1:
+    name = tokens[1];
+  elif keyword == 'MEMORY' and len(tokens) > 2:
+    name = tokens[2];
+  elif keyword in ('INPORT','OUTPORT',) and len(tokens) > 1:
+    name = tokens[-1];
+  return (keyword,name,);
+
+def Product(axes):
+  """
+  Return the variants for every combination of the alternatives on the axes.\n
+  axes          list of the axes of the sweep, each of which is a list of the
+                alternative lists of overrides\n
+  The return is a list of (name,overrides) tuples where the name is the index
+  of the variant.
+  """
+  combinations = list(itertools.product(*axes));
+  width = len(str(len(combinations)-1));
+  return [('%0*d' % (width,ix,),sum((list(overrides) for overrides in combination),list()),) for (ix,combination,) in enumerate(combinations)];
+
+class SSBCCsweep:
+  """
+  Variants of the processor defined by a configuration file.\n
+  Each variant is described by a list of overrides.  An override is either a
+  configuration command or a "-" followed by the keyword and optionally the
+  name of the configuration commands to remove, for example:
+    DATA_STACK 64               replaces the DATA_STACK command
+    MEMORY RAM ram_a 128        replaces the MEMORY command for ram_a
+    CONSTANT C_BAUD 9600        replaces the CONSTANT command for C_BAUD
+    COMBINE ram_a,ram_b         is added to the COMBINE commands
+    -COMBINE                    removes all of the COMBINE commands
+    -PERIPHERAL trace           removes the trace peripherals
+  Commands that do not replace an existing command are added after the commands
+  of the configuration file.
+  """
+
+  def __init__(self,filename,
+               assemblerOptions=None,
+               defines=None,
+               displayOpcode=False,
+               includePaths=None,
+               macroPaths=None,
+               parameters=None,
+               peripherals=None,
+               settings=None,
+               writeSim=False):
+    """
+    Read the configuration file and record the commands it enables.\n
+    filename          name of the configuration file
+    assemblerOptions  optional dictionary of additional arguments for
+                      asmAssemble.Assemble, e.g., inline, optimize, and outline
+    defines           list of the "D_" symbols defined for the configuration
+                      file and the program (as per the ssbcc "-D" option)
+    displayOpcode     if True, add the 3-letter decode of the opcode
+    includePaths      list of the directories to search for ".INCLUDE"d files,
+                      peripherals, and ".include"d assembly files
+    macroPaths        list of the directories to search for user macros
+    parameters        list of (name,value) tuples to override parameter and
+                      localparam values (as per the ssbcc "-G" option)
+    peripherals       list of peripherals to add (as per the ssbcc "-P" option)
+    settings          optional dictionary of the configuration settings, i.e.,
+                      define_clog2, rand_instr_mem, readmemh, synth_instr_mem,
+                      and verilator_tracing_on
+    writeSim          if True, also write the instruction-set simulator image
+    """
+    self.filename = filename;
+    self.defines = list(defines or list());
+    self.displayOpcode = displayOpcode;
+    self.includePaths = [os.path.abspath(path) for path in includePaths or list()];
+    self.parameters = list(parameters or list());
+    self.peripherals = list(peripherals or list());
+    self.settings = dict(define_clog2=False, rand_instr_mem=False, readmemh=False, synth_instr_mem=None, verilator_tracing_on=False);
+    self.settings.update(settings or dict());
+    self.writeSim = writeSim;
+    for path in self.includePaths:
+      if not os.path.isdir(path):
+        raise SSBCCException('Bad path string:  "%s"' % path);
+    self.assemblerOptions = dict(
+      libraryPaths=[os.path.join(sys.path[0],'lib','9x8')] + self.includePaths,
+      macroPaths=[os.path.abspath(path) for path in macroPaths or list()] + [os.path.join(sys.path[0],'macros','9x8')],
+    );
+    self.assemblerOptions.update(assemblerOptions or dict());
+    # Read the configuration file and validate the unmodified configuration.
+    config = self.NewConfig();
+    config.ParseConfigFile(open(filename,'r'));
+    self.commands = config.commands;
+    self.keywords = config.CommandTable().keys();
+    self.Config(list());
+
+  def ApplyOverrides(self,overrides):
+    """
+    Return the configuration commands with the overrides applied.
+    """
+    commands = list(self.commands);
+    for override in overrides:
+      override = override.strip();
+      remove = override.startswith('-');
+      if remove:
+        # "-keyword [name]"
+        tokens = override[1:].split();
+        (keyword,name,) = (tokens[0] if tokens else None,tokens[1] if len(tokens) > 1 else None,);
+      else:
+        (keyword,name,) = CommandKey(override);
+      if keyword not in self.keywords:
+        raise SSBCCException('Unrecognized configuration command in override "%s"' % override);
+      matches = [ix for (ix,command,) in enumerate(commands) if CommandKey(command[1])[0] == keyword and (CommandKey(command[1])[1] == name or (remove and not name))];
+      if remove:
+        if not matches:
+          raise SSBCCException('No configuration command to remove for override "%s"' % override);
+        commands = [command for (ix,command,) in enumerate(commands) if ix not in matches];
+      elif matches and keyword not in additiveCommands:
+        commands[matches[0]] = ('override',override,);
+        commands = [command for (ix,command,) in enumerate(commands) if ix not in matches[1:]];
+      else:
+        commands.append(('override',override,));
+    return commands;
+
+  def Build(self,variants,outdir,jobs=1):
+    """
+    Build the variants of the processor and return their results.\n
+    variants    list of (name,overrides) tuples, where the name is the
+                directory for the outputs of the variant within outdir
+    outdir      directory for the outputs of the variants
+    jobs        number of variants built at once\n
+    The return is a list with a dictionary for each variant with the following
+    content:
+      name          name of the variant
+      overrides     list of the overrides for the variant
+      directory     directory for the outputs of the variant
+      status        "built" or "failed"
+      message       error message for a failed variant
+      reused        True if the program was assembled for another variant
+      seconds       elapsed time to build the variant
+      outputs       names of the output files (see ssbccBuild.GenerateCore)\n
+    The variants are grouped by the inputs to the assembler.  Each group is
+    divided into at most jobs chunks whose variants share one run of the
+    assembler.
+    """
+    global activeSweep;
+    self.variants = [dict(name=name, overrides=list(overrides), directory=os.path.join(outdir,name)) for (name,overrides,) in variants];
+    results = dict();
+    groups = dict();
+    for (ix,variant,) in enumerate(self.variants):
+      try:
+        config = self.Config(variant['overrides']);
+        # Generate the peripheral libraries here rather than in the pool of
+        # processes, which would write the files at the same time.
+        for p in config.peripheral:
+          p.GenAssembly(config);
+        groups.setdefault(self.ProgramKey(config),list()).append(ix);
+      except SSBCCException, msg:
+        results[ix] = dict(variant, status='failed', message=str(msg), reused=False, seconds=0., outputs=None);
+    chunkSize = int(math.ceil(float(len(self.variants))/max(jobs,1)));
+    chunks = list();
+    for group in sorted(groups.values()):
+      chunks += [group[ix:ix+chunkSize] for ix in range(0,len(group),chunkSize)];
+    activeSweep = self;
+    if jobs > 1 and len(chunks) > 1:
+      pool = multiprocessing.Pool(min(jobs,len(chunks)));
+      chunkResults = pool.map(BuildChunk,chunks);
+      pool.close();
+      pool.join();
+    else:
+      chunkResults = [BuildChunk(chunk) for chunk in chunks];
+    activeSweep = None;
+    for (chunk,chunkResult,) in zip(chunks,chunkResults):
+      results.update(zip(chunk,chunkResult));
+    return [results[ix] for ix in range(len(self.variants))];
+
+  def BuildVariants(self,chunk):
+    """
+    Build the listed variants, which have the same inputs to the assembler, and
+    return their results (see Build).
+    """
+    results = list();
+    assembled = None;
+    for ix in chunk:
+      variant = self.variants[ix];
+      result = dict(variant, status='failed', message=None, reused=assembled is not None, seconds=None, outputs=None);
+      tStart = time.time();
+      try:
+        config = self.Config(variant['overrides']);
+        if assembled is None:
+          assembled = AssembleProgram(config,**self.assemblerOptions);
+        programBody = RecordProgram(config,dict(assembled,memories=copy.deepcopy(assembled['memories']),program=copy.deepcopy(assembled['program'])),self.filename);
+        if not os.path.isdir(variant['directory']):
+          os.makedirs(variant['directory']);
+        cwd = os.getcwd();
+        os.chdir(variant['directory']);
+        try:
+          result['outputs'] = GenerateCore(config,programBody,writeSim=self.writeSim);
+        finally:
+          os.chdir(cwd);
+        result['status'] = 'built';
+      except SSBCCException, msg:
+        result['message'] = str(msg);
+      result['seconds'] = time.time() - tStart;
+      results.append(result);
+    return results;
+
+  def Config(self,overrides):
+    """
+    Return the configuration of the variant with the overrides applied to the
+    commands of the configuration file.
+    """
+    config = self.NewConfig();
+    # Only one interrupt peripheral is allowed per processor and the previous
+    # variant's is recorded in the class.
+    SSBCCinterruptPeripheral.instance = None;
+    config.ProcessCommands(self.ApplyOverrides(overrides));
+    for (name,value,) in self.parameters:
+      config.OverrideParameter(name,value);
+    for peripheral in self.peripherals:
+      config.ProcessPeripheral(-1,'PERIPHERAL '+peripheral);
+    CompleteConfig(config);
+    if not config.Exists('compiler'):
+      raise SSBCCException('ASSEMBLY configuration command is missing');
+    return config;
+
+  def NewConfig(self):
+    """
+    Return an empty configuration with the settings of the sweep.\n
+    Note:  The peripheral search paths are absolute so that the peripherals'
+           HDL can be read while the outputs are written in the directory of
+           the variant.
+    """
+    config = SSBCCconfig();
+    for (name,value,) in self.settings.iteritems():
+      config.Set(name,value);
+    if self.displayOpcode:
+      config.functions['display_opcode'] = True;
+    for name in self.defines:
+      if not re.match('D_',name):
+        raise SSBCCException('Define "%s" should start with "D_"' % name);
+      config.AddDefine(name);
+    for path in self.includePaths:
+      config.AppendIncludePath(path);
+      config.InsertPeripheralPath(path);
+    config.peripheralpaths = [os.path.abspath(path) for path in config.peripheralpaths];
+    config.Set('outCoreName',os.path.splitext(os.path.basename(self.filename))[0]);
+    return config;
+
+  def ProgramKey(self,config):
+    """
+    Return the key of the inputs to the assembler that change the program, i.e.,
+    excluding the instruction memory size and memory packing that are only used
+    for the listing.
+    """
+    inputs = AssemblerInputs(config);
+    del inputs['instructionLength'];
+    del inputs['memoryPacking'];
+    if not self.assemblerOptions.get('inline'):
+      del inputs['inlineBudget'];
+    return repr(sorted(inputs.items()));
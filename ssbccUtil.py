@@ -6,6 +6,7 @@
 #
 ################################################################################
 
+import imp
 import math
 import os
 import re
@@ -31,6 +32,9 @@ class SSBCCException(Exception):
 #
 ################################################################################
 
+# Modules loaded by LoadModule indexed by their absolute file names.
+loadedModules = dict();
+
 def CeilLog2(v):
   """
   Return the smallest integer that has a power of 2 greater than or equal to
@@ -151,7 +155,9 @@ def LoadFile(filename,config):
   """
   Load the file into a list with the line contents and line numbers.\n
   filename is either the name of the file or a file object.\n
-  Note:  The file object is closed in either case.
+  Note:  The file object is closed in either case.\n
+  Note:  Files found in the include paths are added to the configuration's list
+         of source files.
   """
   if type(filename) == str:
     for path in config.includepaths:
@@ -161,6 +167,7 @@ def LoadFile(filename,config):
           fp = file(fullfilename);
         except:
           raise SSBCCException('Error opening "%s"' % filename);
+        config.sourcefiles.append(fullfilename);
         break;
     else:
       raise SSBCCException('.INCLUDE file "%s" not found' % filename);
@@ -178,6 +185,47 @@ def LoadFile(filename,config):
   fp.close();
   return v;
 
+def LoadModule(fullname,namespace):
+  """
+  Load the Python source file, e.g., a peripheral, as a module and return the
+  module.  Each file is only executed once and the module is reused for
+  subsequent loads.\n
+  fullname      name of the Python source file
+  namespace     dictionary of the names available to the file in addition to
+                the ones it defines and imports, i.e., the globals of the module
+                that used to execfile it\n
+  Note:  The module is not added to sys.modules, so peripherals can have the
+         same names as standard modules.
+  """
+  fullname = os.path.abspath(fullname);
+  if fullname not in loadedModules:
+    name = os.path.splitext(os.path.basename(fullname))[0];
+    module = imp.new_module(name);
+    module.__dict__.update(namespace);
+    module.__name__ = name;
+    module.__file__ = fullname;
+    with open(fullname,'r') as fp:
+      code = compile(fp.read(),fullname,'exec');
+    exec code in module.__dict__;
+    loadedModules[fullname] = module;
+  return loadedModules[fullname];
+
+def ModuleIndex(paths):
+  """
+  Return a dictionary of the Python source files in the list of directories
+  indexed by their names without the ".py" extension.  The file in the first
+  directory is used when more than one directory has a file with the same name.
+  """
+  index = dict();
+  for path in paths:
+    if not os.path.isdir(path):
+      continue;
+    for name in os.listdir(path):
+      fullname = os.path.join(path,name);
+      if name.endswith('.py') and (name[:-3] not in index) and os.path.isfile(fullname):
+        index[name[:-3]] = fullname;
+  return index;
+
 def ParseIntExpr(value):
   """
   Convert a string containing well-formatted integer or multiplication of two
@@ -192,6 +240,61 @@ def ParseIntExpr(value):
     raise Exception('Program Bug -- shouldn\'t call with a badly formatted integer expression');
   return eval(re.sub('_','',value));
 
+def UpdateMemoryInitialization(outName,newCore,initRange):
+  """
+  Replace the memory initialization in the existing core with that of the newly
+  generated core.\n
+  outName       name of the existing core
+  newCore       body of the newly generated core
+  initRange     start and end positions of the memory initialization in newCore\n
+  Everything in the existing core other than the memory initialization must be
+  identical to the new core.  Otherwise the memory layout or the logic has
+  changed and the exception explains the first difference.\n
+  Note:  The existing core is not rewritten if it is unchanged.
+  """
+  try:
+    fp = open(outName,'rt');
+    oldCore = fp.read();
+    fp.close();
+  except:
+    raise SSBCCException('Program-only rebuild requires an existing "%s"' % outName);
+  prefix = newCore[:initRange[0]];
+  suffix = newCore[initRange[1]:];
+  if oldCore.startswith(prefix) and oldCore.endswith(suffix) and (len(prefix)+len(suffix) <= len(oldCore)):
+    if oldCore != newCore:
+      fp = open(outName,'wt');
+      fp.write(newCore);
+      fp.close();
+    return;
+  # Find the first difference before or after the memory initialization.
+  oldLines = oldCore.split('\n');
+  newLines = newCore.split('\n');
+  (ixOld,ixNew) = (None,None);
+  for ix in range(prefix.count('\n')):
+    if (ix >= len(oldLines)) or (oldLines[ix] != newLines[ix]):
+      (ixOld,ixNew) = (ix,ix);
+      break;
+  else:
+    for ix in range(1,suffix.count('\n')+2):
+      if (ix > len(oldLines)) or (oldLines[-ix] != newLines[-ix]):
+        (ixOld,ixNew) = (len(oldLines)-ix,len(newLines)-ix);
+        break;
+  if ixNew == None:
+    raise SSBCCException('Program-only rebuild of "%s" refused:  the memory initialization could not be located in the existing core' % outName);
+  oldLine = oldLines[ixOld] if 0 <= ixOld < len(oldLines) else '';
+  newLine = newLines[ixNew];
+  # Identify the nature of the change.
+  lines = oldLine + '\n' + newLine;
+  if re.search(r's_opcodeMemory',lines):
+    reason = 'the instruction memory blocks changed';
+  elif re.search(r'\breg\s+[[]\d+:0]\s+\w+[[]\d+:0];',lines):
+    reason = 'the memory declarations changed (memory sizes, widths, or COMBINE packing)';
+  elif re.search(r's_opcode\[0\+:2\]',lines):
+    reason = 'the memory bank assignments changed';
+  else:
+    reason = 'the processor logic changed';
+  raise SSBCCException('Program-only rebuild of "%s" refused because %s:\n  old line %d:  %s\n  new line %d:  %s\nRebuild without "--program-only" to regenerate the processor' % (outName,reason,ixOld+1,oldLine.strip(),ixNew+1,newLine.strip(),));
+
 ################################################################################
 #
 # Unit test.